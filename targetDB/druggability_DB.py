@@ -6,14 +6,16 @@ import sys
 import os
 import time
 import sqlite3
-import urllib.request as urllib
-import requests
 import re
+import io
 import json
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
 from urllib.error import *
 
 import pandas as pd
-from Bio import ExPASy, Entrez, Medline
+from Bio import Entrez, Medline
 from Bio import pairwise2
 from Bio.Blast import NCBIXML
 from Bio.Seq import Seq
@@ -23,33 +25,53 @@ from pathlib import Path
 
 import drugg_errors
 from protein_atlas_api import proteinatlas as patlas
+from utils import build_context as bctx
 from utils import config as cf, pocket_finder as pocket
+from utils import descriptor_cache as dcache
+from utils import pdb_download as pdl
 from utils import pdb_parser
+from utils import pdb_store as pstore
 from utils import retryers as ret
 from utils import gene2id as g2id
+from utils import http_cache as hcache
+from utils import ligand_selectivity as lsel
+from utils import sqlite_pool as sqlp
+from utils import stage_graph as sg
 from utils import targetDB_init as tinit
+from utils import swissprot_index as spidx
 from utils import uniprot_parse
 
+UNIPROT_URL = "https://rest.uniprot.org/uniprotkb/%s.txt"
+HUMANMINE_URL = "https://www.humanmine.org/humanmine/service"
+# Number of genes per batch of HumanMine queries of a multi-target build
+HUMANMINE_BATCH_SIZE = 200
+
 
 def get_list_entries(target_db_path=None):
-    connector = sqlite3.connect(target_db_path)
+    connector = sqlp.connect(target_db_path)
     query = "SELECT Target_id,Gene_name FROM Targets"
     entries_list = pd.read_sql(query, con=connector, index_col="Target_id")
-    connector.close()
     return entries_list
 
 
-@ret.retryer(max_retries=10, timeout=10)
 def get_uniprot(gene_id):
+    swissprot = bctx.current().swissprot
+    if swissprot is not None:
+        # Entries missing from the local file (e.g. TrEMBL) are fetched from UniProt
+        record = swissprot.get(gene_id)
+        if record is not None:
+            return record
+    return get_uniprot_online(gene_id)
+
+
+@ret.retryer(max_retries=10, timeout=10)
+def get_uniprot_online(gene_id):
+    response = hcache.get(UNIPROT_URL % gene_id, "uniprot")
+    if response.status_code in (400, 404, 410):
+        return None
+    response.raise_for_status()
     try:
-        handle = ExPASy.get_sprot_raw(gene_id)
-    except:
-        try:
-            handle = ExPASy.get_sprot_raw(gene_id)
-        except:
-            return None
-    try:
-        record = uniprot_parse.read(handle)
+        record = uniprot_parse.read(io.StringIO(response.text))
     except ValueError:
         record = None
         return record
@@ -117,27 +139,22 @@ def get_crossref_pdb_go_chembl(record):
     return PDB_list, go, chembl_id
 
 
-@ret.retryer(max_retries=20, timeout=30)
-def get_humanmine_data(gene):
-    service = Service("https://www.humanmine.org/humanmine/service")
-    disease = []
-    phenotypes = []
-    differential_exp_tissues = []
-    differential_exp_diseases = []
-    gwas = []
-    pathways = []
+class HumanMineService(Service):
+    """InterMine service whose requests go through the HTTP response cache."""
 
-    query = service.new_query("Gene")
-    query.add_view("symbol", "id")
-    query.add_constraint("Gene", "LOOKUP", gene, code="A")
-    query.add_constraint("organism.species", "=", "sapiens", code="B")
+    @property
+    def opener(self):
+        return self._opener
 
-    if query.count() == 1:
-        primary_id = list(query.rows())[0]["id"]
-    else:
-        pathways_df = pd.DataFrame(columns=["pathway_dataset", "pathway_name"])
-        disease_df = pd.DataFrame(columns=["disease", "disease_id"])
-        phenotypes_df = pd.DataFrame(
+    @opener.setter
+    def opener(self, opener):
+        self._opener = hcache.CachedOpener(opener, "humanmine")
+
+
+def _humanmine_empty_frames():
+    return (
+        pd.DataFrame(columns=["disease", "disease_id"]),
+        pd.DataFrame(
             columns=[
                 "gene",
                 "organism",
@@ -149,14 +166,12 @@ def get_humanmine_data(gene):
                 "Allele_symbol",
                 "Allele_type",
             ]
-        )
-        differential_exp_diseases_df = pd.DataFrame(
+        ),
+        pd.DataFrame(
             columns=["Condition", "T_statistic", "expression_status", "p_value"]
-        )
-        differential_exp_tissues_df = pd.DataFrame(
-            columns=["T_statistic", "Tissue", "expression_status", "p_value"]
-        )
-        gwas_df = pd.DataFrame(
+        ),
+        pd.DataFrame(columns=["T_statistic", "Tissue", "expression_status", "p_value"]),
+        pd.DataFrame(
             columns=[
                 "doi",
                 "first_author",
@@ -166,34 +181,56 @@ def get_humanmine_data(gene):
                 "publication_year",
                 "pubmed_id",
             ]
-        )
-        return (
-            disease_df,
-            phenotypes_df,
-            differential_exp_diseases_df,
-            differential_exp_tissues_df,
-            gwas_df,
-            pathways_df,
-        )
+        ),
+        pd.DataFrame(columns=["pathway_dataset", "pathway_name"]),
+    )
+
+
+def _humanmine_lookup(service, gene):
+    """HumanMine id of a gene (None unless the LOOKUP matches a single gene)."""
+    query = service.new_query("Gene")
+    query.add_view("symbol", "id")
+    query.add_constraint("Gene", "LOOKUP", gene, code="A")
+    query.add_constraint("organism.species", "=", "sapiens", code="B")
+    if query.count() == 1:
+        return list(query.rows())[0]["id"]
+    return None
+
+
+def _humanmine_frames(service, primary_ids):
+    """Disease, phenotype, expression, GWAS and pathway data of HumanMine genes.
+
+    One query per data type for all the genes; returns the tuple of DataFrames
+    of every id (same shapes as get_humanmine_data).
+    """
+    primary_ids = [str(primary_id) for primary_id in primary_ids]
+    data = {
+        primary_id: {
+            "disease": [],
+            "phenotypes": [],
+            "differential_exp_diseases": [],
+            "differential_exp_tissues": [],
+            "gwas": [],
+            "pathways": [],
+        }
+        for primary_id in primary_ids
+    }
 
     query = service.new_query("Gene")
-    query.add_view("diseases.primaryIdentifier", "diseases.name")
-    query.add_constraint("id", "=", primary_id, code="A")
+    query.add_view("id", "diseases.primaryIdentifier", "diseases.name")
+    query.add_constraint("id", "ONE OF", primary_ids, code="A")
 
     for row in query.rows():
-        disease.append(
+        data[str(row["id"])]["disease"].append(
             {
                 "disease": row["diseases.name"],
                 "disease_id": row["diseases.primaryIdentifier"],
             }
         )
 
-    disease_df = pd.DataFrame.from_records(disease)
-    if disease_df.empty:
-        disease_df = pd.DataFrame(columns=["disease", "disease_id"])
-
     query = service.new_query("Gene")
     query.add_view(
+        "id",
         "symbol",
         "homologues.homologue.organism.shortName",
         "homologues.homologue.alleles.symbol",
@@ -204,9 +241,9 @@ def get_humanmine_data(gene):
         "homologues.homologue.alleles.genotypes.zygosity",
         "homologues.homologue.alleles.type",
     )
-    query.add_constraint("id", "=", primary_id, code="A")
+    query.add_constraint("id", "ONE OF", primary_ids, code="A")
     for row in query.rows():
-        phenotypes.append(
+        data[str(row["id"])]["phenotypes"].append(
             {
                 "gene": row["symbol"],
                 "organism": row["homologues.homologue.organism.shortName"],
@@ -223,36 +260,22 @@ def get_humanmine_data(gene):
                 "Allele_type": row["homologues.homologue.alleles.type"],
             }
         )
-    phenotypes_df = pd.DataFrame.from_records(phenotypes)
-    if phenotypes_df.empty:
-        phenotypes_df = pd.DataFrame(
-            columns=[
-                "gene",
-                "organism",
-                "Allele_id",
-                "Phenotype",
-                "Phenotype_desc",
-                "genotype",
-                "zygosity",
-                "Allele_symbol",
-                "Allele_type",
-            ]
-        )
 
     query = service.new_query("Gene")
     query.add_view(
+        "id",
         "atlasExpression.tStatistic",
         "atlasExpression.condition",
         "atlasExpression.pValue",
         "atlasExpression.type",
         "atlasExpression.expression",
     )
-    query.add_constraint("id", "=", primary_id, code="A")
+    query.add_constraint("id", "ONE OF", primary_ids, code="A")
     query.add_constraint("atlasExpression.type", "!=", "FPKM value", code="B")
     query.add_constraint("atlasExpression.expression", "!=", "NONDE", code="C")
     for row in query.rows():
         if row["atlasExpression.type"] == "disease_state":
-            differential_exp_diseases.append(
+            data[str(row["id"])]["differential_exp_diseases"].append(
                 {
                     "T_statistic": row["atlasExpression.tStatistic"],
                     "Condition": row["atlasExpression.condition"],
@@ -261,7 +284,7 @@ def get_humanmine_data(gene):
                 }
             )
         elif row["atlasExpression.type"] == "organism_part":
-            differential_exp_tissues.append(
+            data[str(row["id"])]["differential_exp_tissues"].append(
                 {
                     "T_statistic": row["atlasExpression.tStatistic"],
                     "Tissue": row["atlasExpression.condition"],
@@ -271,19 +294,10 @@ def get_humanmine_data(gene):
             )
         else:
             continue
-    differential_exp_diseases_df = pd.DataFrame.from_records(differential_exp_diseases)
-    if differential_exp_diseases_df.empty:
-        differential_exp_diseases_df = pd.DataFrame(
-            columns=["Condition", "T_statistic", "expression_status", "p_value"]
-        )
-    differential_exp_tissues_df = pd.DataFrame.from_records(differential_exp_tissues)
-    if differential_exp_tissues_df.empty:
-        differential_exp_tissues_df = pd.DataFrame(
-            columns=["T_statistic", "Tissue", "expression_status", "p_value"]
-        )
 
     query = service.new_query("GWAS")
     query.add_view(
+        "results.associatedGenes.id",
         "results.pValue",
         "results.phenotype",
         "firstAuthor",
@@ -293,9 +307,9 @@ def get_humanmine_data(gene):
         "publication.doi",
     )
     query.add_sort_order("GWAS.publication.year", "DESC")
-    query.add_constraint("results.associatedGenes.id", "=", primary_id, code="A")
+    query.add_constraint("results.associatedGenes.id", "ONE OF", primary_ids, code="A")
     for row in query.rows():
-        gwas.append(
+        data[str(row["results.associatedGenes.id"])]["gwas"].append(
             {
                 "p_value": row["results.pValue"],
                 "phenotype": row["results.phenotype"],
@@ -307,49 +321,100 @@ def get_humanmine_data(gene):
             }
         )
 
-    gwas_df = pd.DataFrame.from_records(gwas)
-    if gwas_df.empty:
-        gwas_df = pd.DataFrame(
-            columns=[
-                "doi",
-                "first_author",
-                "organism",
-                "p_value",
-                "phenotype",
-                "publication_year",
-                "pubmed_id",
-            ]
-        )
-
     query = service.new_query("Gene")
-    query.add_view("pathways.name", "pathways.dataSets.name")
-    query.add_constraint("id", "=", primary_id, code="A")
+    query.add_view("id", "pathways.name", "pathways.dataSets.name")
+    query.add_constraint("id", "ONE OF", primary_ids, code="A")
     query.add_constraint("organism.name", "=", "Homo sapiens", code="B")
 
     for row in query.rows():
-        pathways.append(
+        data[str(row["id"])]["pathways"].append(
             {
                 "pathway_name": row["pathways.name"],
                 "pathway_dataset": row["pathways.dataSets.name"],
             }
         )
 
-    pathways_df = pd.DataFrame.from_records(pathways)
-    if pathways_df.empty:
-        pathways_df = pd.DataFrame(columns=["pathway_dataset", "pathway_name"])
+    frames = {}
+    for primary_id, records in data.items():
+        empty = _humanmine_empty_frames()
+        frames[primary_id] = tuple(
+            pd.DataFrame.from_records(rows) if rows else empty_df
+            for rows, empty_df in zip(records.values(), empty)
+        )
+    return frames
+
 
-    return (
-        disease_df,
-        phenotypes_df,
-        differential_exp_diseases_df,
-        differential_exp_tissues_df,
-        gwas_df,
-        pathways_df,
+@ret.retryer(max_retries=20, timeout=30)
+def get_humanmine_data(gene):
+    service = HumanMineService(HUMANMINE_URL)
+    primary_id = _humanmine_lookup(service, gene)
+    if primary_id is None:
+        return _humanmine_empty_frames()
+    return _humanmine_frames(service, [primary_id])[str(primary_id)]
+
+
+@ret.retryer(max_retries=20, timeout=30)
+def get_humanmine_data_batch(genes):
+    """HumanMine data of a list of genes with one query per data type.
+
+    The genes are matched on their symbol in a single query; the ones not
+    matching any symbol (aliases) are looked up one by one as in
+    get_humanmine_data. Genes matching several HumanMine genes get empty
+    frames. Returns a dict gene -> tuple of DataFrames (see get_humanmine_data).
+    """
+    genes = list(dict.fromkeys(genes))
+    service = HumanMineService(HUMANMINE_URL)
+    query = service.new_query("Gene")
+    query.add_view("symbol", "id")
+    query.add_constraint("symbol", "ONE OF", genes, code="A")
+    query.add_constraint("organism.species", "=", "sapiens", code="B")
+    matches = {}
+    for row in query.rows():
+        matches.setdefault(row["symbol"], set()).add(str(row["id"]))
+
+    primary_ids = {}
+    for gene in genes:
+        if gene not in matches:
+            primary_id = _humanmine_lookup(service, gene)
+            if primary_id is not None:
+                primary_ids[gene] = str(primary_id)
+        elif len(matches[gene]) == 1:
+            primary_ids[gene] = next(iter(matches[gene]))
+
+    frames = (
+        _humanmine_frames(service, sorted(set(primary_ids.values())))
+        if primary_ids
+        else {}
     )
+    return {
+        gene: frames[primary_ids[gene]]
+        if gene in primary_ids
+        else _humanmine_empty_frames()
+        for gene in genes
+    }
+
+
+def humanmine_data(gene):
+    """HumanMine data of a gene, prefetched for the build or queried on its own."""
+    prefetched = bctx.current().humanmine.pop(gene, None)
+    if prefetched is not None:
+        return prefetched
+    return get_humanmine_data(gene)
+
+
+def prefetch_humanmine(genes, context):
+    """Fetch the HumanMine data of the genes in one batch for the targets to build."""
+    genes = [gene.split("_")[0] for gene in genes]
+    try:
+        context.humanmine.update(get_humanmine_data_batch(genes))
+    except Exception as error:
+        # The targets will query HumanMine one by one
+        print("[HUMANMINE]: Batch query failed (%s)" % error)
 
 
 def get_domains(record=None, gene_id=None, chembl_id=None):
     # ------------ domain and binding sites ----------#
+    ctx = bctx.current()
     domain = []
     if not record:
         if gene_id:
@@ -392,7 +457,7 @@ def get_domains(record=None, gene_id=None, chembl_id=None):
                 }
             )
     if chembl_id:
-        connector = sqlite3.connect(chembl_24)
+        connector = sqlite3.connect(ctx.chembl)
         query = (
             "SELECT CD.start_position,CD.end_position,DOM.domain_name,DOM.source_domain_id,DOM.domain_type FROM target_dictionary "
             "TD,target_components TC,domains DOM,component_domains CD WHERE TD.chembl_id='%s' AND TD.tid=TC.tid AND "
@@ -442,7 +507,8 @@ def get_domains(record=None, gene_id=None, chembl_id=None):
 
 
 def get_chembl_info(chembl_id):
-    connector = sqlite3.connect(chembl_24)
+    ctx = bctx.current()
+    connector = sqlite3.connect(ctx.chembl)
     query = (
         "SELECT PC.pref_name ,PC.short_name ,PC.protein_class_desc ,group_concat(DISTINCT("
         "CSYN.component_synonym)) AS Synonym FROM target_dictionary TD, target_components TC, "
@@ -487,6 +553,7 @@ def get_comments(record):
 
 
 def get_variants(record, domains):
+    ctx = bctx.current()
     modifications = pd.DataFrame(
         columns=[
             "mod_id",
@@ -615,7 +682,7 @@ def get_variants(record, domains):
                     "Identity": "",
                     "Gaps": "",
                 }
-    if verbose:
+    if ctx.verbose:
         print("[ISOFORMS SEQUENCE ALIGNMENT IN PROGRESS]")
     for isoform in isoforms.index:
         temp_seq = list(record.sequence)
@@ -662,7 +729,7 @@ def get_variants(record, domains):
             isoforms.loc[isoform]["Score"] = ""
             isoforms.loc[isoform]["Identity"] = ""
             isoforms.loc[isoform]["Gaps"] = ""
-    if verbose:
+    if ctx.verbose:
         print("[ISOFORMS SEQUENCE ALIGNMENT DONE]")
     return isoforms, modifications
 
@@ -725,40 +792,46 @@ def align(sequence1, sequence2, end_gaps=True, print_align=False):
     return results
 
 
-@ret.retryer(max_retries=10, timeout=10)
 def get_pdb(list_of_pdb, path):
-    file_path = path.joinpath("PDB")
-    if not file_path.is_dir():
-        file_path.mkdir(parents=True, exist_ok=True)
+    ctx = bctx.current()
+    store = pstore.PDBStore(path.joinpath("PDB"))
+    todo = {}
     for k in list_of_pdb.index:
-        saved_pdb = file_path.joinpath(str(list_of_pdb.loc[k]["PDB_code"]) + ".pdb")
-        if saved_pdb.is_file():
-            if verbose:
+        pdb_code = str(list_of_pdb.loc[k]["PDB_code"])
+        with ctx.lock(pdb_code + ".pdb"):
+            saved_pdb = store.find(pdb_code)
+        if saved_pdb is not None:
+            if ctx.verbose:
                 print("[FILE ALREADY THERE]: ", saved_pdb.name)
             list_of_pdb.at[k, "path"] = str(saved_pdb)
         else:
-            try:
-                urllib.urlretrieve(
-                    "http://files.rcsb.org/download/" + saved_pdb.name, str(saved_pdb)
-                )
+            todo.setdefault(pdb_code, []).append(k)
+    if todo and hcache.is_offline() and not ctx.pdb_downloader.is_local:
+        if ctx.verbose:
+            print(
+                "[PDB SKIPPED]: %d PDB files not downloaded (offline mode)" % len(todo)
+            )
+    elif todo:
+        saved, failed = ctx.pdb_downloader.download(todo, store, lock=ctx.lock)
+        for pdb_code, saved_pdb in saved.items():
+            for k in todo[pdb_code]:
                 list_of_pdb.at[k, "path"] = str(saved_pdb)
-                if verbose:
-                    print("[PDB DOWNLOAD]: ", saved_pdb.name)
-            except HTTPError:
-                pass
-                if verbose:
-                    print(
-                        "[ERROR]: "
-                        + str(k)
-                        + ".pdb file not found (do not exist or is "
-                        "too big)"
-                    )
-    if verbose:
+            if ctx.verbose:
+                print("[PDB DOWNLOAD]: ", saved_pdb.name)
+        if ctx.verbose:
+            for pdb_code, reason in failed.items():
+                print(
+                    "[ERROR]: "
+                    + pdb_code
+                    + ".pdb file could not be downloaded (%s)" % reason
+                )
+    if ctx.verbose:
         print("[PDB DOWNLOAD DONE]")
 
 
 def get_pdb_seq_info(pdb_list, domain):
-    if verbose:
+    ctx = bctx.current()
+    if ctx.verbose:
         print("[PDB INFO]: Extracting PDB information")
     seq = []
     for keys in pdb_list.index:
@@ -766,10 +839,14 @@ def get_pdb_seq_info(pdb_list, domain):
             continue
         seq.append(
             pdb_parser.get_sequence(
-                keys, pdb_list.loc[keys]["path"], pdb_list.loc[keys]["Chain"], domain
+                keys,
+                pdb_list.loc[keys]["path"],
+                pdb_list.loc[keys]["Chain"],
+                domain,
+                header=pstore.header(pdb_list.loc[keys]["path"]),
             )
         )
-    if verbose:
+    if ctx.verbose:
         print("[PDB INFO]: Done")
     if seq:
         seq_df = pd.concat(seq)
@@ -794,11 +871,12 @@ def get_pdb_seq_info(pdb_list, domain):
 
 def get_ligands_to_do(chembl_code):
     # ====================# GETTING THE LIST OF LIGAND WITH BIOACTIVITIES IN THE DB #=========================#
+    ctx = bctx.current()
     lig_to_do = []
-    if verbose:
+    if ctx.verbose:
         print("[LIGANDS]: Extracting ligand informations")
     # =====================# GETTING THE LIST OF LIGAND ASSOCIATED TO  THE TARGET #==========================#
-    connector = sqlite3.connect(chembl_24)
+    connector = sqlite3.connect(ctx.chembl)
     query_lig_target = (
         "SELECT TD.chembl_id AS target_id,MOL.chembl_id AS lig_id,version.name as "
         "chembl_version FROM target_dictionary TD,activities BIO,assays AC,"
@@ -819,7 +897,7 @@ def get_ligands_to_do(chembl_code):
         limit = len(res_lig_target)
     n_loop = 0
     excess = len(res_lig_target) % limit
-    connector2 = sqlite3.connect(targetDB)
+    connector2 = sqlite3.connect(ctx.targetdb)
     lig_ids = "("
     query_lig_bioact_db_base = (
         """SELECT DISTINCT lig_id,chembl_version FROM bioactivities WHERE lig_id IN """
@@ -864,9 +942,10 @@ def get_ligands_to_do(chembl_code):
 
 
 def get_assays():
-    if verbose:
+    ctx = bctx.current()
+    if ctx.verbose:
         print("[ASSAYS]: Extracting assays information")
-    connector = sqlite3.connect(chembl_24)
+    connector = sqlite3.connect(ctx.chembl)
 
     query = """SELECT
 		  TD.chembl_id AS target_chembl_id,
@@ -901,15 +980,16 @@ def get_assays():
     res.drop_duplicates(["assay_id"], inplace=True)
     connector.close()
 
-    tdb_connector = sqlite3.connect(targetDB)
+    tdb_connector = sqlite3.connect(ctx.targetdb)
     res.to_sql("assays", con=tdb_connector, if_exists="append", index=False)
     tdb_connector.close()
 
 
 def get_ligands_info():
-    if verbose:
+    ctx = bctx.current()
+    if ctx.verbose:
         print("[LIGANDS]: Extracting ligands information")
-    connector = sqlite3.connect(chembl_24)
+    connector = sqlite3.connect(ctx.chembl)
     sql_lig = """SELECT
 	  MOL.pref_name AS mol_name,
 	  MOL.chembl_id AS lig_id,
@@ -953,19 +1033,39 @@ def get_ligands_info():
     }
     df.rename(columns=rename, inplace=True)
 
-    tdb_con = sqlite3.connect(targetDB)
+    tdb_con = sqlite3.connect(ctx.targetdb)
     df.to_sql("ligands", con=tdb_con, if_exists="append", index=False)
     tdb_con.close()
 
 
+def fill_reference_tables():
+    """Fill the assays and ligands tables from ChEMBL if they are still empty."""
+    ctx = bctx.current()
+    connector = sqlite3.connect(ctx.targetdb)
+    if pd.read_sql("SELECT assay_id FROM assays", con=connector).empty:
+        if ctx.verbose:
+            print("[INFO]: Assay table is being filled, it may take a few minutes")
+        get_assays()
+        if ctx.verbose:
+            print("[DATABASE]: Assay table populated")
+    if pd.read_sql("SELECT lig_id FROM ligands", con=connector).empty:
+        if ctx.verbose:
+            print("[INFO]: Ligands table is being filled, it may take a few minutes")
+        get_ligands_info()
+        if ctx.verbose:
+            print("[DATABASE]: Ligand table populated")
+    connector.close()
+
+
 def get_bioactivity(lig_to_do):
     # =========# CREATING THE STRING OF LIGANDS ('CHEMBLXXXX','CHEMBLXXXX',....) #========================#
-    if verbose:
+    ctx = bctx.current()
+    if ctx.verbose:
         print(
             "[BIOACTIVITIES]: Extracting bioactivities from chembl - CAN TAKE A FEW MINUTES "
         )
 
-    connector = sqlite3.connect(chembl_24)
+    connector = sqlite3.connect(ctx.chembl)
 
     # ========# FETCHING ALL BIOACTIVITIES (FOR THE LIST OF LIGANDS: ALL TARGETS) #=======================#
     res_bioactivity = pd.DataFrame()
@@ -1022,30 +1122,13 @@ def get_bioactivity(lig_to_do):
 
 
 def blast_launcher(sequence, seq_file, db, output_name, num_core=8):
-    if seq_file.is_file():
-        subprocess.check_output(
-            [
-                blast_exe,
-                "-db",
-                str(db),
-                "-query",
-                str(seq_file),
-                "-out",
-                str(output_name),
-                "-num_threads",
-                str(num_core),
-                "-outfmt",
-                str(5),
-                "-max_target_seqs",
-                str(100),
-            ],
-            env={"BLASTDB": blast_db},
-        )
-    else:
+    ctx = bctx.current()
+    if not seq_file.is_file():
         seq_file.write_text(str(sequence))
+    with ctx.cores(num_core) as n_threads:
         subprocess.check_output(
             [
-                blast_exe,
+                ctx.blast_exe,
                 "-db",
                 str(db),
                 "-query",
@@ -1053,17 +1136,18 @@ def blast_launcher(sequence, seq_file, db, output_name, num_core=8):
                 "-out",
                 str(output_name),
                 "-num_threads",
-                str(num_core),
+                str(n_threads),
                 "-outfmt",
                 str(5),
                 "-max_target_seqs",
                 str(100),
             ],
-            env={"BLASTDB": blast_db},
+            env={"BLASTDB": ctx.blast_db},
         )
 
 
 def pdb_blast(sequence, path, gene_id, gene="", pdb_list=None):
+    ctx = bctx.current()
     if pdb_list is None:
         pdb_list = []
     file_path = path.joinpath("PDB_BLAST")
@@ -1071,7 +1155,7 @@ def pdb_blast(sequence, path, gene_id, gene="", pdb_list=None):
     seq_file = file_path.joinpath(gene + "_" + gene_id + ".seq")
     if not file_path.is_dir():
         file_path.mkdir(parents=True, exist_ok=True)
-    if verbose:
+    if ctx.verbose:
         print("[3D BLAST]:" + gene + "(" + gene_id + ")")
     columns = [
         "PDB_code",
@@ -1087,18 +1171,20 @@ def pdb_blast(sequence, path, gene_id, gene="", pdb_list=None):
     alternate_pdb = pd.DataFrame(columns=columns)
     if blast_file.is_file():
         if ((((time.time() - blast_file.stat().st_mtime) / 60) / 60) / 24) <= 15:
-            if verbose:
+            if ctx.verbose:
                 print("[3D BLAST FILE FOUND]:" + gene)
             result_handle = blast_file.open()
         else:
-            if verbose:
+            if ctx.verbose:
                 print(
                     "[3D BLAST FILE FOUND]: File older than 2 weeks, a new blast will be performed ("
                     + gene
                     + ")"
                 )
             blast_file.unlink()
-            blast_launcher(sequence, seq_file, "pdbaa", blast_file, num_core=bcore)
+            blast_launcher(
+                sequence, seq_file, "pdbaa", blast_file, num_core=ctx.blast_threads
+            )
             if blast_file.is_file():
                 result_handle = blast_file.open()
             else:
@@ -1107,14 +1193,16 @@ def pdb_blast(sequence, path, gene_id, gene="", pdb_list=None):
                 )
                 return alternate_pdb
     else:
-        blast_launcher(sequence, seq_file, "pdbaa", blast_file, num_core=bcore)
+        blast_launcher(
+            sequence, seq_file, "pdbaa", blast_file, num_core=ctx.blast_threads
+        )
         if blast_file.is_file():
             result_handle = blast_file.open()
         else:
             print("[3D BLAST][ERROR]: Something went wrong, no blast result generated")
             return alternate_pdb
 
-    if verbose:
+    if ctx.verbose:
         print("[3D BLAST DONE]: Now parsing the data - " + gene + "(" + gene_id + ")")
     blast_record = NCBIXML.read(result_handle)
     result_handle.close()
@@ -1162,60 +1250,56 @@ def pdb_blast(sequence, path, gene_id, gene="", pdb_list=None):
 
 def pdb_to_uniprot(chain, pdb_file):
     result = {}
-    with open(pdb_file, "r") as pdb:
-        for line in pdb:
-            if line.startswith("DBREF"):
-                current_line = list(
-                    filter(None, line.strip("\n").replace(" ", "_").split("_"))
-                )
-                if current_line[2] != chain:
-                    continue
-                if current_line[0] == "DBREF1":
-                    if current_line[5] == "UNP":
-                        try:
-                            result["gene"] = current_line[6]
-                            result["uniprot_id"] = current_line[6]
-                            result["organism"] = current_line[7]
-                        except IndexError:
-                            result["gene"] = "NA"
-                            result["organism"] = "NA"
-                            result["uniprot_id"] = "NA"
-                else:
-                    if current_line[5] == "UNP":
-                        try:
-                            result["gene"] = current_line[7]
-                            result["uniprot_id"] = current_line[6]
-                            result["organism"] = current_line[8]
-                        except IndexError:
-                            result["gene"] = "NA"
-                            result["organism"] = "NA"
-                            result["uniprot_id"] = "NA"
+    for current_line in pstore.header(pdb_file).dbref_of(chain):
+        if current_line[0] == "DBREF1":
+            if current_line[5] == "UNP":
+                try:
+                    result["gene"] = current_line[6]
+                    result["uniprot_id"] = current_line[6]
+                    result["organism"] = current_line[7]
+                except IndexError:
+                    result["gene"] = "NA"
+                    result["organism"] = "NA"
+                    result["uniprot_id"] = "NA"
+        else:
+            if current_line[5] == "UNP":
+                try:
+                    result["gene"] = current_line[7]
+                    result["uniprot_id"] = current_line[6]
+                    result["organism"] = current_line[8]
+                except IndexError:
+                    result["gene"] = "NA"
+                    result["organism"] = "NA"
+                    result["uniprot_id"] = "NA"
     return result
 
 
 def proteins_blast(sequence, gene_id, gene, path):
+    ctx = bctx.current()
     file_path = path.joinpath("PROTEIN_BLAST")
     blast_file = file_path.joinpath(gene + "_" + gene_id + ".xml")
     seq_file = file_path.joinpath(gene + "_" + gene_id + ".seq")
 
     if not file_path.is_dir():
         file_path.mkdir(parents=True, exist_ok=True)
-    if verbose:
+    if ctx.verbose:
         print("[PROTEIN BLAST] " + gene + "(" + gene_id + ")")
     if blast_file.is_file():
         if ((((time.time() - blast_file.stat().st_mtime) / 60) / 60) / 24) <= 15:
-            if verbose:
+            if ctx.verbose:
                 print("[PROTEIN BLAST FILE FOUND]:" + gene)
             result_handle = blast_file.open()
         else:
-            if verbose:
+            if ctx.verbose:
                 print(
                     "[PROTEIN BLAST FILE FOUND]: File older than 2 weeks, a new blast will be performed ("
                     + gene
                     + ")"
                 )
             blast_file.unlink()
-            blast_launcher(sequence, seq_file, "swissprot", blast_file, num_core=bcore)
+            blast_launcher(
+                sequence, seq_file, "swissprot", blast_file, num_core=ctx.blast_threads
+            )
             if blast_file.is_file():
                 result_handle = blast_file.open()
             else:
@@ -1224,7 +1308,9 @@ def proteins_blast(sequence, gene_id, gene, path):
                 )
                 return []
     else:
-        blast_launcher(sequence, seq_file, "swissprot", blast_file, num_core=bcore)
+        blast_launcher(
+            sequence, seq_file, "swissprot", blast_file, num_core=ctx.blast_threads
+        )
         if blast_file.is_file():
             result_handle = blast_file.open()
         else:
@@ -1234,7 +1320,7 @@ def proteins_blast(sequence, gene_id, gene, path):
             return []
     blast_record = NCBIXML.read(result_handle)
     result_handle.close()
-    if verbose:
+    if ctx.verbose:
         print(
             "[PROTEIN BLAST DONE]: Now parsing the data - " + gene + "(" + gene_id + ")"
         )
@@ -1477,6 +1563,7 @@ def pubmed_search(gene_name, email, return_number=False, mesh_term=None):
 
 @ret.retryer(max_retries=10, timeout=10)
 def open_target_association(ensembl_id):
+    ctx = bctx.current()
     if ensembl_id == "":
         return pd.DataFrame(
             columns=[
@@ -1533,8 +1620,11 @@ def open_target_association(ensembl_id):
 
     try:
         # Perform POST request and check status code of response
-        r = requests.post(
-            base_url, json={"query": query_string, "variables": {}}, timeout=20
+        r = hcache.post(
+            base_url,
+            "opentargets",
+            json={"query": query_string, "variables": {}},
+            timeout=20,
         )
         if r.status_code != 200:
             print("[OPENTARGETS]: Couldn't get results from Open Targets API")
@@ -1556,7 +1646,7 @@ def open_target_association(ensembl_id):
         # Transform API response into JSON
         api_response_as_json = json.loads(r.text)
     except:
-        if verbose:
+        if ctx.verbose:
             print("[OPENTARGETS]: Something is broken with the Open Targets API")
         pd.DataFrame(
             columns=[
@@ -1667,19 +1757,44 @@ def open_target_association(ensembl_id):
     return df
 
 
+def new_bioactivities(connector, bioactivities):
+    """Drop the bioactivities of ligands already in the database for the same ChEMBL version.
+
+    Targets built concurrently can both collect the bioactivities of a ligand
+    they share before either of them has written them.
+    """
+    if bioactivities.empty:
+        return bioactivities
+    in_db = pd.read_sql(
+        "SELECT DISTINCT lig_id, chembl_version FROM bioactivities "
+        "WHERE lig_id IN (SELECT value FROM json_each(:ids))",
+        con=connector,
+        params={"ids": sqlp.ids_param(bioactivities.lig_id.unique())},
+    )
+    if in_db.empty:
+        return bioactivities
+    done = set(zip(in_db.lig_id, in_db.chembl_version))
+    keep = [
+        (lig_id, version) not in done
+        for lig_id, version in zip(bioactivities.lig_id, bioactivities.chembl_version)
+    ]
+    return bioactivities[keep]
+
+
 def write_to_db(target, db_path):
+    ctx = bctx.current()
     if target.record is None:
         return None
 
     # ========# OPEN DATABASE #========#
-    if verbose:
+    if ctx.verbose:
         print("[DATABASE]: Start to write info into the database")
     connector = sqlite3.connect(db_path)
 
     # ========# FILLING THE TARGETS TABLE #=========#
     target.prot_info.to_sql("Targets", con=connector, index=False, if_exists="append")
 
-    if verbose:
+    if ctx.verbose:
         print("[DATABASE]: Target table populated/updated")
 
     # ========# FILLING THE DOMAIN TABLE #=========#
@@ -1698,7 +1813,7 @@ def write_to_db(target, db_path):
         "Domain_targets", con=connector, index=False, if_exists="append"
     )
 
-    if verbose:
+    if ctx.verbose:
         print("[DATABASE]: Domain table populated/updated")
 
     # ========# FILLING THE 3D BLAST TABLE #=========#
@@ -1727,7 +1842,7 @@ def write_to_db(target, db_path):
         "3D_Blast", con=connector, index=False, if_exists="append"
     )
 
-    if verbose:
+    if ctx.verbose:
         print("[DATABASE]: PDB Blast table populated/updated")
 
     # ========# FILLING THE PROTEIN BLAST TABLE #=========#
@@ -1736,7 +1851,7 @@ def write_to_db(target, db_path):
         "protein_blast", con=connector, index=False, if_exists="append"
     )
 
-    if verbose:
+    if ctx.verbose:
         print("[DATABASE]: Blast table populated/updated")
 
     # ========# FILLING THE MODIFICATIONS TABLE #=========#
@@ -1780,7 +1895,7 @@ def write_to_db(target, db_path):
         "isoform_modifications", con=connector, if_exists="append", index=False
     )
 
-    if verbose:
+    if ctx.verbose:
         print("[DATABASE]: Isoforms tables populated/updated")
 
     # ========# FILLING THE PDB RELATED TABLES #=========#
@@ -1829,7 +1944,7 @@ def write_to_db(target, db_path):
         "PDBChain_Domain", con=connector, if_exists="append", index=False
     )
 
-    if verbose:
+    if ctx.verbose:
         print("[DATABASE]: PDB tables populated/updated")
 
     # ========# FILLING THE fPOCKET RELATED TABLES #=========#
@@ -1849,25 +1964,31 @@ def write_to_db(target, db_path):
         "fPockets_Domain", con=connector, if_exists="append", index=False
     )
 
-    if verbose:
+    if ctx.verbose:
         print("[DATABASE]: fPockets tables populated/updated")
 
     target.alternate_pockets["pockets"].to_sql(
         "fPockets", con=connector, if_exists="append", index=False
     )
 
-    if verbose:
+    if ctx.verbose:
         print("[DATABASE]: alternate fPockets tables populated/updated")
 
     # ========# FILLING THE BIOACTIVITIES TABLE #=========#
 
+    target.bioactivities = new_bioactivities(connector, target.bioactivities)
     target.bioactivities.to_sql(
         "bioactivities", con=connector, if_exists="append", index=False
     )
 
-    if verbose:
+    if ctx.verbose:
         print("[DATABASE]: Bioactivities table populated")
 
+    if not target.bioactivities.empty:
+        lsel.refresh(connector, target.bioactivities.lig_id.unique())
+        if ctx.verbose:
+            print("[DATABASE]: Ligand selectivity table updated")
+
     # ========# FILLING THE PROTEIN EXPRESSION TABLE #=========#
 
     if target.protein_expression is not None:
@@ -1899,7 +2020,7 @@ def write_to_db(target, db_path):
             index=False,
         )
 
-        if verbose:
+        if ctx.verbose:
             print("[DATABASE]: Protein expression levels tables populated/updated")
 
     # ========# FILLING THE HUMAN MINE DATA TABLES #=========#
@@ -1909,7 +2030,7 @@ def write_to_db(target, db_path):
     target.disease.rename(columns={"disease": "disease_name"}, inplace=True)
     target.disease.to_sql("disease", con=connector, if_exists="append", index=False)
 
-    if verbose:
+    if ctx.verbose:
         print("[DATABASE]: Disease table populated/updated")
 
     target.differential_exp_tissues["Target_id"] = target.swissprotID
@@ -1920,7 +2041,7 @@ def write_to_db(target, db_path):
         "diff_exp_tissue", con=connector, if_exists="append", index=False
     )
 
-    if verbose:
+    if ctx.verbose:
         print("[DATABASE]: Differential expression (tissues) table populated/updated")
 
     target.differential_exp_disease["Target_id"] = target.swissprotID
@@ -1931,13 +2052,13 @@ def write_to_db(target, db_path):
         "diff_exp_disease", con=connector, if_exists="append", index=False
     )
 
-    if verbose:
+    if ctx.verbose:
         print("[DATABASE]: Differential expression (disease) table populated/updated")
 
     target.gwas["Target_id"] = target.swissprotID
     target.gwas.to_sql("gwas", con=connector, if_exists="append", index=False)
 
-    if verbose:
+    if ctx.verbose:
         print("[DATABASE]: GWAS table populated/updated")
 
     target.phenotypes["Target_id"] = target.swissprotID
@@ -1946,13 +2067,13 @@ def write_to_db(target, db_path):
         "phenotype", con=connector, if_exists="append", index=False
     )
 
-    if verbose:
+    if ctx.verbose:
         print("[DATABASE]: phenotype table populated/updated")
 
     target.pathways["Target_id"] = target.swissprotID
     target.pathways.to_sql("pathways", con=connector, if_exists="append", index=False)
 
-    if verbose:
+    if ctx.verbose:
         print("[DATABASE]: Pathway table populated/updated")
 
     # ========# FILLING THE CROSSREF TABLE #=========#
@@ -1967,7 +2088,7 @@ def write_to_db(target, db_path):
     )
     crossref.to_sql("Crossref", con=connector, if_exists="append", index=False)
 
-    if verbose:
+    if ctx.verbose:
         print("[DATABASE]: Cross-references table populated/updated")
 
     # ========# FILLING THE CROSSREF TABLE #=========#
@@ -1979,9 +2100,25 @@ def write_to_db(target, db_path):
         "opentarget_association", con=connector, if_exists="append", index=False
     )
 
-    if verbose:
+    if ctx.verbose:
         print("[DATABASE]: Open-targets table populated/updated")
 
+    # ========# INVALIDATE CACHED DESCRIPTORS #=========#
+    # The selectivity counts of the targets sharing ligands with this one may change
+
+    outdated = [target.swissprotID]
+    if not target.bioactivities.empty:
+        outdated += pd.read_sql(
+            """SELECT DISTINCT C.target_id
+            FROM bioactivities B
+              JOIN Crossref C
+              ON C.Chembl_id=B.Target_id
+            WHERE B.lig_id IN (SELECT value FROM json_each(:ids))""",
+            con=connector,
+            params={"ids": sqlp.ids_param(target.bioactivities.lig_id.unique())},
+        ).target_id.tolist()
+    dcache.invalidate(db_path, outdated)
+
     connector.close()
 
 
@@ -1997,15 +2134,28 @@ class Target:
         chembl=None,
         target_db=None,
         blast_cores=8,
+        context=None,
     ):
-        global verbose
-        global chembl_24
-        global targetDB
-        global bcore
-        bcore = blast_cores
-        targetDB = target_db
-        chembl_24 = chembl
-        verbose = v
+        if context is None:
+            context = bctx.BuildContext(
+                target_db,
+                chembl,
+                db_files_path=db_files_path,
+                num_core=blast_cores,
+                verbose=v,
+            )
+        self.ctx = context
+        with context.activate():
+            self._build(
+                gname,
+                uniprot_id,
+                ensembl_id,
+                hgnc_id,
+                db_files_path or context.db_files_path,
+            )
+
+    def _build(self, gname, uniprot_id, ensembl_id, hgnc_id, db_files_path):
+        ctx = self.ctx
         script_start = time.time()
         # =====# INITIATING THE OBJECT #========#
         if "_" in gname:
@@ -2039,6 +2189,7 @@ class Target:
         }
         self.druggable_pockets = pd.DataFrame()
         self.pdb_info = pd.DataFrame()
+        self.stages = sg.StageGraph()
 
         self.path = Path(db_files_path).joinpath("DB_files")
         if not self.path.is_dir():
@@ -2047,11 +2198,11 @@ class Target:
         while True:
             # ==============# IF NO UNIPROT ID --> SKIP #====================#
             if self.swissprotID == "" or self.swissprotID is None:
-                if verbose:
+                if ctx.verbose:
                     print("[GENE SKIPPED]: No UniprotID found for " + self.gene)
                 break
 
-            if verbose:
+            if ctx.verbose:
                 print(
                     "[BEGINNING OF GENE]: "
                     + self.gene
@@ -2060,22 +2211,51 @@ class Target:
                     + ")"
                 )
 
-            # ============# COLLECTING THE UNIPROT RECORD #===============#
-            self.record = get_uniprot(self.swissprotID)
+            # ============# COLLECTING THE TARGET INFORMATION #===============#
+            # UniProt, ProteinAtlas, HumanMine and OpenTargets are fetched
+            # concurrently, the stages using the UniProt record start as soon
+            # as it is there
+            self.stages.add("uniprot", partial(get_uniprot, self.swissprotID))
+            self.stages.add(
+                "protein_expression",
+                partial(patlas.ProteinExpression, self.gene, id=self.ensembl_id),
+            )
+            self.stages.add("humanmine", partial(humanmine_data, self.gene))
+            self.stages.add(
+                "open_targets", partial(open_target_association, self.ensembl_id)
+            )
+            # ===========# GET ALL THE CROSSREFERENCES (source: Uniprot)#==============#
+            self.stages.add("crossref", get_crossref_pdb_go_chembl, deps=["uniprot"])
+            # ==========# GET DOMAIN INFORMATION FROM BOTH CHEMBL AND UNIPROT #===========#
+            self.stages.add(
+                "domains",
+                lambda record, crossref: get_domains(
+                    record=record, gene_id=self.swissprotID, chembl_id=crossref[2]
+                ),
+                deps=["uniprot", "crossref"],
+            )
+            # ==========# GET ISOFORMS INFORMATION (Source: Uniprot) #===========#
+            self.stages.add("variants", get_variants, deps=["uniprot", "domains"])
+            # ==========# GET PROTEIN CLASS AND SYNONYMS FROM CHEMBL #===========#
+            self.stages.add(
+                "chembl_info",
+                lambda crossref: get_chembl_info(crossref[2]),
+                deps=["crossref"],
+            )
+            info = self.stages.run()
+
+            self.record = info["uniprot"]
             if self.record is None:
-                if verbose:
+                if ctx.verbose:
                     print(
                         "[GENE SKIPPED]: No Uniprot data or wrong uniprotID for "
                         + self.gene
                     )
                 break
 
-            # ===========# GET ALL THE CROSSREFERENCES (source: Uniprot)#==============#
-            self.pdb, self.go, self.chembl_id = get_crossref_pdb_go_chembl(self.record)
+            self.pdb, self.go, self.chembl_id = info["crossref"]
             # ===========# GET PROTEIN EXPRESSION LEVELS (source: ProteinAtlas)#==============#
-            self.protein_expression = patlas.ProteinExpression(
-                self.gene, id=self.ensembl_id
-            )
+            self.protein_expression = info["protein_expression"]
             if self.protein_expression.protein_lvl is None:
                 self.protein_expression = None
             # ===========# GET INFO FROM HUMANMINE.ORG (disease, phenotypes, differential_exp_diseases,
@@ -2087,20 +2267,15 @@ class Target:
                 self.differential_exp_tissues,
                 self.gwas,
                 self.pathways,
-            ) = get_humanmine_data(self.gene)
-            # ==========# GET DOMAIN INFORMATION FROM BOTH CHEMBL AND UNIPROT #===========#
-            self.domain = get_domains(
-                record=self.record, gene_id=self.swissprotID, chembl_id=self.chembl_id
-            )
+            ) = info["humanmine"]
+            self.domain = info["domains"]
             # ==========# GET DISEASE ASSOCIATION (Source: OpenTargets)#===========#
-            self.open_targets = open_target_association(self.ensembl_id)
+            self.open_targets = info["open_targets"]
             # ==========# GET SEQUENCE INFORMATION (Source: Uniprot)#===========#
             self.sequence = self.record.sequence
             self.seq_list = list(self.sequence)
-            # ==========# GET ISOFORMS INFORMATION (Source: Uniprot) #===========#
-            self.isoforms, self.modifications = get_variants(self.record, self.domain)
-            # ==========# GET PROTEIN CLASS AND SYNONYMS FROM CHEMBL #===========#
-            self.prot_info = get_chembl_info(self.chembl_id)
+            self.isoforms, self.modifications = info["variants"]
+            self.prot_info = info["chembl_info"]
             if self.prot_info.empty:
                 self.prot_info.loc[0] = [None, None, None, synonyms(self.record)]
             self.prot_info["Target_id"] = self.swissprotID
@@ -2131,7 +2306,7 @@ class Target:
             # ======================# START OF THE PDB SECTION #==========================#
             # ============================================================================#
             # ======# RETRIEVING LIST OF PDB ASSOCIATED TO TARGET ALREADY IN DB #=========#
-            connector = sqlite3.connect(targetDB)
+            connector = sqlite3.connect(ctx.targetdb)
             query_pdb = (
                 "SELECT PDB_code FROM PDB_Chains WHERE Target_id ='%s' GROUP BY PDB_code"
                 % self.swissprotID
@@ -2161,14 +2336,16 @@ class Target:
                     pdb_info=self.pdb,
                     domain=self.domain,
                     uniprot_id=self.swissprotID,
-                    fpocket_exe=fpocket_exe,
-                    verbose=verbose,
+                    fpocket_exe=ctx.fpocket_exe,
+                    verbose=ctx.verbose,
+                    context=ctx,
                 )
                 self.druggable_pockets = self.pockets["pockets"][
                     self.pockets["pockets"].druggable == "TRUE"
                 ].copy()
 
             pdb_super_list = list(res_pdb.PDB_code) + list(self.pdb.index)
+            self.stages.mark("pdb")
             # ============================================================================#
             # ======================# END OF THE PDB SECTION #============================#
             # ============================================================================#
@@ -2177,24 +2354,7 @@ class Target:
             # ====================# START OF THE LIGAND SECTION #=========================#
             # ============================================================================#
             # ==============# FILL THE ASSAY TABLE IF EMPTY #================#
-            connector = sqlite3.connect(targetDB)
-            if pd.read_sql("SELECT assay_id FROM assays", con=connector).empty:
-                if verbose:
-                    print(
-                        "[INFO]: Assay table is being filled, it may take a few minutes"
-                    )
-                get_assays()
-                if verbose:
-                    print("[DATABASE]: Assay table populated")
-            if pd.read_sql("SELECT lig_id FROM ligands", con=connector).empty:
-                if verbose:
-                    print(
-                        "[INFO]: Ligands table is being filled, it may take a few minutes"
-                    )
-                get_ligands_info()
-                if verbose:
-                    print("[DATABASE]: Ligand table populated")
-            connector.close()
+            ctx.write(fill_reference_tables)
 
             if self.chembl_id:
                 # ==============# GET LIST OF LIGAND TO ADD #================#
@@ -2204,6 +2364,7 @@ class Target:
                     # ========# GET ALL BIOACTIVITIES OF THESE LIGANDS #=========#
                     print("[INFO]: Getting all bioactivities of ligands")
                     self.bioactivities = get_bioactivity(ligands_to_do)
+            self.stages.mark("ligands")
 
             # ============================================================================#
             # =====================# END OF THE LIGAND SECTION #==========================#
@@ -2229,8 +2390,9 @@ class Target:
                     alternate=True,
                     alternate_pdb=self.alternate_pdb,
                     uniprot_id=self.swissprotID,
-                    fpocket_exe=fpocket_exe,
-                    verbose=verbose,
+                    fpocket_exe=ctx.fpocket_exe,
+                    verbose=ctx.verbose,
+                    context=ctx,
                 )
             else:
                 if not very_close_pdb.empty:
@@ -2240,26 +2402,29 @@ class Target:
                         alternate=True,
                         alternate_pdb=very_close_pdb,
                         uniprot_id=self.swissprotID,
-                        fpocket_exe=fpocket_exe,
-                        verbose=verbose,
+                        fpocket_exe=ctx.fpocket_exe,
+                        verbose=ctx.verbose,
+                        context=ctx,
                     )
 
             self.neighbours = proteins_blast(
                 self.sequence, self.swissprotID, self.gene, self.path
             )
             # ============================================================================#
+            self.stages.mark("blast")
             # ====================# END OF THE BLAST SECTION #============================#
             # ============================================================================#
 
             # ======================# WRITING TO THE DATABASE #===========================#
-            write_to_db(self, targetDB)
+            ctx.write(write_to_db, self, ctx.targetdb)
+            self.stages.mark("database")
             break
         # ============================================================================#
         # =================# END OF DATA GATHERING SECTION #==========================#
         # ============================================================================#
 
         script_stop = time.time()
-        if verbose:
+        if ctx.verbose:
             print(
                 "[END OF GENE]: "
                 + self.gene
@@ -2267,6 +2432,7 @@ class Target:
                 + str(round(script_stop - script_start))
                 + " sec)"
             )
+            print("[STAGE TIMINGS]: " + self.stages.summary())
             print(
                 "======================================================================="
             )
@@ -2322,6 +2488,32 @@ def parse_args():
         type=int,
         default=8,
     )
+    parser.add_argument(
+        "-jobs",
+        "--jobs",
+        help="Number of targets to build concurrently (default=1); the blast/fpocket "
+        "processes of all the jobs share the cores given with -blastcore",
+        metavar="",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "-pocket_workers",
+        "--pocket_workers",
+        help="Number of structures processed concurrently by fpocket "
+        "(default=number of cores given with -blastcore)",
+        metavar="",
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "-fpocket_timeout",
+        "--fpocket_timeout",
+        help="Time limit of a single fpocket run in seconds (default=no limit)",
+        metavar="",
+        type=float,
+        default=None,
+    )
     parser.add_argument(
         "-update_config",
         "--update_config",
@@ -2336,6 +2528,29 @@ def parse_args():
         action="store_true",
         default=False,
     )
+    parser.add_argument(
+        "-offline",
+        "--offline",
+        help="Only use the HTTP responses already in the local cache (no network "
+        "access to UniProt, HumanMine, OpenTargets, Ensembl, ProteinAtlas or RCSB)",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "-swissprot",
+        "--swissprot",
+        help="Local SwissProt flat file (uniprot_sprot.dat or .dat.gz) to read the "
+        "UniProt records from instead of the UniProt website",
+        metavar="",
+    )
+    parser.add_argument(
+        "-migrate_db",
+        "--migrate_db",
+        help="Use this option to upgrade the schema (indexes) of an existing targetDB "
+        "database to the current version",
+        action="store_true",
+        default=False,
+    )
 
     arguments = parser.parse_args()
     if (
@@ -2343,6 +2558,7 @@ def parse_args():
         and not arguments.in_file
         and not arguments.list_genes
         and not arguments.do_all
+        and not arguments.migrate_db
     ):
         print(
             "[ERROR]: Please use one of the optional input options : -g / -i / -l / -a"
@@ -2353,17 +2569,113 @@ def parse_args():
     return arguments
 
 
+def delete_target(db_path, target_id):
+    tdb = sqlite3.connect(db_path)
+    tdb.execute("PRAGMA foreign_keys = 1")
+    tdb.execute("DELETE FROM Targets WHERE Target_id=?", (target_id,))
+    tdb.commit()
+    tdb.close()
+    dcache.invalidate(db_path, [target_id])
+
+
+def build_target(gene_df, g_id, uniprot_id, context, replace=False):
+    try:
+        if replace:
+            if context.verbose:
+                print(
+                    "[GENE INFO]: Target already present in database, updating informations"
+                )
+            context.write(delete_target, context.targetdb, uniprot_id)
+        Target(
+            gene_df.symbol.loc[g_id],
+            uniprot_id=uniprot_id,
+            ensembl_id=gene_df.ensembl_gene_id.loc[g_id],
+            hgnc_id=g_id,
+            context=context,
+        )
+    except hcache.OfflineError as error:
+        print("[GENE SKIPPED]: " + gene_df.symbol.loc[g_id] + " - " + str(error))
+
+
+def build_targets(gene_df, context, update=False):
+    """Build the targets of the genes of ``gene_df``, ``context.jobs`` at a time.
+
+    With several jobs, the targets are built on worker threads (their network
+    requests and ChEMBL queries overlap), BLAST/fpocket share the ``num_core``
+    cores of the context and all the database writes go through its single
+    writer thread. A target failing does not stop the others.
+
+    The HumanMine data of the genes is fetched in batches of
+    ``HUMANMINE_BATCH_SIZE`` genes before their targets are built.
+    """
+    entries_in_db = get_list_entries(target_db_path=context.targetdb)
+    todo = []
+    seen = set()
+    for g_id in gene_df.index:
+        if len(gene_df.uniprot_ids.loc[g_id]) == 0:
+            if context.verbose:
+                print(
+                    "[GENE SKIPPED]: No uniprot id was found for the entered gene name: ",
+                    gene_df.symbol.loc[g_id],
+                )
+        for uniprot_id in gene_df.uniprot_ids.loc[g_id]:
+            if uniprot_id in seen:
+                continue
+            seen.add(uniprot_id)
+            in_db = uniprot_id in entries_in_db.index
+            if in_db and not update:
+                if context.verbose:
+                    print(
+                        "[GENE SKIPPED]: Already present in the database: "
+                        + gene_df.symbol.loc[g_id]
+                    )
+                    print(
+                        "======================================================================="
+                    )
+                continue
+            todo.append((g_id, uniprot_id, in_db))
+
+    failed = []
+    pool = None
+    if context.jobs > 1:
+        pool = ThreadPoolExecutor(
+            max_workers=context.jobs, thread_name_prefix="targetdb-build"
+        )
+    try:
+        for start in range(0, len(todo), HUMANMINE_BATCH_SIZE):
+            batch = todo[start : start + HUMANMINE_BATCH_SIZE]
+            if len(batch) > 1:
+                prefetch_humanmine(
+                    [gene_df.symbol.loc[g_id] for g_id, _, _ in batch], context
+                )
+            if pool is None:
+                for g_id, uniprot_id, in_db in batch:
+                    build_target(gene_df, g_id, uniprot_id, context, replace=in_db)
+                continue
+            futures = {
+                pool.submit(
+                    build_target, gene_df, g_id, uniprot_id, context, replace=in_db
+                ): gene_df.symbol.loc[g_id] + " (" + uniprot_id + ")"
+                for g_id, uniprot_id, in_db in batch
+            }
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception:
+                    print("[ERROR]: Failed to build " + futures[future])
+                    traceback.print_exc()
+                    failed.append(futures[future])
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        context.humanmine.clear()
+        context.close()
+    if failed:
+        print("[ERROR]: %d target(s) could not be built: " % len(failed), failed)
+    return failed
+
+
 def main():
-    global \
-        args, \
-        targetDB, \
-        chembl_24, \
-        pubmed_email, \
-        dbase_file_path, \
-        entries_in_db, \
-        blast_exe, \
-        blast_db, \
-        fpocket_exe
     args = parse_args()
     update_config = args.update_config
     if args.create_db:
@@ -2408,11 +2720,14 @@ def main():
                 targetDB = config["database_path"]["targetdb"]
                 print("db path: ", targetDB)
                 chembl_24 = config["database_path"]["chembl"]
-                pubmed_email = config["pubmed_email"]["email"]
                 dbase_file_path = config["output_path"]["db_files"]
                 blast_exe = config["executables"]["blast"]
                 blast_db = config["executables"]["blastdb_path"]
                 fpocket_exe = config["executables"]["fpocket"]
+                hcache.configure_from(config, offline=args.offline)
+                swissprot_file = args.swissprot or config.get(
+                    "uniprot", "swissprot_file", fallback=None
+                )
                 break
         else:
             todo = ["targetdb", "chembl", "email", "db_files", "blast", "fpocket"]
@@ -2428,6 +2743,11 @@ def main():
                 config.write(cfile)
             update_config = False
 
+    if args.migrate_db:
+        tinit.migrate_db(targetDB)
+        if not (args.gene or args.in_file or args.list_genes or args.do_all):
+            return
+
     while True:
         if args.in_file:
             if Path(args.in_file).is_file():
@@ -2452,64 +2772,25 @@ def main():
             gene_df = g2id.gene_to_id_all(targetDB_path=targetDB)
             break
 
-    for g_id in gene_df.index:
-        if len(gene_df.uniprot_ids.loc[g_id]) == 0:
-            if args.verbose:
-                print(
-                    "[GENE SKIPPED]: No uniprot id was found for the entered gene name: ",
-                    gene_df.symbol.loc[g_id],
-                )
-        for uniprot_id in gene_df.uniprot_ids.loc[g_id]:
-            entries_in_db = get_list_entries(target_db_path=targetDB)
-            if uniprot_id in entries_in_db.index:
-                if args.update:
-                    if args.verbose:
-                        print(
-                            "[GENE INFO]: Target already present in database, updating informations"
-                        )
-                    activate_fk_sql = """PRAGMA foreign_keys = 1"""
-                    delete_sql = (
-                        """DELETE FROM Targets WHERE Target_id='%s'""" % uniprot_id
-                    )
-                    tdb = sqlite3.connect(targetDB)
-                    tdb.execute(activate_fk_sql)
-                    tdb.execute(delete_sql)
-                    tdb.commit()
-                    tdb.close()
-
-                    Target(
-                        gene_df.symbol.loc[g_id],
-                        uniprot_id=uniprot_id,
-                        ensembl_id=gene_df.ensembl_gene_id.loc[g_id],
-                        hgnc_id=g_id,
-                        db_files_path=dbase_file_path,
-                        chembl=chembl_24,
-                        target_db=targetDB,
-                        blast_cores=args.num_core,
-                        v=args.verbose,
-                    )
-                else:
-                    if args.verbose:
-                        print(
-                            "[GENE SKIPPED]: Already present in the database: "
-                            + gene_df.symbol.loc[g_id]
-                        )
-                        print(
-                            "======================================================================="
-                        )
-
-            else:
-                Target(
-                    gene_df.symbol.loc[g_id],
-                    uniprot_id=uniprot_id,
-                    ensembl_id=gene_df.ensembl_gene_id.loc[g_id],
-                    hgnc_id=g_id,
-                    db_files_path=dbase_file_path,
-                    chembl=chembl_24,
-                    target_db=targetDB,
-                    blast_cores=args.num_core,
-                    v=args.verbose,
-                )
+    swissprot = None
+    if swissprot_file:
+        swissprot = spidx.SwissProtIndex(swissprot_file).open()
+    context = bctx.BuildContext(
+        targetDB,
+        chembl_24,
+        db_files_path=dbase_file_path,
+        blast_exe=blast_exe,
+        blast_db=blast_db,
+        fpocket_exe=fpocket_exe,
+        num_core=args.num_core,
+        jobs=args.jobs,
+        verbose=args.verbose,
+        swissprot=swissprot,
+        pdb_downloader=pdl.downloader_from(config),
+        pocket_workers=args.pocket_workers,
+        fpocket_timeout=args.fpocket_timeout,
+    )
+    build_targets(gene_df, context, update=args.update)
 
 
 def entry_point():
@@ -2,10 +2,13 @@
 
 import argparse
 import configparser
+import multiprocessing
+import os
 import re
-import sqlite3
 import sys
 import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
 
 try:
@@ -24,17 +27,26 @@ import target_features as tf
 from utils import config as cf
 from utils import retryers as ret
 from utils import gene2id as g2id
+from utils import pubmed_counts as pmc
+from utils import sqlite_pool as sqlp
 from utils import druggability_ml as dml
 from utils import targetDB_gui as tgui
 
 ml_model = dml.generate_model()
 
+# Number of targets per descriptor worker task of the list reports
+LIST_CHUNK_SIZE = 100
+
+# PubMed search settings, read from the [pubmed_email] section of the config
+# file (optional keys mesh_term and api_key)
+pubmed_mesh_term = "Dementia"
+pubmed_api_key = None
+
 
 def get_list_entries():
-    connector = sqlite3.connect(targetDB)
+    connector = sqlp.connect(targetDB)
     query = "SELECT Target_id,Gene_name FROM Targets"
     entries_list = pd.read_sql(query, con=connector, index_col="Target_id")
-    connector.close()
     return entries_list
 
 
@@ -1016,11 +1028,13 @@ def get_single_excel(target):
                 )
                 pdb.operator = " " + pdb.operator
                 pdb["PDBbind_link"] = pdb["PDB_code"].apply(
-                    lambda x: '=HYPERLINK("http://www.pdbbind.org.cn/quickpdb.asp?quickpdb='
-                    + x
-                    + '","'
-                    + x
-                    + '")'
+                    lambda x: (
+                        '=HYPERLINK("http://www.pdbbind.org.cn/quickpdb.asp?quickpdb='
+                        + x
+                        + '","'
+                        + x
+                        + '")'
+                    )
                 )
                 pdb.loc[
                     pdb["type_of_binder"].isna() | (pdb["type_of_binder"] == ""),
@@ -1463,70 +1477,116 @@ def get_single_excel(target):
     return message
 
 
+def mesh_column():
+    return "number of %s publications" % pubmed_mesh_term
+
+
+def _pubmed_counts(list_targets):
+    """Total and MeSH term restricted PubMed counts of the genes of the list."""
+    counts = pmc.get_counts(
+        list_targets.symbol.unique(),
+        pubmed_email,
+        mesh_terms=(None, pubmed_mesh_term),
+        api_key=pubmed_api_key,
+    )
+    pubmed = {"Target_id": [], "total # publications": [], mesh_column(): []}
+    for gene_symbol in list_targets.index:
+        symbol = list_targets.symbol.loc[gene_symbol]
+        n_ids = len(list_targets.uniprot_ids.loc[gene_symbol])
+        pubmed["Target_id"].extend(list_targets.uniprot_ids.loc[gene_symbol])
+        pubmed[mesh_column()].extend([counts[(symbol, pubmed_mesh_term)]] * n_ids)
+        pubmed["total # publications"].extend([counts[(symbol, None)]] * n_ids)
+    return pd.DataFrame.from_dict(pubmed)
+
+
+def _list_descriptors(gene_ids):
+    """Descriptors of the list targets, computed by chunks in worker processes."""
+    chunks = [
+        gene_ids[start : start + LIST_CHUNK_SIZE]
+        for start in range(0, len(gene_ids), LIST_CHUNK_SIZE)
+    ]
+    if len(chunks) <= 1:
+        return td.get_descriptors_list(gene_ids, targetdb=targetDB)
+    workers = min(len(chunks), os.cpu_count() or 1)
+    # Spawned (not forked): the PubMed thread may already be running
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    ) as pool:
+        data = list(
+            pool.map(
+                partial(td.get_descriptors_list, targetdb=targetDB, use_cache=False),
+                chunks,
+            )
+        )
+    return pd.concat(data, ignore_index=True)
+
+
+def _timed(func, *args, **kwargs):
+    """Result of ``func`` and the time it took in seconds."""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def _stage_done(stage, start, detail=""):
+    """Print the duration of a stage, ``start`` being its own start time."""
+    _stage_report(stage, time.perf_counter() - start, detail)
+
+
+def _stage_report(stage, seconds, detail=""):
+    print("[EXPORT]: %s done%s (%.1fs)" % (stage, detail, seconds))
+
+
 def get_list_excel(list_targets, not_found=[]):
     not_in_db = {"Not present in DB": not_found}
     if list_targets.empty:
         return print("No genes that you entered are in the Database")
 
-    if pubmed_email:
-        pubmed = {
-            "Target_id": [],
-            "total # publications": [],
-            "number of Dementia publications": [],
-        }
-        for gene_symbol in list_targets.index:
-            pubmed["Target_id"].extend(list_targets.uniprot_ids.loc[gene_symbol])
-            pubmed["number of Dementia publications"].extend(
-                [
-                    pubmed_search(
-                        list_targets.symbol.loc[gene_symbol],
-                        pubmed_email,
-                        return_number=True,
-                        mesh_term="Dementia",
-                    )
-                ]
-                * len(list_targets.uniprot_ids.loc[gene_symbol])
-            )
-            pubmed["total # publications"].extend(
-                [
-                    pubmed_search(
-                        list_targets.symbol.loc[gene_symbol],
-                        pubmed_email,
-                        return_number=True,
-                    )
+    # The PubMed counts (network bound) run in a thread pool while the
+    # descriptors are computed in worker processes and the targets scored
+    gene_ids = [uid for ids in list_targets.uniprot_ids for uid in ids]
+    with ThreadPoolExecutor(max_workers=1) as pubmed_pool:
+        if pubmed_email:
+            pubmed_future = pubmed_pool.submit(_timed, _pubmed_counts, list_targets)
+
+        start = time.perf_counter()
+        data = _list_descriptors(gene_ids)
+        _stage_done("Descriptors", start, " for %d targets" % len(data))
+
+        start = time.perf_counter()
+
+        tscore = td.target_scores(data)
+        druggability_pred = dml.predict(ml_model, tscore.score_components)
+        drug_proba = pd.DataFrame(
+            dml.predict_prob(ml_model, tscore.score_components),
+            columns=ml_model.classes_,
+        )
+        tscore.scores["Tractability_probability"] = round(drug_proba[1] * 100, 2)
+        tscore.scores["Tractable"] = np.where(
+            tscore.scores["Tractability_probability"] >= 60,
+            "Tractable",
+            np.where(
+                tscore.scores["Tractability_probability"] >= 40,
+                "Challenging",
+                "Intractable",
+            ),
+        )
+        tscore.scores["In_training_set"] = dml.in_training_set(tscore.score_components)
+        _stage_done("Scoring", start)
+
+        if pubmed_email:
+            pubmed, seconds = pubmed_future.result()
+            _stage_report("PubMed counts", seconds, " for %d genes" % len(list_targets))
+        else:
+            pubmed = pd.DataFrame(
+                columns=[
+                    "Target_id",
+                    "total # publications",
+                    mesh_column(),
                 ]
-                * len(list_targets.uniprot_ids.loc[gene_symbol])
             )
-        # TODO: Mesh term is hard-coded here
-        pubmed = pd.DataFrame.from_dict(pubmed)
-    else:
-        pubmed = pd.DataFrame(
-            columns=[
-                "Target_id",
-                "total # publications",
-                "number of Dementia publications",
-            ]
-        )
 
-    gene_ids = "','".join(list_targets.uniprot_ids.astype(str))
-    gene_ids = gene_ids.replace("['", "").replace("']", "")
-    data = td.get_descriptors_list(gene_ids, targetdb=targetDB)
-    tscore = td.target_scores(data)
-    druggability_pred = dml.predict(ml_model, tscore.score_components)
-    drug_proba = pd.DataFrame(
-        dml.predict_prob(ml_model, tscore.score_components), columns=ml_model.classes_
-    )
-    tscore.scores["Tractability_probability"] = round(drug_proba[1] * 100, 2)
-    tscore.scores["Tractable"] = np.where(
-        tscore.scores["Tractability_probability"] >= 60,
-        "Tractable",
-        np.where(
-            tscore.scores["Tractability_probability"] >= 40,
-            "Challenging",
-            "Intractable",
-        ),
-    )
-    tscore.scores["In_training_set"] = dml.in_training_set(tscore.score_components)
+    start = time.perf_counter()
     data = data.merge(tscore.scores, on="Target_id", how="left")
     data = data.merge(pubmed, on="Target_id", how="left")
     list_done = data.Target_id.values.tolist()
@@ -1593,7 +1653,7 @@ def get_list_excel(list_targets, not_found=[]):
         "count_patents_max_year",
         "novelty_score",
         "total # publications",
-        "number of Dementia publications",
+        mesh_column(),
         "Brain",
         "Connective & soft tissue",
         "Bone marrow & lymphoid tissues",
@@ -1826,6 +1886,7 @@ def get_list_excel(list_targets, not_found=[]):
 
     not_in_db.to_excel(writer, "Not in DB", index=False)
     writer.close()
+    _stage_done("Excel report", start)
     print(
         "[EXPORT]: Excel file: ",
         "[Export_" + str(len(data)) + "_entries_" + t + ".xlsx]",
@@ -1905,6 +1966,8 @@ def get_global_param():
         output_single_path, \
         targetDB, \
         pubmed_email, \
+        pubmed_mesh_term, \
+        pubmed_api_key, \
         list_of_entries
 
     parameters = tgui.config_gui(get_only=True)
@@ -1919,6 +1982,8 @@ def get_global_param():
 
     targetDB = parameters.config["database_path"]["targetdb"]
     pubmed_email = parameters.config["pubmed_email"]["email"]
+    pubmed_mesh_term = parameters.config["pubmed_email"].get("mesh_term", "Dementia")
+    pubmed_api_key = parameters.config["pubmed_email"].get("api_key", "") or None
 
     list_of_entries = get_list_entries()
 
@@ -1933,6 +1998,8 @@ def main():
         output_single_path, \
         targetDB, \
         pubmed_email, \
+        pubmed_mesh_term, \
+        pubmed_api_key, \
         list_of_entries
     args = parse_args()
     update_config = args.update_config
@@ -1971,6 +2038,8 @@ def main():
 
                 targetDB = config["database_path"]["targetdb"]
                 pubmed_email = config["pubmed_email"]["email"]
+                pubmed_mesh_term = config["pubmed_email"].get("mesh_term", "Dementia")
+                pubmed_api_key = config["pubmed_email"].get("api_key", "") or None
                 break
         else:
             config = cf.get_config_from_user(
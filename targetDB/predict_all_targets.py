@@ -3,16 +3,26 @@
 
 This script loads the SQLite database used by TargetDB, computes the
 descriptors for every target, applies the druggability machine-learning
-model and writes the resulting scores to a CSV file. Only fields derived
-from the model and the high-level scores are written; all other data in
-the report generated by ``druggability_report.py`` are retrieved
-directly from the database.
+model and writes the resulting scores to a CSV (or Parquet) file. Only
+fields derived from the model and the high-level scores are written; all
+other data in the report generated by ``druggability_report.py`` are
+retrieved directly from the database.
+
+With ``--stream`` the scores are written chunk by chunk as they are
+computed, so memory use stays flat and a crash only loses the chunks in
+progress. Streamed runs keep a checkpoint next to the output file
+(``<output>.checkpoint.sqlite``) recording the targets scored, with the
+model and database they were scored with: ``--resume`` continues an
+interrupted run and ``--since`` only rescores the targets modified since
+the last completed run.
 """
 
 import argparse
 import os
 import sqlite3
-from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime, timezone
+from pathlib import Path
 import warnings
 
 # Suppress pandas warnings
@@ -25,11 +35,15 @@ from tqdm import tqdm
 
 import target_descriptors as td
 from utils import druggability_ml as dml
+from utils import sqlite_pool as sqlp
 
 
 _MODEL = None
 _DB_PATH = None
 
+# Number of targets scored together in one descriptor/model pass
+DEFAULT_CHUNK_SIZE = 2000
+
 
 def _init_worker(db_path: str):
     """Initialise global model and database path for worker processes."""
@@ -38,9 +52,22 @@ def _init_worker(db_path: str):
     _DB_PATH = db_path
 
 
-def _predict_one(target_id: str) -> pd.DataFrame:
-    """Calculate scores for a single target identifier."""
-    data = td.get_descriptors_list(target_id, targetdb=_DB_PATH)
+def _chunks(items: list, size: int):
+    """Yield successive ``size`` long slices of ``items``."""
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def _predict_chunk(target_ids: list) -> pd.DataFrame:
+    """Calculate scores for a chunk of target identifiers in one pass.
+
+    Every descriptor query is run once for the whole chunk and the scores
+    and model probabilities are computed on the resulting DataFrame.
+    """
+    # Every target is read once: the descriptor cache would only be written
+    data = td.get_descriptors_list(
+        "','".join(target_ids), targetdb=_DB_PATH, use_cache=False
+    )
     tscore = td.target_scores(data, mode="programmatic")
     proba = pd.DataFrame(
         dml.predict_prob(_MODEL, tscore.score_components), columns=_MODEL.classes_
@@ -59,13 +86,19 @@ def _predict_one(target_id: str) -> pd.DataFrame:
     return tscore.scores
 
 
-def run_predictions(db_path: str, workers: int = None) -> pd.DataFrame:
+def run_predictions(
+    db_path: str, workers: int | None = None, chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> pd.DataFrame:
     """Compute tractability predictions for all targets.
 
     Parameters
     ----------
     db_path: str
         Path to the TargetDB SQLite database.
+    workers: int, optional
+        Number of worker processes (default: CPU count).
+    chunk_size: int, optional
+        Number of targets scored together by a worker in a single pass.
 
     Returns
     -------
@@ -74,21 +107,20 @@ def run_predictions(db_path: str, workers: int = None) -> pd.DataFrame:
         scores including the tractability probability.
     """
     # Recover the list of all target identifiers from the database
-    conn = sqlite3.connect(db_path)
-    try:
-        ids = pd.read_sql("SELECT Target_id,Gene_name FROM Targets", conn)
-    finally:
-        conn.close()
+    ids = pd.read_sql("SELECT Target_id,Gene_name FROM Targets", sqlp.connect(db_path))
 
     workers = workers or os.cpu_count() or 1
+    chunk_size = max(1, chunk_size or DEFAULT_CHUNK_SIZE)
+    chunks = list(_chunks(ids["Target_id"].astype(str).tolist(), chunk_size))
     with ProcessPoolExecutor(
         max_workers=workers, initializer=_init_worker, initargs=(db_path,)
     ) as pool:
         results = list(
             tqdm(
-                pool.map(_predict_one, ids["Target_id"].astype(str)),
-                total=len(ids),
+                pool.map(_predict_chunk, chunks),
+                total=len(chunks),
                 desc="Scoring targets",
+                unit="chunk",
             )
         )
 
@@ -97,6 +129,342 @@ def run_predictions(db_path: str, workers: int = None) -> pd.DataFrame:
     return result
 
 
+def _imap_unordered(pool, func, items: list, max_in_flight: int):
+    """Yield ``(index, func(items[index]))`` in completion order.
+
+    Besides the result being consumed, at most ``max_in_flight`` items are
+    submitted to ``pool`` at any time, so results do not pile up in memory.
+    """
+    to_submit = iter(range(len(items)))
+    pending = {}
+
+    def submit_next():
+        for index in to_submit:
+            pending[pool.submit(func, items[index])] = index
+            return
+
+    for _ in range(max(1, max_in_flight)):
+        submit_next()
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            index = pending.pop(future)
+            submit_next()
+            yield index, future.result()
+
+
+def iter_predictions(
+    db_path: str,
+    workers: int | None = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    max_in_flight: int | None = None,
+    since: str | None = None,
+    exclude=None,
+):
+    """Yield the predictions chunk by chunk, in completion order.
+
+    Each DataFrame holds the target identifiers, gene names and scores of one
+    chunk of targets. ``max_in_flight`` (default: twice the number of workers)
+    bounds the number of chunks being computed or waiting to be consumed.
+    Only the targets modified after ``since`` (``Targets.Date_modified``) are
+    scored when it is given, and targets in ``exclude`` are skipped.
+    """
+    if since:
+        ids = pd.read_sql(
+            "SELECT Target_id,Gene_name FROM Targets WHERE Date_modified > :since",
+            sqlp.connect(db_path),
+            params={"since": since},
+        )
+    else:
+        ids = pd.read_sql(
+            "SELECT Target_id,Gene_name FROM Targets", sqlp.connect(db_path)
+        )
+    ids["Target_id"] = ids["Target_id"].astype(str)
+    if exclude:
+        ids = ids[~ids["Target_id"].isin(exclude)].reset_index(drop=True)
+
+    workers = workers or os.cpu_count() or 1
+    chunk_size = max(1, chunk_size or DEFAULT_CHUNK_SIZE)
+    max_in_flight = max_in_flight or 2 * workers
+    chunks = [
+        ids.iloc[start : start + chunk_size] for start in range(0, len(ids), chunk_size)
+    ]
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(db_path,)
+    ) as pool:
+        for index, scores in tqdm(
+            _imap_unordered(
+                pool,
+                _predict_chunk,
+                [chunk["Target_id"].tolist() for chunk in chunks],
+                max_in_flight,
+            ),
+            total=len(chunks),
+            desc="Scoring targets",
+            unit="chunk",
+        ):
+            yield chunks[index].merge(scores, on="Target_id", how="left")
+
+
+def _truncate_partial_line(path, block_size: int = 1 << 16):
+    """Cut the file after its last newline (a row an interrupted run left unfinished)."""
+    with open(path, "r+b") as handle:
+        end = handle.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            start = max(0, position - block_size)
+            handle.seek(start)
+            newline = handle.read(position - start).rfind(b"\n")
+            if newline != -1:
+                position = start + newline + 1
+                break
+            position = start
+        if position != end:
+            handle.truncate(position)
+
+
+class _CsvWriter:
+    def __init__(self, path, append=False):
+        self.path = Path(path)
+        if append and self.path.is_file():
+            _truncate_partial_line(self.path)
+        self.header = not (append and self.path.is_file() and self.path.stat().st_size)
+        self.mode = "a" if append else "w"
+
+    def write(self, data: pd.DataFrame):
+        data.to_csv(self.path, mode=self.mode, header=self.header, index=False)
+        self.header = False
+        self.mode = "a"
+
+    def close(self):
+        if self.mode == "w":
+            # no chunk written: leave an empty file rather than none
+            self.path.write_text("")
+
+
+class _ParquetWriter:
+    def __init__(self, path, append=False):
+        if append:
+            raise ValueError(
+                "A Parquet output cannot be appended to, use a CSV output with "
+                "--resume/--since"
+            )
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError(
+                "Parquet output requires the pyarrow package, install the "
+                "'parquet' extra: pip install 'targetdb[parquet]'"
+            )
+        self.pa = pa
+        self.pq = pq
+        self.path = Path(path)
+        self.writer = None
+
+    def write(self, data: pd.DataFrame):
+        if self.writer is None:
+            table = self.pa.Table.from_pandas(data, preserve_index=False)
+            self.writer = self.pq.ParquetWriter(str(self.path), table.schema)
+        else:
+            # later chunks must follow the schema of the first one
+            table = self.pa.Table.from_pandas(
+                data, schema=self.writer.schema, preserve_index=False
+            )
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+class Checkpoint:
+    """Sidecar SQLite store of the targets scored into an output file.
+
+    Targets are recorded with the key of the model and the modification time
+    of the database they were scored with, after their chunk was written.
+    """
+
+    def __init__(self, path):
+        self.connector = sqlite3.connect(str(path))
+        self.connector.executescript(
+            """CREATE TABLE IF NOT EXISTS scored
+(
+Target_id varchar(50) not null,
+model_key varchar(50) not null,
+db_mtime  float       not null,
+scored_at timestamp   default CURRENT_TIMESTAMP not null,
+primary key (Target_id)
+);
+CREATE TABLE IF NOT EXISTS runs
+(
+run_id    integer primary key autoincrement,
+started   timestamp   not null,
+finished  timestamp   default NULL,
+model_key varchar(50) not null,
+db_mtime  float       not null,
+since     timestamp   default NULL,
+n_targets integer     default NULL
+);"""
+        )
+
+    @staticmethod
+    def path_for(output):
+        return Path(str(output) + ".checkpoint.sqlite")
+
+    def scored(self, model_key, db_mtime):
+        """Target_ids already scored with this model on this database."""
+        return {
+            row[0]
+            for row in self.connector.execute(
+                "SELECT Target_id FROM scored WHERE model_key=? AND db_mtime=?",
+                (model_key, db_mtime),
+            )
+        }
+
+    def last_run(self):
+        """Start time of the last completed run (None when there was none)."""
+        row = self.connector.execute(
+            "SELECT max(started) FROM runs WHERE finished IS NOT NULL"
+        ).fetchone()
+        return row[0]
+
+    def start_run(self, model_key, db_mtime, since=None, reset=False):
+        with self.connector:
+            if reset:
+                self.connector.execute("DELETE FROM scored")
+            cursor = self.connector.execute(
+                "INSERT INTO runs (started, model_key, db_mtime, since) VALUES (?,?,?,?)",
+                (_now(), model_key, db_mtime, since),
+            )
+        return cursor.lastrowid
+
+    def mark(self, target_ids, model_key, db_mtime):
+        with self.connector:
+            self.connector.executemany(
+                "INSERT OR REPLACE INTO scored (Target_id, model_key, db_mtime) "
+                "VALUES (?,?,?)",
+                ((target_id, model_key, db_mtime) for target_id in target_ids),
+            )
+
+    def finish_run(self, run_id, n_targets):
+        with self.connector:
+            self.connector.execute(
+                "UPDATE runs SET finished=?, n_targets=? WHERE run_id=?",
+                (_now(), n_targets, run_id),
+            )
+
+    def close(self):
+        self.connector.close()
+
+
+def _now():
+    # Same format as the CURRENT_TIMESTAMP defaults (UTC) of Targets.Date_modified
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _compact_csv(output, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """Keep the last row written for each target of the CSV ``output``.
+
+    The file is read by chunks of ``chunk_size`` rows, as text so the kept
+    rows are copied unchanged: a first pass finds the last row of every
+    target (only the Target_ids are held in memory), a second one copies
+    those rows.
+    """
+    output = Path(output)
+    if not output.is_file() or not output.stat().st_size:
+        return
+
+    def read():
+        return pd.read_csv(
+            output, dtype=str, keep_default_na=False, chunksize=chunk_size
+        )
+
+    last_row = {}
+    n_rows = 0
+    for chunk in read():
+        last_row.update(zip(chunk["Target_id"], range(n_rows, n_rows + len(chunk))))
+        n_rows += len(chunk)
+    if len(last_row) == n_rows:
+        return
+    keep = np.zeros(n_rows, dtype=bool)
+    keep[list(last_row.values())] = True
+    del last_row
+
+    tmp_path = output.with_name(output.name + ".tmp")
+    writer = _CsvWriter(tmp_path)
+    start = 0
+    for chunk in read():
+        writer.write(chunk[keep[start : start + len(chunk)]])
+        start += len(chunk)
+    writer.close()
+    os.replace(tmp_path, output)
+
+
+def stream_predictions(
+    db_path: str,
+    output: str,
+    workers: int | None = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    max_in_flight: int | None = None,
+    resume: bool = False,
+    since: str | None = None,
+) -> int:
+    """Write the predictions to ``output`` as the chunks are completed.
+
+    The format is Parquet for a ``.parquet``/``.pq`` output and CSV otherwise.
+    Rows are in completion order rather than database order.
+
+    With ``resume`` the targets already scored into ``output`` (same model and
+    database) are skipped. ``since`` only rescores the targets modified after
+    that date; ``since="last"`` uses the start of the last completed run. In
+    both cases the new rows are added to the existing CSV output, which keeps
+    one row (the latest) per target once the run completes.
+    Returns the number of targets written.
+    """
+    checkpoint = Checkpoint(Checkpoint.path_for(output))
+    try:
+        model_key = dml.model_key()
+        db_mtime = os.path.getmtime(db_path)
+        if since == "last":
+            since = checkpoint.last_run()
+            if since is None:
+                # Not a reason to rescore everything into the existing output
+                raise ValueError(
+                    "No completed run recorded for %s: give the date to rescore "
+                    "the targets modified since" % output
+                )
+        update = bool(resume or since)
+        exclude = checkpoint.scored(model_key, db_mtime) if resume else None
+
+        if Path(output).suffix.lower() in (".parquet", ".pq"):
+            writer = _ParquetWriter(output, append=update)
+        else:
+            writer = _CsvWriter(output, append=update)
+        run_id = checkpoint.start_run(model_key, db_mtime, since, reset=not update)
+        n_targets = 0
+        try:
+            for predictions in iter_predictions(
+                db_path,
+                workers=workers,
+                chunk_size=chunk_size,
+                max_in_flight=max_in_flight,
+                since=since,
+                exclude=exclude,
+            ):
+                writer.write(predictions)
+                checkpoint.mark(predictions["Target_id"], model_key, db_mtime)
+                n_targets += len(predictions)
+        finally:
+            writer.close()
+        if update:
+            _compact_csv(output)
+        checkpoint.finish_run(run_id, n_targets)
+    finally:
+        checkpoint.close()
+    return n_targets
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(
         description="Run tractability predictions for all proteins in the database."
@@ -109,9 +477,54 @@ def main() -> None:
         type=int,
         help="Number of worker processes (default: CPU count)",
     )
+    parser.add_argument(
+        "-c",
+        "--chunk-size",
+        type=int,
+        default=DEFAULT_CHUNK_SIZE,
+        help="Number of targets scored together in one pass (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-s",
+        "--stream",
+        action="store_true",
+        help="Write the scores chunk by chunk as they are computed (rows are then "
+        "not in database order); use a .parquet output for Parquet",
+    )
+    parser.add_argument(
+        "-r",
+        "--resume",
+        action="store_true",
+        help="Continue an interrupted --stream run into the same output, skipping the "
+        "targets already scored (implies --stream)",
+    )
+    parser.add_argument(
+        "--since",
+        nargs="?",
+        const="last",
+        metavar="DATE",
+        help="Only rescore the targets modified after DATE (YYYY-MM-DD[ HH:MM:SS], "
+        "UTC) or, without DATE, since the last completed run, updating their rows in "
+        "the CSV output (implies --stream)",
+    )
     args = parser.parse_args()
 
-    predictions = run_predictions(args.database, workers=args.workers)
+    if args.stream or args.resume or args.since:
+        try:
+            stream_predictions(
+                args.database,
+                args.output,
+                workers=args.workers,
+                chunk_size=args.chunk_size,
+                resume=args.resume,
+                since=args.since,
+            )
+        except ValueError as error:
+            parser.error(str(error))
+        return
+    predictions = run_predictions(
+        args.database, workers=args.workers, chunk_size=args.chunk_size
+    )
     predictions.to_csv(args.output, index=False)
 
 
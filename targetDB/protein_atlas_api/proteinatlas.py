@@ -1,12 +1,12 @@
 #!/usr/bin/env python
 
 import requests
-import urllib.request as urllib
 from urllib.error import *
 import xmltodict
 import numpy as np
 from operator import itemgetter
 import utils.retryers as ret
+import utils.http_cache as hcache
 
 # GENERAL DICTIONARIES
 
@@ -42,7 +42,7 @@ def gene_name_to_ensemblid(gene_name, alt=False):
         base_url + gene_name + "?content-type=application/json;format=condensed"
     )
     try:
-        request = requests.get(constructed_request)
+        request = hcache.get(constructed_request, "ensembl")
     except HTTPError:
         return None
     if not request.ok:
@@ -59,10 +59,11 @@ def get_xml(ensemblid):
 
 def _parse_xml(xml_URL):
     try:
-        xml_online = urllib.urlopen(xml_URL)
-        xml_dict = xmltodict.parse(xml_online.read())
+        xml_online = hcache.get(xml_URL, "proteinatlas")
+        xml_online.raise_for_status()
+        xml_dict = xmltodict.parse(xml_online.content)
         return xml_dict
-    except (HTTPError, URLError):
+    except requests.exceptions.RequestException:
         return None
 
 
@@ -3,8 +3,6 @@ import pandas as pd
 import numpy as np
 import io
 import sqlite3
-import math
-import scipy.stats as sc
 import warnings
 
 # Suppress all pandas FutureWarnings
@@ -23,6 +21,10 @@ if platform == "darwin":
 import matplotlib.pyplot as plt
 from operator import itemgetter
 
+from utils import sqlite_pool as sqlp
+from utils import descriptor_cache as dcache
+from utils import ligand_selectivity as lsel
+
 
 def norm_min_max(df, df_min=0.0, df_max=1.0):
     return ((df - df_min) * 1.0 / (df_max - df_min)).clip(0, 1)
@@ -32,28 +34,6 @@ def norm_min_median(df, median):
     return ((df - 0) * 1.0 / (median - 0)).clip(0, 1)
 
 
-class StdevFunc:
-    def __init__(self):
-        self.M = 0.0
-        self.S = 0.0
-        self.k = 1
-
-    def step(self, value):
-        if value is None:
-            return
-        tM = self.M
-        self.M += (value - tM) / self.k
-        self.S += (value - tM) * (value - self.M)
-        self.k += 1
-
-    def finalize(self):
-        if self.k == 2:
-            return 0
-        elif self.k < 3:
-            return None
-        return math.sqrt(self.S / (self.k - 2))
-
-
 class target_scores:
     def __init__(self, data, mode="list"):
         self.mode = mode
@@ -618,17 +598,60 @@ def remove_overlap(ranges):
     return merged
 
 
-def get_descriptors_list(target_id, targetdb=None):
-    connector_targetDB = sqlite3.connect(targetdb)
-    connector_targetDB.create_aggregate("stddev", 1, StdevFunc)
+def get_descriptors_list(target_id, targetdb=None, use_cache=True):
+    """Descriptors of the targets, read from the descriptor cache when up to date.
+
+    Only the targets missing from the cache, or whose Date_modified changed since
+    they were cached, are computed (compute_descriptors_list) and then cached.
+    """
+    if not use_cache:
+        return compute_descriptors_list(target_id, targetdb=targetdb)
+    try:
+        # Taken before reading: a change of the file during the computation
+        # must not be recorded as the version the rows come from
+        stamp = dcache.db_stamp(targetdb)
+    except OSError:
+        return compute_descriptors_list(target_id, targetdb=targetdb)
+    modified = pd.read_sql(
+        "SELECT Target_id,Date_modified FROM Targets "
+        "WHERE Target_id IN (SELECT value FROM json_each(:ids))",
+        con=sqlp.connect(targetdb),
+        params={"ids": sqlp.ids_param(target_id)},
+    )
+    if modified.empty:
+        return compute_descriptors_list(target_id, targetdb=targetdb)
+    try:
+        cached, stale = dcache.get(targetdb, modified, stamp=stamp)
+    except (OSError, sqlite3.Error):
+        return compute_descriptors_list(target_id, targetdb=targetdb)
+    if not stale:
+        data = cached
+    else:
+        computed = compute_descriptors_list(stale, targetdb=targetdb)
+        try:
+            dcache.put(targetdb, computed, modified, stamp=stamp)
+        except (OSError, sqlite3.Error):
+            pass
+        data = (
+            pd.concat([cached, computed], ignore_index=True)
+            if len(cached)
+            else computed
+        )
+    # Same (database) order as the computed descriptors
+    order = {target_id: i for i, target_id in enumerate(modified.Target_id)}
+    return data.sort_values(
+        by="Target_id", key=lambda ids: ids.map(order), ignore_index=True
+    )
+
+
+def compute_descriptors_list(target_id, targetdb=None):
+    connector_targetDB = sqlp.connect(targetdb)
+    target_ids = {"ids": sqlp.ids_param(target_id)}
     list_queries = {
-        "gen_info": """SELECT * FROM Targets WHERE Target_id in ('%s')""" % target_id,
-        "disease": """SELECT Target_id,disease_name,disease_id FROM disease WHERE Target_id in ('%s')"""
-        % target_id,
-        "reactome": """SELECT pathway_name,Target_id FROM pathways WHERE pathway_dataset='Reactome pathways data set' AND Target_id in ('%s')"""
-        % target_id,
-        "kegg": """SELECT Target_id,pathway_name FROM pathways WHERE pathway_dataset='KEGG pathways data set' AND Target_id in ('%s')"""
-        % target_id,
+        "gen_info": """SELECT * FROM Targets WHERE Target_id IN (SELECT value FROM json_each(:ids))""",
+        "disease": """SELECT Target_id,disease_name,disease_id FROM disease WHERE Target_id IN (SELECT value FROM json_each(:ids))""",
+        "reactome": """SELECT pathway_name,Target_id FROM pathways WHERE pathway_dataset='Reactome pathways data set' AND Target_id IN (SELECT value FROM json_each(:ids))""",
+        "kegg": """SELECT Target_id,pathway_name FROM pathways WHERE pathway_dataset='KEGG pathways data set' AND Target_id IN (SELECT value FROM json_each(:ids))""",
         "gwas": """SELECT
       Target_id,
       phenotype,
@@ -638,32 +661,28 @@ def get_descriptors_list(target_id, targetdb=None):
       publication_year as 'year',
       pubmed_id
     FROM gwas
-    WHERE Target_id in ('%s')
-    ORDER BY phenotype"""
-        % target_id,
+    WHERE Target_id IN (SELECT value FROM json_each(:ids))
+    ORDER BY phenotype""",
         "selectivity": """SELECT
     Target_id,
     Selectivity_entropy
     FROM protein_expression_selectivity
-    WHERE Target_id in ('%s')"""
-        % target_id,
+    WHERE Target_id IN (SELECT value FROM json_each(:ids))""",
         "tissue_expression": """SELECT Target_id,
       organ,
       tissue,
       cell,
       value
       FROM protein_expression_levels
-      WHERE Target_id in ('%s')"""
-        % target_id,
+      WHERE Target_id IN (SELECT value FROM json_each(:ids))""",
         "phenotype": """SELECT Target_id,
       Allele_symbol,
       Allele_type,
       CASE WHEN zygosity is null THEN 'NOT DECLARED' ELSE UPPER(zygosity) END AS zygosity,
       genotype,
       Phenotype
-    FROM phenotype WHERE Target_id in ('%s')
-    ORDER BY Allele_id,zygosity,genotype"""
-        % target_id,
+    FROM phenotype WHERE Target_id IN (SELECT value FROM json_each(:ids))
+    ORDER BY Allele_id,zygosity,genotype""",
         "isoforms": """SELECT I.Target_id,
       (T.Gene_name||'-'||I.Isoform_name) as isoform_name,
       I.Isoform_id,
@@ -674,8 +693,7 @@ def get_descriptors_list(target_id, targetdb=None):
     FROM Isoforms I
     LEFT JOIN Targets T
       ON I.Target_id = T.Target_id
-    WHERE I.Target_id in ('%s') ORDER BY I.Canonical DESC"""
-        % target_id,
+    WHERE I.Target_id IN (SELECT value FROM json_each(:ids)) ORDER BY I.Canonical DESC""",
         "var": """SELECT M.Target_id,
       M.start,
       M.stop,
@@ -685,8 +703,7 @@ def get_descriptors_list(target_id, targetdb=None):
       M.domains AS in_domains,
       M.comment AS comments
     FROM modifications M
-    WHERE M.mod_type = 'VAR' AND M.Target_id in ('%s')"""
-        % target_id,
+    WHERE M.mod_type = 'VAR' AND M.Target_id IN (SELECT value FROM json_each(:ids))""",
         "mut": """SELECT M.Target_id,
       M.start,
       M.stop,
@@ -696,8 +713,7 @@ def get_descriptors_list(target_id, targetdb=None):
       M.domains AS in_domains,
       M.comment AS comments
     FROM modifications M
-    WHERE M.mod_type = 'MUTAGEN' AND M.Target_id in ('%s')"""
-        % target_id,
+    WHERE M.mod_type = 'MUTAGEN' AND M.Target_id IN (SELECT value FROM json_each(:ids))""",
         "domains": """SELECT
       Target_id,
       Domain_name,
@@ -706,8 +722,7 @@ def get_descriptors_list(target_id, targetdb=None):
       length,
       source_name as source
     FROM Domain_targets
-    WHERE Target_id in ('%s')"""
-        % target_id,
+    WHERE Target_id IN (SELECT value FROM json_each(:ids))""",
         "pdb_blast": """SELECT Query_target_id,
       Hit_PDB_code as PDB_code,
       Chain_Letter as Chain,
@@ -719,10 +734,9 @@ def get_descriptors_list(target_id, targetdb=None):
     FROM `3D_Blast`
       LEFT JOIN drugEbility_sites DS
       ON DS.pdb_code=Hit_PDB_code
-    WHERE Query_target_id in ('%s')
+    WHERE Query_target_id IN (SELECT value FROM json_each(:ids))
     GROUP BY Query_target_id,Hit_PDB_code
-    ORDER BY similarity DESC"""
-        % target_id,
+    ORDER BY similarity DESC""",
         "pdb": """SELECT
       C.Target_id,
       C.PDB_code,
@@ -752,9 +766,8 @@ def get_descriptors_list(target_id, targetdb=None):
         ON B.pdb_code = C.PDB_code
       LEFT JOIN drugEbility_sites DS
         ON DS.pdb_code = LOWER(C.PDB_code)
-    WHERE C.Target_id in ('%s')
-    GROUP BY C.Target_id,C.PDB_code,P.Technique,P.Resolution,C.n_residues,C.start_stop"""
-        % target_id,
+    WHERE C.Target_id IN (SELECT value FROM json_each(:ids))
+    GROUP BY C.Target_id,C.PDB_code,P.Technique,P.Resolution,C.n_residues,C.start_stop""",
         "pockets": """SELECT
       F.Target_id,
       F.PDB_code,
@@ -770,11 +783,9 @@ def get_descriptors_list(target_id, targetdb=None):
         ON F.Pocket_id = Domain.Pocket_id
       LEFT JOIN Domain_targets D
         ON Domain.Domain_id=D.domain_id
-    WHERE F.Target_id in ('{target}')
+    WHERE F.Target_id IN (SELECT value FROM json_each(:ids))
     AND F.druggable='TRUE' AND F.blast='FALSE'
-    GROUP BY F.Target_id,F.PDB_code,F.DrugScore,F.total_sasa,F.volume,fraction_apolar,pocket_number,pocket_score""".format(
-            target=target_id
-        ),
+    GROUP BY F.Target_id,F.PDB_code,F.DrugScore,F.total_sasa,F.volume,fraction_apolar,pocket_number,pocket_score""",
         "alt_pockets": """SELECT F.Target_id,
       F.PDB_code,
       F.DrugScore as alt_druggability_score,
@@ -790,10 +801,9 @@ def get_descriptors_list(target_id, targetdb=None):
       LEFT JOIN `3D_Blast` B
         ON F.Target_id = B.Query_target_id AND F.PDB_code = B.Hit_PDB_code
 
-    WHERE F.Target_id in ('%s')
+    WHERE F.Target_id IN (SELECT value FROM json_each(:ids))
     AND F.druggable='TRUE' AND F.blast='TRUE'
-    ORDER BY B.similarity DESC"""
-        % target_id,
+    ORDER BY B.similarity DESC""",
         "bioactives": """SELECT C.target_id as Target_id,
     B.lig_id,
       B.assay_id,
@@ -838,10 +848,9 @@ def get_descriptors_list(target_id, targetdb=None):
       ON B.lig_id=L.lig_id
       LEFT JOIN assays A
       ON B.assay_id=A.assay_id
-    WHERE C.target_id in ('%s')
+    WHERE C.target_id IN (SELECT value FROM json_each(:ids))
     AND B.operator!='>' AND B.operator!='<'
-    AND A.confidence_score>=8"""
-        % target_id,
+    AND A.confidence_score>=8""",
         "commercials": """SELECT target_id,
     smiles,
     affinity_type,
@@ -851,8 +860,7 @@ def get_descriptors_list(target_id, targetdb=None):
     price,
     website
     FROM purchasable_compounds
-    WHERE target_id in ('%s')"""
-        % target_id,
+    WHERE target_id IN (SELECT value FROM json_each(:ids))""",
         "bindingDB": """SELECT B.target_id,
       B.ligand_name,
       B.ZincID,
@@ -891,25 +899,22 @@ def get_descriptors_list(target_id, targetdb=None):
     FROM BindingDB B
       LEFT JOIN ligands L
       ON B.inchi_key = L.std_inchi_key
-    WHERE target_id in ('%s')"""
-        % target_id,
+    WHERE target_id IN (SELECT value FROM json_each(:ids))""",
         "domain_drugE": """SELECT Target_id,
                         max(tractable) tractable,
                         max(druggable) druggable
                     FROM
                     (SELECT DISTINCT LOWER(PDB_code) as pdb_codes,Target_id
                         FROM PDB_Chains
-                        WHERE target_id in ('%s')) T
+                        WHERE target_id IN (SELECT value FROM json_each(:ids))) T
                     LEFT JOIN drugEbility_domains
                     ON pdb_code = T.pdb_codes
-                    GROUP BY Target_id"""
-        % target_id,
-        "opentargets": """SELECT * FROM opentarget_association WHERE target_id in ('%s')"""
-        % target_id,
+                    GROUP BY Target_id""",
+        "opentargets": """SELECT * FROM opentarget_association WHERE target_id IN (SELECT value FROM json_each(:ids))""",
     }
 
     results = {
-        qname: pd.read_sql(query, con=connector_targetDB)
+        qname: pd.read_sql(query, con=connector_targetDB, params=target_ids)
         for qname, query in list_queries.items()
     }
     # ================================================================================================================#
@@ -1617,62 +1622,23 @@ def get_descriptors_list(target_id, targetdb=None):
     best = best[best["standard_type"].isin(["Ki", "Kd"])]
     if not best.empty:
         best["pX"].fillna(-np.log10(best.value_num / 1000000000), inplace=True)
-        query_lig = "','".join(best.lig_id.unique())
-        query = (
-            """SELECT
-                    B.lig_id,
-                    B.Target_id,
-                    B.target_name,
-                    ROUND(AVG(B.value_num),2) avg_value,
-                    ROUND(STDDEV(B.value_num),2) sttdev,
-                    COUNT(*) n_values
-                    FROM bioactivities B
-                      LEFT JOIN assays A
-                      ON B.assay_id=A.assay_id
-                    WHERE B.operator='=' 
-                      AND B.lig_id in ('%s')
-                      AND A.bioactivity_type='Binding'
-                      AND UPPER(B.standard_type) in ('KD','KI')
-                      AND B.data_validity_comment is NULL
-                      AND A.confidence_score>=8
-            GROUP BY B.lig_id,B.Target_id"""
-            % query_lig
-        )
-        entropies = []
-        binding_data = pd.read_sql(query, con=connector_targetDB)
-        if not binding_data.empty:
-            for name, group in binding_data.groupby("lig_id"):
-                group = group[(group["sttdev"] < group["avg_value"])].copy()
-                if group.empty:
-                    continue
-                group["association"] = 1 / group.avg_value
-                group["association_prob"] = group.association / group.association.sum()
-                best_target_id = group.loc[group["association_prob"].idxmax()][
-                    "Target_id"
-                ]
-                entropies.append(
-                    {
-                        "Selectivity": round(sc.entropy(group.association_prob), 2),
-                        "lig_id": name,
-                        "number of other targets": len(group),
-                        "targets name": " / ".join(
-                            np.unique(group["target_name"].values)
-                        ),
-                        "best_target_id": best_target_id,
-                    }
-                )
-
-            entropy = pd.DataFrame(data=entropies)
-
-            if not entropy.empty:
-                best = pd.merge(best, entropy, on="lig_id")
-            else:
-                best["Selectivity"] = np.nan
-                best["lig_id"] = np.nan
-                best["number of other targets"] = np.nan
-                best["targets name"] = np.nan
-                best["best_target_id"] = np.nan
-
+        entropy = lsel.get_selectivity(connector_targetDB, best.lig_id.unique()).rename(
+            columns={
+                "n_targets": "number of other targets",
+                "targets_name": "targets name",
+            }
+        )
+        entropy = entropy[
+            [
+                "Selectivity",
+                "lig_id",
+                "number of other targets",
+                "targets name",
+                "best_target_id",
+            ]
+        ]
+        if not entropy.empty:
+            best = pd.merge(best, entropy, on="lig_id")
             total_moderate_selectivity = (
                 best[
                     (best["Selectivity"] <= 2)
@@ -1857,9 +1823,9 @@ def get_descriptors_list(target_id, targetdb=None):
     )
 
     general_data = pd.read_sql(
-        """SELECT Target_id,Sequence FROM Targets WHERE Target_id in ('%s')"""
-        % target_id,
+        """SELECT Target_id,Sequence FROM Targets WHERE Target_id IN (SELECT value FROM json_each(:ids))""",
         con=connector_targetDB,
+        params=target_ids,
     )
     general_data["length"] = general_data.Sequence.str.len()
     general_data.index = general_data.Target_id
@@ -1967,28 +1933,23 @@ def get_descriptors_list(target_id, targetdb=None):
     # ========================================= TCRD INFO =========================================================#
     # ================================================================================================================#
 
-    query_id = """SELECT * FROM tcrd_id WHERE Target_id in ('%s')""" % target_id
-    tcrd_id = pd.read_sql(query_id, con=connector_targetDB)
-    tcrd_id_list = "','".join([str(i) for i in tcrd_id["tcrd_id"].values.tolist()])
+    query_id = """SELECT * FROM tcrd_id WHERE Target_id IN (SELECT value FROM json_each(:ids))"""
+    tcrd_id = pd.read_sql(query_id, con=connector_targetDB, params=target_ids)
+    tcrd_ids = {"ids": sqlp.ids_param(tcrd_id["tcrd_id"].tolist())}
 
     tcrd_queries = {
-        "target": """SELECT * FROM tcrd_target WHERE tcrd_id in ('%s') """
-        % tcrd_id_list,
-        "tdl_info": """SELECT * FROM tcrd_info WHERE protein_id in ('%s')"""
-        % tcrd_id_list,
-        "patent": """SELECT * FROM tcrd_patent where protein_id in ('%s')"""
-        % tcrd_id_list,
+        "target": """SELECT * FROM tcrd_target WHERE tcrd_id IN (SELECT value FROM json_each(:ids)) """,
+        "tdl_info": """SELECT * FROM tcrd_info WHERE protein_id IN (SELECT value FROM json_each(:ids))""",
+        "patent": """SELECT * FROM tcrd_patent where protein_id IN (SELECT value FROM json_each(:ids))""",
         "disease": """SELECT protein_id,disease_id,doid,score,name,parent
                     FROM
                     tcrd_disease
-    WHERE protein_id in ('%s')
-    ORDER BY score DESC"""
-        % tcrd_id_list,
-        "novelty": """SELECT score,protein_id as tcrd_id FROM tcrd_novelty WHERE protein_id in ('%s')"""
-        % tcrd_id_list,
+    WHERE protein_id IN (SELECT value FROM json_each(:ids))
+    ORDER BY score DESC""",
+        "novelty": """SELECT score,protein_id as tcrd_id FROM tcrd_novelty WHERE protein_id IN (SELECT value FROM json_each(:ids))""",
     }
     tcrd_res = {
-        qname: pd.read_sql(query, con=connector_targetDB)
+        qname: pd.read_sql(query, con=connector_targetDB, params=tcrd_ids)
         for qname, query in tcrd_queries.items()
     }
     tcrd_data = tcrd_id.copy()
@@ -2066,7 +2027,6 @@ def get_descriptors_list(target_id, targetdb=None):
 
     data = data.merge(tcrd_data, on="Target_id", how="left")
 
-    connector_targetDB.close()
     return data
 
 
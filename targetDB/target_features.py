@@ -1,60 +1,31 @@
 #!/usr/bin/env python
 import re
-import sqlite3
-import math
 import pandas as pd
 
 import cns_mpo as mpo
+from utils import sqlite_pool as sqlp
+from utils import ligand_selectivity as lsel
 
 import numpy as np
-import scipy.stats as sc
-
-
-class StdevFunc:
-    def __init__(self):
-        self.M = 0.0
-        self.S = 0.0
-        self.k = 1
-
-    def step(self, value):
-        if value is None:
-            return
-        tM = self.M
-        self.M += (value - tM) / self.k
-        self.S += (value - tM) * (value - self.M)
-        self.k += 1
-
-    def finalize(self):
-        if self.k == 2:
-            return 0
-        elif self.k < 3:
-            return None
-        return math.sqrt(self.S / (self.k - 2))
 
 
 def get_single_features(target_id, dbase=None):
     single_queries = {
-        "general_info": "SELECT * FROM Targets WHERE Target_id='" + target_id + "'",
-        "disease": "SELECT disease_name,disease_id FROM disease WHERE Target_id='"
-        + target_id
-        + "'",
-        "reactome": "SELECT pathway_name FROM pathways WHERE pathway_dataset='Reactome pathways data set' AND Target_id='"
-        + target_id
-        + "'",
-        "kegg": "SELECT pathway_name FROM pathways WHERE pathway_dataset='KEGG pathways data set' AND Target_id='"
-        + target_id
-        + "'",
+        "general_info": "SELECT * FROM Targets WHERE Target_id=:target_id",
+        "disease": "SELECT disease_name,disease_id FROM disease WHERE Target_id=:target_id",
+        "reactome": "SELECT pathway_name FROM pathways WHERE pathway_dataset='Reactome pathways data set' AND Target_id=:target_id",
+        "kegg": "SELECT pathway_name FROM pathways WHERE pathway_dataset='KEGG pathways data set' AND Target_id=:target_id",
         "disease_exp": """SELECT
               disease,
               round(avg(t_stat),1) as t_stat,
-              round(stddev(t_stat),1) as std_dev_t,
+              round(%s,1) as std_dev_t,
               count(t_stat) as n,
               max(expression_status) as direction
               FROM diff_exp_disease
-              WHERE Target_id='%s'
+              WHERE Target_id=:target_id
               GROUP BY Target_id,disease
               ORDER BY t_stat DESC"""
-        % target_id,
+        % sqlp.stddev_sql("t_stat"),
         "gwas": """SELECT
               phenotype,
               organism,
@@ -63,51 +34,46 @@ def get_single_features(target_id, dbase=None):
               publication_year as 'year',
               pubmed_id
             FROM gwas
-            WHERE Target_id='%s'
-            ORDER BY phenotype"""
-        % target_id,
+            WHERE Target_id=:target_id
+            ORDER BY phenotype""",
         "tissue": """SELECT
               Tissue,
               round(avg(t_stat),1) as t_stat,
-              round(stddev(t_stat),1) as std_dev_t,
+              round(%s,1) as std_dev_t,
               count(t_stat) as n
               FROM diff_exp_tissue
-              WHERE Target_id='%s'
+              WHERE Target_id=:target_id
               GROUP BY Tissue
               ORDER BY t_stat DESC"""
-        % target_id,
+        % sqlp.stddev_sql("t_stat"),
         "selectivity": """SELECT
             Selectivity_entropy
             FROM protein_expression_selectivity
-            WHERE Target_id='%s'"""
-        % target_id,
+            WHERE Target_id=:target_id""",
         "organ_expression": """SELECT
               organ as organ_name,
               sum(value) as Total_value,
               count(value)as n_tissues,
               avg(value) as avg_value
               FROM protein_expression_levels
-              WHERE Target_id='%s'
+              WHERE Target_id=:target_id
               GROUP BY organ
-              ORDER BY avg_value DESC"""
-        % target_id,
+              ORDER BY avg_value DESC""",
         "tissue_expression": """SELECT
               organ,
               tissue,
               cell,
               value
               FROM protein_expression_levels
-              WHERE Target_id='%s'"""
-        % target_id,
+              WHERE Target_id=:target_id""",
         "phenotype": """SELECT
               Allele_symbol,
               Allele_type,
               CASE WHEN zygosity is null THEN 'NOT DECLARED' ELSE UPPER(zygosity) END AS zygosity,
               genotype,
               Phenotype
-            FROM phenotype WHERE Target_id='%s'
-            ORDER BY Allele_id,zygosity,genotype"""
-        % target_id,
+            FROM phenotype WHERE Target_id=:target_id
+            ORDER BY Allele_id,zygosity,genotype""",
         "isoforms": """SELECT
               (T.Gene_name || '-' || I.Isoform_name) as isoform_name,
               I.Isoform_id,
@@ -118,8 +84,7 @@ def get_single_features(target_id, dbase=None):
             FROM Isoforms I
             LEFT JOIN Targets T
               ON I.Target_id = T.Target_id
-            WHERE I.Target_id='%s' ORDER BY I.Canonical DESC"""
-        % target_id,
+            WHERE I.Target_id=:target_id ORDER BY I.Canonical DESC""",
         "isoforms_mod": """SELECT
               IM.isoform_id,
               M.start,
@@ -132,8 +97,7 @@ def get_single_features(target_id, dbase=None):
             FROM isoform_modifications IM
             LEFT JOIN modifications M
               on IM.mod_id = M.Unique_modID
-            WHERE IM.isoform_id in (SELECT I.Isoform_id FROM Isoforms I WHERE I.Target_id='%s')"""
-        % target_id,
+            WHERE IM.isoform_id in (SELECT I.Isoform_id FROM Isoforms I WHERE I.Target_id=:target_id)""",
         "var": """SELECT
               M.start,
               M.stop,
@@ -143,8 +107,7 @@ def get_single_features(target_id, dbase=None):
               M.domains AS in_domains,
               M.comment AS comments
             FROM modifications M
-            WHERE M.mod_type = 'VAR' AND M.Target_id='%s'"""
-        % target_id,
+            WHERE M.mod_type = 'VAR' AND M.Target_id=:target_id""",
         "mut": """SELECT
               M.start,
               M.stop,
@@ -154,8 +117,7 @@ def get_single_features(target_id, dbase=None):
               M.domains AS in_domains,
               M.comment AS comments
             FROM modifications M
-            WHERE M.mod_type = 'MUTAGEN' AND M.Target_id='%s'"""
-        % target_id,
+            WHERE M.mod_type = 'MUTAGEN' AND M.Target_id=:target_id""",
         "domains": """SELECT
               Domain_name,
               Domain_start as start,
@@ -163,8 +125,7 @@ def get_single_features(target_id, dbase=None):
               length,
               source_name as source
             FROM Domain_targets
-            WHERE Target_id='%s'"""
-        % target_id,
+            WHERE Target_id=:target_id""",
         "pdb_blast": """SELECT
               Hit_PDB_code as PDB_code,
               Chain_Letter as Chain,
@@ -176,10 +137,9 @@ def get_single_features(target_id, dbase=None):
             FROM `3D_Blast`
               LEFT JOIN drugEbility_sites DS
               ON DS.pdb_code=Hit_PDB_code
-            WHERE Query_target_id='%s'
+            WHERE Query_target_id=:target_id
             GROUP BY Hit_PDB_code
-            ORDER BY similarity DESC"""
-        % target_id,
+            ORDER BY similarity DESC""",
         "pdb": """SELECT
               C.PDB_code,
               P.Technique,
@@ -209,9 +169,8 @@ def get_single_features(target_id, dbase=None):
                 ON B.pdb_code = C.PDB_code
               LEFT JOIN drugEbility_sites DS
                 ON DS.pdb_code = LOWER(C.PDB_code)
-            WHERE C.Target_id='%s'
-            GROUP BY C.PDB_code,P.Technique,P.Resolution,C.n_residues,C.start_stop"""
-        % target_id,
+            WHERE C.Target_id=:target_id
+            GROUP BY C.PDB_code,P.Technique,P.Resolution,C.n_residues,C.start_stop""",
         "pockets": """SELECT
               F.PDB_code,
               F.DrugScore as druggability_score,
@@ -226,11 +185,9 @@ def get_single_features(target_id, dbase=None):
                 ON F.Pocket_id = Domain.Pocket_id
               LEFT JOIN Domain_targets D
                 ON Domain.Domain_id=D.domain_id
-            WHERE F.Target_id='{target}'
+            WHERE F.Target_id=:target_id
             AND F.druggable='TRUE' AND F.blast='FALSE'
-            GROUP BY F.PDB_code,F.DrugScore,F.total_sasa,F.volume,fraction_apolar,pocket_number,pocket_score""".format(
-            target=target_id
-        ),
+            GROUP BY F.PDB_code,F.DrugScore,F.total_sasa,F.volume,fraction_apolar,pocket_number,pocket_score""",
         "alt_pockets": """SELECT
               F.PDB_code,
               F.DrugScore as druggability_score,
@@ -246,10 +203,9 @@ def get_single_features(target_id, dbase=None):
               LEFT JOIN `3D_Blast` B
                 ON F.Target_id = B.Query_target_id AND F.PDB_code = B.Hit_PDB_code
 
-            WHERE F.Target_id='%s'
+            WHERE F.Target_id=:target_id
             AND F.druggable='TRUE' AND F.blast='TRUE'
-            ORDER BY B.similarity DESC"""
-        % target_id,
+            ORDER BY B.similarity DESC""",
         "bioactives": """SELECT
             B.lig_id,
               B.assay_id,
@@ -294,10 +250,9 @@ def get_single_features(target_id, dbase=None):
               ON B.lig_id=L.lig_id
               LEFT JOIN assays A
               ON B.assay_id=A.assay_id
-            WHERE C.target_id='%s'
+            WHERE C.target_id=:target_id
             AND B.operator!='>' AND B.operator!='<'
-            AND A.confidence_score>=8"""
-        % target_id,
+            AND A.confidence_score>=8""",
         "commercials": """SELECT
        smiles,
        affinity_type,
@@ -307,8 +262,7 @@ def get_single_features(target_id, dbase=None):
        price,
        website
     FROM purchasable_compounds
-    WHERE target_id='%s'"""
-        % target_id,
+    WHERE target_id=:target_id""",
         "bindingDB": """SELECT
               B.ligand_name,
               B.ZincID,
@@ -347,8 +301,7 @@ def get_single_features(target_id, dbase=None):
             FROM BindingDB B
               LEFT JOIN ligands L
               ON B.inchi_key = L.std_inchi_key
-            WHERE target_id = '%s'"""
-        % target_id,
+            WHERE target_id = :target_id""",
         "domain_drugE": """SELECT
       GROUP_CONCAT(DISTINCT UPPER(pdb_code)) pdb_list,
       domain_fold,
@@ -358,23 +311,47 @@ def get_single_features(target_id, dbase=None):
     FROM drugEbility_domains
     WHERE pdb_code in (SELECT DISTINCT LOWER(PDB_code)
       FROM PDB_Chains
-    WHERE target_id = '%s')
-    GROUP BY domain_fold"""
-        % target_id,
-        "open_target": """SELECT * FROM opentarget_association WHERE target_id='%s'"""
-        % target_id,
+    WHERE target_id = :target_id)
+    GROUP BY domain_fold""",
+        "open_target": """SELECT * FROM opentarget_association WHERE target_id=:target_id""",
     }
-    connector = sqlite3.connect(dbase)
-    connector.create_aggregate("stddev", 1, StdevFunc)
+    connector = sqlp.connect(dbase)
     results = {
-        qname: pd.read_sql(query, con=connector)
+        qname: pd.read_sql(query, con=connector, params={"target_id": target_id})
         for qname, query in single_queries.items()
     }
     results.update(transform_bioactivities(results["bioactives"], connector))
-    connector.close()
     return results
 
 
+def binding_selectivity(binding, dbase):
+    """Selectivity of the ligands of ``binding`` (Ki/Kd data of the current target).
+
+    best_target is True when the current target (first one of ``binding``) is the
+    one with the highest association probability, or the only target, of the ligand.
+    """
+    best_target_id = binding.iloc[0]["target_id"]
+    entropy = lsel.get_selectivity(dbase, binding.lig_id.unique())
+    entropy["best_target"] = (entropy.n_targets <= 1) | (
+        entropy.best_target_id == best_target_id
+    )
+    return entropy.rename(
+        columns={
+            "n_targets": "number of other targets",
+            "targets_name": "targets name",
+        }
+    )[
+        [
+            "Selectivity",
+            "lig_id",
+            "number of other targets",
+            "targets name",
+            "best_target",
+            "best_target_name",
+        ]
+    ]
+
+
 def transform_bioactivities(results, dbase):
     if results.empty:
         return {
@@ -539,70 +516,8 @@ def transform_bioactivities(results, dbase):
         binding.sort_values(by=["standard_type", "value_num"], inplace=True)
         binding["pX"].fillna(-np.log10(binding.value_num / 1000000000), inplace=True)
 
-        query_lig = "','".join(binding.lig_id.unique())
-        query = (
-            """SELECT
-	            B.lig_id,
-	            B.Target_id,
-	            B.target_name,
-	            ROUND(AVG(B.value_num),2) avg_value,
-	            ROUND(STDDEV(B.value_num),2) sttdev,
-	            COUNT(*) n_values
-	            FROM bioactivities B
-	              LEFT JOIN assays A
-	              ON B.assay_id=A.assay_id
-	            WHERE B.operator='=' 
-	              AND B.lig_id in ('%s')
-	              AND A.bioactivity_type='Binding'
-	              AND UPPER(B.standard_type) in ('KD','KI')
-	              AND B.data_validity_comment is NULL
-	              AND A.confidence_score>=8
-	    GROUP BY B.lig_id,B.Target_id"""
-            % query_lig
-        )
-
-        entropies = []
-        binding_data = pd.read_sql(query, con=dbase)
-        best_target_id = binding.iloc[0]["target_id"]
-        if not binding_data.empty:
-            for name, group in binding_data.groupby("lig_id"):
-                best_target = True
-                group = group[(group["sttdev"] < group["avg_value"])].copy()
-                if group.empty:
-                    continue
-                group["association"] = 1 / group.avg_value
-                group["association_prob"] = group.association / group.association.sum()
-                if len(group) > 1:
-                    if (
-                        group.loc[group["association_prob"].idxmax()]["Target_id"]
-                        == best_target_id
-                    ):
-                        best_target = True
-                        best_target_name = group.loc[
-                            group["association_prob"].idxmax()
-                        ]["target_name"]
-                    else:
-                        best_target = False
-                        best_target_name = group.loc[
-                            group["association_prob"].idxmax()
-                        ]["target_name"]
-                else:
-                    best_target_name = group.iloc[0]["target_name"]
-                entropies.append(
-                    {
-                        "Selectivity": round(sc.entropy(group.association_prob), 2),
-                        "lig_id": name,
-                        "number of other targets": len(group),
-                        "targets name": " / ".join(
-                            np.unique(group["target_name"].values)
-                        ),
-                        "best_target": best_target,
-                        "best_target_name": best_target_name,
-                    }
-                )
-
-            entropy = pd.DataFrame(data=entropies)
-
+        entropy = binding_selectivity(binding, dbase)
+        if not entropy.empty:
             binding = pd.merge(binding, entropy, on="lig_id")
 
             col_order = [
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+"""Settings and shared resources of a druggability_DB build.
+
+A ``BuildContext`` replaces the module level globals formerly set by
+``druggability_DB.main`` / ``Target`` (database paths, executables, verbosity,
+number of cores) so that several targets can be built concurrently. Besides
+the settings it holds the resources the concurrent builds share:
+
+- a core scheduler bounding the BLAST/fpocket subprocesses to ``num_core``
+  cores in total,
+- per-key locks (e.g. one per PDB code, as several targets can share PDB
+  files and fpocket outputs),
+- a single writer thread owning all the writes to the targetDB file,
+- a pool of worker processes running the pocket searches (strip, fpocket,
+  parse) of the structures.
+
+The context of the target being built is found with ``current()``; it is set
+with ``activate()`` (per thread, see ``contextvars``).
+"""
+
+import contextlib
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import pdb_download as pdl
+from utils import pocket_finder as pocket
+
+_current = contextvars.ContextVar("build_context")
+
+
+class CoreScheduler:
+    """Counting semaphore of CPU cores where a task can hold several cores."""
+
+    def __init__(self, num_core):
+        self.num_core = max(1, int(num_core))
+        self.free = self.num_core
+        self.condition = threading.Condition()
+
+    @contextlib.contextmanager
+    def cores(self, n=1):
+        n = min(max(1, n), self.num_core)
+        with self.condition:
+            self.condition.wait_for(lambda: self.free >= n)
+            self.free -= n
+        try:
+            yield n
+        finally:
+            with self.condition:
+                self.free += n
+                self.condition.notify_all()
+
+
+class BuildContext:
+    def __init__(
+        self,
+        targetdb,
+        chembl,
+        db_files_path=None,
+        blast_exe=None,
+        blast_db=None,
+        fpocket_exe=None,
+        num_core=8,
+        jobs=1,
+        verbose=False,
+        swissprot=None,
+        pdb_downloader=None,
+        pocket_workers=None,
+        fpocket_timeout=None,
+    ):
+        self.targetdb = targetdb
+        self.chembl = chembl
+        self.db_files_path = db_files_path
+        self.blast_exe = blast_exe
+        self.blast_db = blast_db
+        self.fpocket_exe = fpocket_exe
+        self.num_core = num_core
+        self.jobs = max(1, int(jobs))
+        self.verbose = verbose
+        # Local SwissProt flat file (swissprot_index.SwissProtIndex) or None
+        self.swissprot = swissprot
+        # Downloads of the PDB files, shared by the concurrent builds
+        self.pdb_downloader = pdb_downloader or pdl.PDBDownloader()
+        # Worker processes of the pocket searches (shared by the concurrent
+        # builds) and time limit of one fpocket run in seconds (None: no limit)
+        self.pocket_workers = max(1, int(pocket_workers or num_core))
+        self.fpocket_timeout = fpocket_timeout
+        self._process_pool = None
+        self._pool_guard = threading.Lock()
+        self.scheduler = CoreScheduler(num_core)
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self._writer = None
+        self._writer_guard = threading.Lock()
+        # HumanMine data fetched in batch for the targets to build, by gene
+        self.humanmine = {}
+
+    @property
+    def blast_threads(self):
+        """Threads of one BLAST search (the cores are shared by the concurrent jobs)."""
+        return max(1, self.num_core // self.jobs)
+
+    def cores(self, n=1):
+        return self.scheduler.cores(n)
+
+    @contextlib.contextmanager
+    def lock(self, key):
+        with self._locks_guard:
+            key_lock = self._locks.setdefault(key, threading.Lock())
+        with key_lock:
+            yield
+
+    def write(self, func, *args, **kwargs):
+        """Run ``func`` on the writer thread (inline for a single job) and return its result."""
+        if self.jobs == 1:
+            return func(*args, **kwargs)
+        with self._writer_guard:
+            if self._writer is None:
+                self._writer = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="targetdb-writer"
+                )
+        return self._writer.submit(self._run, func, *args, **kwargs).result()
+
+    def process_pool(self):
+        """Process pool of the pocket searches (created on first use)."""
+        with self._pool_guard:
+            if self._process_pool is None:
+                self._process_pool = pocket.process_pool(self.pocket_workers)
+        return self._process_pool
+
+    def _run(self, func, *args, **kwargs):
+        with self.activate():
+            return func(*args, **kwargs)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.shutdown()
+            self._writer = None
+        if self.swissprot is not None:
+            self.swissprot.close()
+        self.pdb_downloader.close()
+        if self._process_pool is not None:
+            self._process_pool.shutdown()
+            self._process_pool = None
+
+    @contextlib.contextmanager
+    def activate(self):
+        token = _current.set(self)
+        try:
+            yield self
+        finally:
+            _current.reset(token)
+
+
+def current():
+    """Context of the build running in this thread."""
+    try:
+        return _current.get()
+    except LookupError:
+        raise RuntimeError("No targetDB build context is active") from None
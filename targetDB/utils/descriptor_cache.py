@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+"""Persistent cache of the target descriptors computed by get_descriptors_list.
+
+Each target's descriptor row is stored with the ``Targets.Date_modified`` value
+it was computed from, in a ``target_descriptors_cache`` table of a sidecar
+SQLite file (one per database, in ~/.targetdb/cache, as database snapshots
+can be read-only). A row is stored as JSON (its column values, floats written
+with their exact repr, and the column dtypes) and only reused while
+``Date_modified`` is unchanged; ``druggability_DB`` also invalidates the
+targets it rewrites or whose ligand selectivity it changes.
+
+Rows also record the size and modification time of the database file they
+were computed from: when the file changes (rebuilt or replaced by another
+release at the same path) all its cached rows are dropped.
+
+The cache is meant for the interactive reports: bulk readers running in
+worker processes (predict_all_targets, the list report) bypass it.
+"""
+
+import hashlib
+import json
+import sqlite3
+from pathlib import Path
+
+import pandas as pd
+
+from utils import sqlite_pool as sqlp
+
+CACHE_DIR = Path("~/.targetdb/cache").expanduser()
+# Increase when the descriptors computed by get_descriptors_list change
+CACHE_VERSION = 3
+
+cache_sql = """CREATE TABLE IF NOT EXISTS target_descriptors_cache
+(
+Target_id     varchar(50) not null,
+Date_modified timestamp   not null,
+version       integer     not null,
+db_stamp      varchar(50) not null,
+descriptors   text        not null,
+primary key (Target_id)
+);"""
+
+
+def cache_path(db_path):
+    key = hashlib.sha256(str(Path(db_path).resolve()).encode()).hexdigest()[:16]
+    return CACHE_DIR / ("descriptors_%s.sqlite" % key)
+
+
+def db_stamp(db_path):
+    """Identity of the database file (size and modification time)."""
+    stat = Path(db_path).stat()
+    return "%d:%d" % (stat.st_size, stat.st_mtime_ns)
+
+
+def _connect(db_path):
+    path = cache_path(db_path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    connector = sqlite3.connect(str(path), timeout=30)
+    columns = {
+        row[1]
+        for row in connector.execute("PRAGMA table_info(target_descriptors_cache)")
+    }
+    if columns and "db_stamp" not in columns:
+        # Sidecar of an older version: its rows cannot be trusted
+        with connector:
+            connector.execute("DROP TABLE target_descriptors_cache")
+    connector.execute(cache_sql)
+    return connector
+
+
+def _plain(value):
+    """JSON value of the numpy/pandas scalars json cannot encode."""
+    if value is pd.NA or value is pd.NaT:
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    if hasattr(value, "item"):
+        return value.item()
+    raise TypeError("Cannot cache a %s value" % type(value).__name__)
+
+
+def _to_json(descriptors, i):
+    # json writes floats with repr, which reads back to the same float
+    return json.dumps(
+        {
+            "dtypes": {c: str(dtype) for c, dtype in descriptors.dtypes.items()},
+            "values": descriptors.iloc[i].to_dict(),
+        },
+        default=_plain,
+    )
+
+
+def _frame(rows):
+    """DataFrame of the cached rows, with the dtypes they were computed with."""
+    columns = list(rows[0]["values"])
+    # Built as objects first: None values of object columns are kept as is
+    frame = pd.DataFrame(
+        {
+            column: pd.Series([row["values"].get(column) for row in rows], dtype=object)
+            for column in columns
+        }
+    )
+    for column in columns:
+        dtypes = {row["dtypes"].get(column) for row in rows}
+        if len(dtypes) != 1 or None in dtypes:
+            frame[column] = frame[column].infer_objects()
+        elif dtypes != {"object"}:
+            frame[column] = frame[column].astype(dtypes.pop())
+    return frame
+
+
+def get(db_path, modified, stamp=None):
+    """Split the targets of ``modified`` (Target_id, Date_modified) into cached and stale.
+
+    ``stamp`` is the db_stamp of the database the targets are read from. The
+    rows cached from another version of the file are dropped. Returns the
+    cached descriptor rows and the list of Target_ids to compute.
+    """
+    stamp = stamp or db_stamp(db_path)
+    connector = _connect(db_path)
+    try:
+        if connector.execute(
+            "SELECT 1 FROM target_descriptors_cache WHERE db_stamp!=? LIMIT 1",
+            (stamp,),
+        ).fetchone():
+            with connector:
+                connector.execute(
+                    "DELETE FROM target_descriptors_cache WHERE db_stamp!=?", (stamp,)
+                )
+        rows = connector.execute(
+            "SELECT Target_id, Date_modified, descriptors FROM target_descriptors_cache "
+            "WHERE version=? AND Target_id IN (SELECT value FROM json_each(?))",
+            (CACHE_VERSION, sqlp.ids_param(modified.Target_id)),
+        ).fetchall()
+    finally:
+        connector.close()
+    current = dict(zip(modified.Target_id, modified.Date_modified.astype(str)))
+    cached = [
+        json.loads(descriptors)
+        for target_id, date_modified, descriptors in rows
+        if current.get(target_id) == date_modified
+    ]
+    fresh = {row["values"]["Target_id"] for row in cached}
+    stale = [target_id for target_id in modified.Target_id if target_id not in fresh]
+    return (_frame(cached) if cached else pd.DataFrame()), stale
+
+
+def put(db_path, descriptors, modified, stamp=None):
+    """Store the descriptor rows with the Date_modified they were computed from.
+
+    ``stamp`` is the db_stamp of the database taken before the rows were read.
+    """
+    stamp = stamp or db_stamp(db_path)
+    current = dict(zip(modified.Target_id, modified.Date_modified.astype(str)))
+    connector = _connect(db_path)
+    try:
+        with connector:
+            connector.executemany(
+                "INSERT OR REPLACE INTO target_descriptors_cache "
+                "(Target_id, Date_modified, version, db_stamp, descriptors) "
+                "VALUES (?,?,?,?,?)",
+                (
+                    (
+                        target_id,
+                        current[target_id],
+                        CACHE_VERSION,
+                        stamp,
+                        _to_json(descriptors, i),
+                    )
+                    for i, target_id in enumerate(descriptors.Target_id)
+                    if target_id in current
+                ),
+            )
+    finally:
+        connector.close()
+
+
+def invalidate(db_path, target_ids):
+    """Drop the cached descriptors of the targets (no-op when there is no cache)."""
+    target_ids = sqlp.as_id_list(target_ids)
+    if not target_ids or not cache_path(db_path).is_file():
+        return
+    connector = _connect(db_path)
+    try:
+        with connector:
+            connector.execute(
+                "DELETE FROM target_descriptors_cache "
+                "WHERE Target_id IN (SELECT value FROM json_each(?))",
+                (sqlp.ids_param(target_ids),),
+            )
+    finally:
+        connector.close()
@@ -4,27 +4,79 @@ import warnings
 
 warnings.filterwarnings("ignore", category=FutureWarning, module="pandas")
 
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+
+import joblib
+import numpy as np
 import pandas as pd
+import sklearn
 from sklearn.ensemble import RandomForestClassifier
 from pathlib import Path
 
+ML_DATA = (
+    Path(__file__).resolve().parent.parent
+    / "ml_data"
+    / "ml_training_data_13_01_2020.zip"
+)
 
-def generate_model():
-    # Model generated with optimised parameters (see .ipynb file)
-    rf_model = RandomForestClassifier(
-        n_estimators=1000,
-        max_depth=21,
-        max_features=3,
-        min_samples_leaf=2,
-        min_samples_split=5,
-    )
+# Model generated with optimised parameters (see .ipynb file)
+MODEL_PARAMS = {
+    "n_estimators": 1000,
+    "max_depth": 21,
+    "max_features": 3,
+    "min_samples_leaf": 2,
+    "min_samples_split": 5,
+}
+
+# Fitted models are stored here, one file per training data/parameters hash
+MODEL_CACHE_DIR = Path("~/.targetdb/models").expanduser()
+
+# Training data and its Target_ids, read from ML_DATA at most once per process
+_TRAINING_DATA = None
+_TRAINING_IDS = None
+
+
+def training_data():
+    """Return the training DataFrame, parsing the zipped JSON on first use."""
+    global _TRAINING_DATA
+    if _TRAINING_DATA is None:
+        _TRAINING_DATA = pd.read_json(ML_DATA, compression="zip")
+    return _TRAINING_DATA
+
+
+def training_ids():
+    """Return the frozenset of Target_ids present in the training data."""
+    global _TRAINING_IDS
+    if _TRAINING_IDS is None:
+        _TRAINING_IDS = frozenset(training_data().index)
+    return _TRAINING_IDS
+
+
+def model_key():
+    """Hash identifying the model built from the training data and parameters."""
+    digest = hashlib.sha256()
+    with ML_DATA.open("rb") as data_file:
+        for block in iter(lambda: data_file.read(1 << 20), b""):
+            digest.update(block)
+    digest.update(json.dumps(MODEL_PARAMS, sort_keys=True).encode())
+    # Pickled estimators are only guaranteed to load with the same scikit-learn
+    digest.update(sklearn.__version__.encode())
+    return digest.hexdigest()[:16]
 
-    # recover the training data from the data file
 
-    utils_path = Path(__file__).resolve().parent
-    ml_data = utils_path.parent / "ml_data" / "ml_training_data_13_01_2020.zip"
+def model_path():
+    return MODEL_CACHE_DIR / ("rf_model_%s.joblib" % model_key())
 
-    training_df = pd.read_json(ml_data, compression="zip")
+
+def fit_model():
+    rf_model = RandomForestClassifier(**MODEL_PARAMS)
+
+    # recover the training data from the data file
+    training_df = training_data()
 
     training_set, training_labels = (
         training_df.drop("DRUGGABLE", axis=1),
@@ -34,6 +86,57 @@ def generate_model():
     return rf_model.fit(training_set, training_labels)
 
 
+def save_model(model, path):
+    # Renamed into place so concurrent processes never see a partial file
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=str(path.parent), suffix=".tmp")
+    os.close(fd)
+    try:
+        joblib.dump(model, tmp_path)
+        os.replace(tmp_path, str(path))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def generate_model(use_cache=True):
+    """Return the fitted druggability model.
+
+    The model is fitted on first use and saved under ``MODEL_CACHE_DIR``;
+    later calls (and other processes) load the saved model instead of
+    fitting it again. Each process holds its own copy of the trees.
+    """
+    if not use_cache:
+        return fit_model()
+    path = model_path()
+    if path.is_file():
+        try:
+            return joblib.load(str(path))
+        except (
+            OSError,
+            EOFError,
+            ValueError,
+            IndexError,
+            KeyError,
+            pickle.UnpicklingError,
+            AttributeError,
+            ImportError,
+        ) as error:
+            # Unreadable or incompatible file: fit a new model over it
+            print(
+                "[MODEL]: Cannot load %s (%s: %s), fitting the model again"
+                % (path, type(error).__name__, error)
+            )
+    model = fit_model()
+    try:
+        save_model(model, path)
+    except OSError:
+        # Read-only home directory: keep the in-memory model
+        pass
+    return model
+
+
 def predict(model, data):
     df = data.copy()
     df.index = df.Target_id
@@ -92,14 +195,4 @@ def predict_prob(model, data):
 
 
 def in_training_set(data):
-    utils_path = Path(__file__).resolve().parent
-    ml_data = utils_path.parent / "ml_data" / "ml_training_data_13_01_2020.zip"
-
-    training_df = pd.read_json(ml_data, compression="zip")
-
-    df = data.copy()
-    df.index = df.Target_id
-
-    df["Is_in_training_set"] = "No"
-    df.loc[df.index.isin(training_df.index), ["Is_in_training_set"]] = "Yes"
-    return df["Is_in_training_set"].values
+    return np.where(data.Target_id.isin(training_ids()), "Yes", "No")
@@ -1,13 +1,14 @@
 #!/usr/bin/env python
 
-import sqlite3
 import pandas as pd
 import numpy as np
 
+from utils import sqlite_pool as sqlp
+
 
 def gene_to_id(list_of_genes, targetDB_path=None):
     print("[NAME CONVERSION]: Converting gene names into IDs (Uniprot,Ensembl,HGNC)")
-    connector = sqlite3.connect(targetDB_path)
+    connector = sqlp.connect(targetDB_path)
     gene_list = []
     required_columns = [
         "alias_symbol",
@@ -20,12 +21,10 @@ def gene_to_id(list_of_genes, targetDB_path=None):
         gene = gene.rstrip("\n")
         gene = gene.rstrip("\r")
         gene_list.append(gene)
-    gene_ids = "','".join(gene_list)
-    gene_id_query = (
-        """SELECT * FROM hgnc as hgn WHERE hgn.hgnc_id in (SELECT hg.hgnc_id FROM hgnc as hg WHERE hg.xref_value in ('%s'))"""
-        % gene_ids
+    gene_id_query = """SELECT * FROM hgnc as hgn WHERE hgn.hgnc_id in (SELECT hg.hgnc_id FROM hgnc as hg WHERE hg.xref_value IN (SELECT value FROM json_each(:ids)))"""
+    gene_xref = pd.read_sql(
+        gene_id_query, con=connector, params={"ids": sqlp.ids_param(gene_list)}
     )
-    gene_xref = pd.read_sql(gene_id_query, con=connector)
     xref_df = gene_xref[
         gene_xref.xref_name.isin(
             ["symbol", "uniprot_ids", "ensembl_gene_id", "prev_symbol", "alias_symbol"]
@@ -44,7 +43,6 @@ def gene_to_id(list_of_genes, targetDB_path=None):
     xref_piv.uniprot_ids = xref_piv.uniprot_ids.apply(
         lambda x: list(filter(None, x.split(";")))
     )
-    connector.close()
     list_of_ids = []
     for gene in gene_list:
         gene_id = xref_piv[xref_piv.symbol == gene].index.tolist()
@@ -71,7 +69,7 @@ def gene_to_id(list_of_genes, targetDB_path=None):
 
 def gene_to_id_all(targetDB_path=None):
     print("[NAME CONVERSION]: Converting gene names into IDs (Uniprot,Ensembl,HGNC)")
-    connector = sqlite3.connect(targetDB_path)
+    connector = sqlp.connect(targetDB_path)
     required_columns = [
         "alias_symbol",
         "ensembl_gene_id",
@@ -98,7 +96,6 @@ def gene_to_id_all(targetDB_path=None):
     xref_piv.uniprot_ids = xref_piv.uniprot_ids.apply(
         lambda x: list(filter(None, x.split(";")))
     )
-    connector.close()
     output = xref_piv.reset_index()
     output.drop_duplicates(
         subset=["hgnc_id", "ensembl_gene_id", "symbol"], inplace=True
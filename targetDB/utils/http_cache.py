@@ -0,0 +1,469 @@
+#!/usr/bin/env python
+"""On-disk cache of the HTTP responses fetched while building the database.
+
+Responses of the external services (UniProt, HumanMine, OpenTargets, Ensembl,
+ProteinAtlas) are stored by request (method, url, parameters and body) with
+their body kept once per content hash. A response is served from the cache
+while it is younger than the TTL of its source; past it, the request is
+revalidated with ``If-None-Match``/``If-Modified-Since`` when the server sent an
+ETag/Last-Modified header, so an unchanged resource is not downloaded again. A
+stale response is also served when the service cannot be reached.
+
+In offline mode only cached responses are served (whatever their age) and a
+miss raises ``OfflineError``. The storage backend is pluggable: any object
+with the ``lookup``/``store``/``touch``/``clear`` methods of ``SQLiteStore``
+(default, ~/.targetdb/cache/http_cache.sqlite) or ``DirectoryStore``.
+"""
+
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+import urllib.request as urllib
+from email.message import Message
+from pathlib import Path
+
+import requests
+
+from utils import retryers as ret
+
+CACHE_PATH = Path("~/.targetdb/cache/http_cache.sqlite").expanduser()
+DAY = 24 * 3600
+DEFAULT_TTL = 30 * DAY
+SOURCE_TTL = {
+    "uniprot": 30 * DAY,
+    "humanmine": 30 * DAY,
+    "opentargets": 30 * DAY,
+    "ensembl": 90 * DAY,
+    "proteinatlas": 90 * DAY,
+}
+# Only definitive answers are kept (not server errors or rate limiting)
+CACHEABLE_STATUS = (200, 203, 404, 410)
+TIMEOUT = 60
+
+_store = None
+_offline = False
+
+cache_sql = [
+    """CREATE TABLE IF NOT EXISTS responses
+(
+key           varchar(64) not null,
+source        varchar(50),
+url           text,
+status        integer     not null,
+headers       text,
+etag          text,
+last_modified text,
+fetched_at    float       not null,
+body_hash     varchar(64) not null,
+primary key (key)
+);""",
+    """CREATE TABLE IF NOT EXISTS bodies
+(
+body_hash varchar(64) not null,
+content   blob        not null,
+primary key (body_hash)
+);""",
+    "CREATE INDEX IF NOT EXISTS idx_responses_body_hash ON responses (body_hash)",
+]
+
+
+class OfflineError(ret.NetworkError):
+    pass
+
+
+class Response:
+    """Minimal ``requests.Response`` look-alike of a (cached) response."""
+
+    def __init__(self, url, status_code, content, headers=None, from_cache=False):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = requests.structures.CaseInsensitiveDict(headers or {})
+        self.from_cache = from_cache
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise requests.exceptions.HTTPError(
+                "%d Error for url: %s" % (self.status_code, self.url), response=self
+            )
+
+
+class SQLiteStore:
+    """Responses and content-addressed bodies in a single SQLite file."""
+
+    def __init__(self, path=None):
+        self.path = Path(path or CACHE_PATH)
+
+    def _connect(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        connector = sqlite3.connect(str(self.path), timeout=30)
+        for sql in cache_sql:
+            connector.execute(sql)
+        return connector
+
+    def lookup(self, key):
+        if not self.path.is_file():
+            return None
+        connector = self._connect()
+        try:
+            row = connector.execute(
+                "SELECT R.url, R.status, R.headers, R.etag, R.last_modified, "
+                "R.fetched_at, B.content FROM responses R "
+                "JOIN bodies B ON R.body_hash=B.body_hash WHERE R.key=?",
+                (key,),
+            ).fetchone()
+        finally:
+            connector.close()
+        if row is None:
+            return None
+        names = ["url", "status", "headers", "etag", "last_modified", "fetched_at"]
+        entry = dict(zip(names, row))
+        entry["headers"] = json.loads(entry["headers"] or "{}")
+        entry["content"] = bytes(row[-1])
+        return entry
+
+    def store(self, key, entry):
+        body_hash = hashlib.sha256(entry["content"]).hexdigest()
+        connector = self._connect()
+        try:
+            with connector:
+                previous = connector.execute(
+                    "SELECT body_hash FROM responses WHERE key=?", (key,)
+                ).fetchone()
+                connector.execute(
+                    "INSERT OR IGNORE INTO bodies (body_hash, content) VALUES (?,?)",
+                    (body_hash, entry["content"]),
+                )
+                connector.execute(
+                    "INSERT OR REPLACE INTO responses (key, source, url, status, "
+                    "headers, etag, last_modified, fetched_at, body_hash) "
+                    "VALUES (?,?,?,?,?,?,?,?,?)",
+                    (
+                        key,
+                        entry["source"],
+                        entry["url"],
+                        entry["status"],
+                        json.dumps(entry["headers"]),
+                        entry["etag"],
+                        entry["last_modified"],
+                        entry["fetched_at"],
+                        body_hash,
+                    ),
+                )
+                if previous and previous[0] != body_hash:
+                    connector.execute(
+                        "DELETE FROM bodies WHERE body_hash=? AND NOT EXISTS "
+                        "(SELECT 1 FROM responses WHERE body_hash=?)",
+                        (previous[0], previous[0]),
+                    )
+        finally:
+            connector.close()
+
+    def touch(self, key, fetched_at):
+        connector = self._connect()
+        try:
+            with connector:
+                connector.execute(
+                    "UPDATE responses SET fetched_at=? WHERE key=?", (fetched_at, key)
+                )
+        finally:
+            connector.close()
+
+    def clear(self, source=None):
+        if not self.path.is_file():
+            return
+        connector = self._connect()
+        try:
+            with connector:
+                if source is None:
+                    connector.execute("DELETE FROM responses")
+                else:
+                    connector.execute("DELETE FROM responses WHERE source=?", (source,))
+                connector.execute(
+                    "DELETE FROM bodies WHERE body_hash NOT IN "
+                    "(SELECT body_hash FROM responses)"
+                )
+        finally:
+            connector.close()
+
+
+class DirectoryStore:
+    """One JSON file per request and one file per body (named by its hash)."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def _entry_file(self, key):
+        return self.path / "responses" / key[:2] / (key + ".json")
+
+    def _body_file(self, body_hash):
+        return self.path / "bodies" / body_hash[:2] / body_hash
+
+    @staticmethod
+    def _write(path, data):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(
+            "%s.%d.%d.tmp" % (path.name, os.getpid(), threading.get_ident())
+        )
+        tmp.write_bytes(data)
+        tmp.replace(path)
+
+    def lookup(self, key):
+        entry_file = self._entry_file(key)
+        if not entry_file.is_file():
+            return None
+        entry = json.loads(entry_file.read_text())
+        body_file = self._body_file(entry["body_hash"])
+        if not body_file.is_file():
+            return None
+        entry["content"] = body_file.read_bytes()
+        return entry
+
+    def store(self, key, entry):
+        entry = dict(entry)
+        content = entry.pop("content")
+        entry["body_hash"] = hashlib.sha256(content).hexdigest()
+        body_file = self._body_file(entry["body_hash"])
+        if not body_file.is_file():
+            self._write(body_file, content)
+        self._write(self._entry_file(key), json.dumps(entry).encode())
+
+    def touch(self, key, fetched_at):
+        entry_file = self._entry_file(key)
+        entry = json.loads(entry_file.read_text())
+        entry["fetched_at"] = fetched_at
+        self._write(entry_file, json.dumps(entry).encode())
+
+    def clear(self, source=None):
+        for entry_file in self.path.glob("responses/*/*.json"):
+            if source is None or json.loads(entry_file.read_text())["source"] == source:
+                entry_file.unlink()
+        used = {
+            json.loads(entry_file.read_text())["body_hash"]
+            for entry_file in self.path.glob("responses/*/*.json")
+        }
+        for body_file in self.path.glob("bodies/*/*"):
+            if body_file.name not in used:
+                body_file.unlink()
+
+
+def configure(store=None, offline=None, ttl=None):
+    """Set the cache backend, the offline mode and/or TTLs (seconds) per source."""
+    global _store, _offline
+    if store is not None:
+        _store = store
+    if offline is not None:
+        _offline = offline
+    if ttl:
+        SOURCE_TTL.update(ttl)
+
+
+def configure_from(config, offline=False):
+    """Configure the cache from the optional [http_cache] section of the config file.
+
+    ``path`` selects the backend (a *.sqlite file or a directory) and
+    ``<source>_ttl_days`` overrides the TTL of a source.
+    """
+    section = config["http_cache"] if config.has_section("http_cache") else {}
+    store = None
+    if section.get("path"):
+        path = Path(section["path"]).expanduser()
+        store = SQLiteStore(path) if path.suffix == ".sqlite" else DirectoryStore(path)
+    ttl = {
+        name[: -len("_ttl_days")]: float(value) * DAY
+        for name, value in section.items()
+        if name.endswith("_ttl_days")
+    }
+    configure(store=store, offline=offline, ttl=ttl)
+
+
+def get_store():
+    global _store
+    if _store is None:
+        _store = SQLiteStore()
+    return _store
+
+
+def is_offline():
+    return _offline
+
+
+def request_key(method, url, params=None, data=None, json_body=None):
+    if params:
+        url = requests.Request("GET", url, params=params).prepare().url
+    if json_body is not None:
+        data = json.dumps(json_body, sort_keys=True)
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    digest = hashlib.sha256()
+    for part in (method.upper().encode(), url.encode(), data or b""):
+        digest.update(part)
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _cached_response(entry):
+    return Response(
+        entry["url"], entry["status"], entry["content"], entry["headers"], True
+    )
+
+
+def request(
+    method,
+    url,
+    source,
+    params=None,
+    data=None,
+    json=None,
+    headers=None,
+    ttl=None,
+    session=None,
+    timeout=TIMEOUT,
+):
+    """Perform a request through the cache and return a ``Response``.
+
+    Network errors (``requests`` exceptions) are raised as usual when there is
+    no cached response to fall back to.
+    """
+    store = get_store()
+    key = request_key(method, url, params, data, json)
+    ttl = SOURCE_TTL.get(source, DEFAULT_TTL) if ttl is None else ttl
+    try:
+        entry = store.lookup(key)
+    except (OSError, ValueError, sqlite3.Error):
+        entry = None
+
+    now = time.time()
+    if entry is not None and (_offline or now - entry["fetched_at"] < ttl):
+        return _cached_response(entry)
+    if _offline:
+        raise OfflineError("Not in the HTTP cache (offline mode): %s" % url)
+
+    headers = dict(headers or {})
+    if entry is not None and method.upper() == "GET":
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+    try:
+        r = (session or requests).request(
+            method,
+            url,
+            params=params,
+            data=data,
+            json=json,
+            headers=headers,
+            timeout=timeout,
+        )
+    except requests.exceptions.RequestException:
+        if entry is not None:
+            return _cached_response(entry)
+        raise
+
+    try:
+        if r.status_code == 304 and entry is not None:
+            store.touch(key, now)
+            return _cached_response(entry)
+        if r.status_code in CACHEABLE_STATUS:
+            store.store(
+                key,
+                {
+                    "source": source,
+                    "url": r.url,
+                    "status": r.status_code,
+                    "headers": {
+                        k: v
+                        for k, v in r.headers.items()
+                        if k.lower() in ("content-type", "etag", "last-modified")
+                    },
+                    "etag": r.headers.get("ETag"),
+                    "last_modified": r.headers.get("Last-Modified"),
+                    "fetched_at": now,
+                    "content": r.content,
+                },
+            )
+    except (OSError, sqlite3.Error):
+        pass
+    if r.status_code >= 500 and entry is not None:
+        return _cached_response(entry)
+    return Response(r.url, r.status_code, r.content, dict(r.headers))
+
+
+def get(url, source, **kwargs):
+    return request("GET", url, source, **kwargs)
+
+
+def post(url, source, **kwargs):
+    return request("POST", url, source, **kwargs)
+
+
+class CachedOpener:
+    """urllib style opener (``open(url, data, headers, method)``) going through the cache.
+
+    Wraps the opener of a client library (e.g. the InterMine ``Service.opener``)
+    whose own headers and url preparation are kept; any other attribute is taken
+    from the wrapped opener.
+    """
+
+    def __init__(self, opener, source):
+        self.opener = opener
+        self.source = source
+
+    def __getattr__(self, name):
+        return getattr(self.opener, name)
+
+    def clone(self):
+        return CachedOpener(self.opener.clone(), self.source)
+
+    def open(self, url, data=None, headers=None, method=None):
+        url = self.opener.prepare_url(url)
+        all_headers = self.opener.headers()
+        all_headers.update(headers or {})
+        method = method or ("GET" if data is None else "POST")
+        response = request(method, url, self.source, data=data, headers=all_headers)
+        if not response.ok:
+            message = Message()
+            for name, value in response.headers.items():
+                message[name] = value
+            args = (
+                url,
+                io.BytesIO(response.content),
+                response.status_code,
+                response.text[:200],
+                message,
+            )
+            # Error handlers of the wrapped opener (InterMine style) if it has any
+            handler = getattr(
+                self.opener,
+                "http_error_%d" % response.status_code,
+                getattr(self.opener, "http_error_default", None),
+            )
+            if handler is not None:
+                handler(*args)
+            raise urllib.HTTPError(args[0], args[2], args[3], args[4], args[1])
+        return io.BytesIO(response.content)
+
+    def read(self, url, data=None):
+        return self.open(url, data).read().decode("utf-8")
+
+    def post_content(self, url, body, mimetype, charset="utf-8"):
+        content_type = "{0}; charset={1}".format(mimetype, charset)
+        return self.open(url, body, {"Content-Type": content_type}).read()
+
+    def post_plain_text(self, url, body):
+        return self.post_content(url, body, "text/plain")
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+"""Per-ligand selectivity computed from the ChEMBL Ki/Kd binding data.
+
+The selectivity of a ligand is the Shannon entropy of its association
+probabilities (1 / mean affinity, normalised over all the targets it binds).
+Values are stored in the ``ligand_selectivity`` table, built once for the whole
+database (schema migration) and refreshed for the ligands of every target
+written by ``druggability_DB.write_to_db``. Readers then only join on that
+table; on a database without it the values are computed on the fly.
+"""
+
+import numpy as np
+import pandas as pd
+
+from utils import sqlite_pool as sqlp
+
+COLUMNS = [
+    "lig_id",
+    "Selectivity",
+    "n_targets",
+    "best_target_id",
+    "best_target_name",
+    "targets_name",
+]
+
+binding_query = """SELECT
+    B.lig_id,
+    B.Target_id,
+    B.target_name,
+    ROUND(AVG(B.value_num),2) avg_value,
+    ROUND({stddev},2) sttdev,
+    COUNT(*) n_values
+    FROM bioactivities B
+      LEFT JOIN assays A
+      ON B.assay_id=A.assay_id
+    WHERE B.operator='='
+      AND A.bioactivity_type='Binding'
+      AND UPPER(B.standard_type) in ('KD','KI')
+      AND B.data_validity_comment is NULL
+      AND A.confidence_score>=8
+      {where}
+    GROUP BY B.lig_id,B.Target_id"""
+
+
+def binding_affinities(connector, lig_ids=None):
+    """Mean/stddev Ki-Kd of the ligands (all ligands when lig_ids is None) per target."""
+    if lig_ids is None:
+        where, params = "", None
+    else:
+        where = "AND B.lig_id IN (SELECT value FROM json_each(:ids))"
+        params = {"ids": sqlp.ids_param(lig_ids)}
+    query = binding_query.format(stddev=sqlp.stddev_sql("B.value_num"), where=where)
+    return pd.read_sql(query, con=connector, params=params)
+
+
+def compute(binding_data):
+    """Selectivity of every ligand in ``binding_data`` in a single vectorised pass.
+
+    Targets whose standard deviation is not below the mean value are left out,
+    the best target is the one with the highest association probability (first
+    one on ties).
+    """
+    data = binding_data[binding_data["sttdev"] < binding_data["avg_value"]].copy()
+    if data.empty:
+        return pd.DataFrame(columns=COLUMNS)
+    data["association"] = 1 / data["avg_value"]
+    data["association_prob"] = data["association"] / data.groupby("lig_id")[
+        "association"
+    ].transform("sum")
+    data["plogp"] = data["association_prob"] * np.log(data["association_prob"])
+
+    by_ligand = data.groupby("lig_id", sort=True)
+    best = data.loc[by_ligand["association_prob"].idxmax()].set_index("lig_id")
+    names = (
+        data.dropna(subset=["target_name"])
+        .drop_duplicates(["lig_id", "target_name"])
+        .sort_values(["lig_id", "target_name"])
+        .groupby("lig_id")["target_name"]
+        .agg(" / ".join)
+    )
+    selectivity = pd.DataFrame(
+        {
+            "Selectivity": (-by_ligand["plogp"].sum()).round(2),
+            "n_targets": by_ligand.size(),
+            "best_target_id": best["Target_id"],
+            "best_target_name": best["target_name"],
+        }
+    )
+    selectivity["targets_name"] = names.reindex(selectivity.index).fillna("")
+    selectivity.index.name = "lig_id"
+    return selectivity.reset_index()[COLUMNS]
+
+
+def has_table(connector):
+    return (
+        connector.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name='ligand_selectivity'"
+        ).fetchone()
+        is not None
+    )
+
+
+def get_selectivity(connector, lig_ids):
+    """Selectivity of the ligands, read from ligand_selectivity when it exists."""
+    if has_table(connector):
+        return pd.read_sql(
+            "SELECT %s FROM ligand_selectivity "
+            "WHERE lig_id IN (SELECT value FROM json_each(:ids))" % ",".join(COLUMNS),
+            con=connector,
+            params={"ids": sqlp.ids_param(lig_ids)},
+        )
+    return compute(binding_affinities(connector, lig_ids))
+
+
+def _insert(connector, selectivity):
+    connector.executemany(
+        "INSERT OR REPLACE INTO ligand_selectivity (%s) VALUES (%s)"
+        % (",".join(COLUMNS), ",".join("?" * len(COLUMNS))),
+        selectivity.astype(object)
+        .where(selectivity.notnull(), None)
+        .itertuples(index=False, name=None),
+    )
+
+
+def build(connector):
+    """(Re)compute the selectivity of every ligand of the database."""
+    sqlp.register_functions(connector)
+    selectivity = compute(binding_affinities(connector))
+    connector.execute("DELETE FROM ligand_selectivity")
+    _insert(connector, selectivity)
+    return len(selectivity)
+
+
+def refresh(connector, lig_ids):
+    """Recompute the selectivity of the given ligands after new bioactivities were added.
+
+    Does nothing when the database has no ligand_selectivity table yet (it is then
+    built in full by the schema migration).
+    """
+    lig_ids = sqlp.as_id_list(lig_ids)
+    if not lig_ids or not has_table(connector):
+        return 0
+    sqlp.register_functions(connector)
+    selectivity = compute(binding_affinities(connector, lig_ids))
+    with connector:
+        connector.execute(
+            "DELETE FROM ligand_selectivity WHERE lig_id IN (SELECT value FROM json_each(?))",
+            (sqlp.ids_param(lig_ids),),
+        )
+        _insert(connector, selectivity)
+    return len(selectivity)
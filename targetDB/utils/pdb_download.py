@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+"""Concurrent download of PDB files.
+
+The files are fetched gzip compressed by a bounded pool of workers sharing one
+HTTP session (connections are kept alive and reused) into a temporary file,
+then moved into the ``pdb_store.PDBStore`` once read in full, so an
+interrupted download never leaves a truncated structure behind. Every file is retried on its own with an
+exponential backoff and the codes that could not be fetched are reported
+with the reason, without stopping the other downloads.
+
+The source is a template of the location of a compressed file, either a URL
+(default: RCSB) or a path, e.g. a local mirror / rsync snapshot of the wwPDB
+archive::
+
+    /data/pdb/data/structures/divided/pdb/{mid}/pdb{lcode}.ent.gz
+
+with the placeholders ``{code}`` (PDB code as given), ``{lcode}`` (lower case)
+and ``{mid}`` (2nd and 3rd characters of the lower case code).
+"""
+
+import contextlib
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+DEFAULT_SOURCE = "https://files.rcsb.org/download/{code}.pdb.gz"
+MAX_WORKERS = 8
+MAX_RETRIES = 4
+BACKOFF = 2  # seconds, doubled after every failed attempt
+TIMEOUT = 60  # seconds
+
+
+class NotFound(Exception):
+    """The source has no file for this code (not retried)."""
+
+
+def source_location(source, code):
+    lcode = code.lower()
+    return source.format(code=code, lcode=lcode, mid=lcode[1:3])
+
+
+def is_remote(source):
+    return source.startswith(("http://", "https://"))
+
+
+class PDBDownloader:
+    def __init__(
+        self,
+        source=DEFAULT_SOURCE,
+        max_workers=MAX_WORKERS,
+        max_retries=MAX_RETRIES,
+        backoff=BACKOFF,
+    ):
+        self.source = source
+        self.max_workers = max(1, int(max_workers))
+        self.max_retries = max(1, int(max_retries))
+        self.backoff = backoff
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def is_local(self):
+        return not is_remote(self.source)
+
+    @property
+    def session(self):
+        with self._session_lock:
+            if self._session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=1, pool_maxsize=self.max_workers
+                )
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._session = session
+            return self._session
+
+    def _open(self, code):
+        location = source_location(self.source, code)
+        if self.is_local:
+            if not Path(location).is_file():
+                raise NotFound(location)
+            return open(location, "rb")
+        response = self.session.get(location, stream=True, timeout=TIMEOUT)
+        if response.status_code == 404:
+            response.close()
+            raise NotFound(location)
+        response.raise_for_status()
+        response.raw.decode_content = False
+        return response.raw
+
+    def fetch(self, code, store):
+        """Download the PDB file of ``code`` into ``store`` (one attempt)."""
+        tmp_path = store.temp_path(code)
+        try:
+            with self._open(code) as compressed, tmp_path.open("wb") as handle:
+                shutil.copyfileobj(compressed, handle, 1024 * 1024)
+            return store.add(code, tmp_path)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+
+    def fetch_with_retries(self, code, store):
+        for attempt in range(self.max_retries):
+            try:
+                return self.fetch(code, store)
+            except NotFound:
+                raise
+            except (OSError, EOFError, requests.exceptions.RequestException):
+                if attempt == self.max_retries - 1:
+                    raise
+                time.sleep(self.backoff * 2**attempt)
+
+    def _download_one(self, code, store, lock):
+        # Targets built concurrently can share PDB files
+        with lock(code + ".pdb"):
+            path = store.find(code)
+            if path is None:
+                path = self.fetch_with_retries(code, store)
+        return path
+
+    def download(self, codes, store, lock=None):
+        """Download the PDB files of ``codes`` missing from ``store``.
+
+        Returns a dict of the stored files by code and a dict of the reasons
+        of the codes that failed.
+        """
+        if lock is None:
+            lock = _no_lock
+        codes = list(dict.fromkeys(codes))
+        saved = {}
+        failed = {}
+        with ThreadPoolExecutor(
+            max_workers=min(self.max_workers, len(codes)) or 1,
+            thread_name_prefix="pdb-download",
+        ) as pool:
+            futures = {
+                code: pool.submit(self._download_one, code, store, lock)
+                for code in codes
+            }
+            for code, future in futures.items():
+                try:
+                    saved[code] = future.result()
+                except NotFound:
+                    failed[code] = "not found"
+                except Exception as error:
+                    failed[code] = "%s: %s" % (type(error).__name__, error)
+        return saved, failed
+
+    def close(self):
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+
+def _no_lock(key):
+    return contextlib.nullcontext()
+
+
+def downloader_from(config):
+    """Downloader set from the optional [pdb] section of the config file.
+
+    ``source`` is the template of the compressed files (URL or local mirror
+    path, see the module docstring) and ``workers`` the number of concurrent
+    downloads.
+    """
+    section = config["pdb"] if config.has_section("pdb") else {}
+    return PDBDownloader(
+        source=section.get("source") or DEFAULT_SOURCE,
+        max_workers=int(section.get("workers") or MAX_WORKERS),
+    )
@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 from __future__ import print_function
+import gzip
 import pandas as pd
 import re
 from Bio.PDB import *
@@ -8,292 +9,335 @@ from collections import OrderedDict
 Bioparser = PDBParser(PERMISSIVE=1, QUIET=True)
 
 
+THREE_TO_ONE = {
+    "CYS": "C",
+    "ASP": "D",
+    "SER": "S",
+    "GLN": "Q",
+    "LYS": "K",
+    "ILE": "I",
+    "PRO": "P",
+    "THR": "T",
+    "PHE": "F",
+    "ASN": "N",
+    "GLY": "G",
+    "HIS": "H",
+    "LEU": "L",
+    "ARG": "R",
+    "TRP": "W",
+    "ALA": "A",
+    "VAL": "V",
+    "GLU": "E",
+    "TYR": "Y",
+    "MET": "M",
+    "SEC": "U",
+}
+# Modified residues known without a MODRES record
+MODIFIED_RESIDUES = {"MSE": "MET"}
+
+
 class parsed_pdb:
     def __init__(self, pdb_code):
         self.code = pdb_code
         self.biomolecules = []
 
 
-def parse_header(pdb_code, pdb_file):
-    pdb_parsed = parsed_pdb(pdb_code)
-    with open(pdb_file, "r") as pdb:
-        biomolecule = {}
-        for line in pdb:
-            if "REMARK 350" in line:
-                if line.startswith("REMARK 350"):
-                    current_line = (
-                        line.replace("REMARK 350 ", "").strip("\n").strip(" ")
-                    )
-                    if current_line.startswith("BIOMOLECULE:"):
-                        biomol_id = current_line.split(":")[1].strip(" ")
-                    if current_line.startswith("APPLY THE FOLLOWING TO CHAINS:"):
-                        biomol_chains = (
-                            current_line.split(":")[1]
-                            .replace(" ", "")
-                            .rstrip(",")
-                            .split(",")
-                        )
-                        biomolecule[biomol_id] = biomol_chains
-                    if current_line.startswith("AND CHAINS: "):
-                        biomol_chains = (
-                            current_line.split(":")[1]
-                            .replace(" ", "")
-                            .rstrip(",")
-                            .split(",")
-                        )
-                        biomolecule[biomol_id].extend(biomol_chains)
-
-        pdb_parsed.biomolecules = OrderedDict(
-            sorted(biomolecule.items(), key=lambda t: t[0])
+class PDBHeader:
+    """Header records of a PDB file (see ``scan_header``).
+
+    Attributes:
+     - biomolecules  REMARK 350 biomolecules, id -> list of chains
+     - dbref         DBREF/DBREF1/DBREF2 records, each split in fields
+     - seqres        SEQRES residues (three letter codes) by chain
+     - modres        MODRES map, modified residue -> standard residue
+     - chains        chains in SEQRES order
+    """
+
+    def __init__(self, biomolecules=None, dbref=None, seqres=None, modres=None):
+        self.biomolecules = biomolecules or {}
+        self.dbref = dbref or []
+        self.seqres = seqres or {}
+        self.modres = modres or {}
+
+    @property
+    def chains(self):
+        return list(self.seqres)
+
+    def to_dict(self):
+        return {
+            "biomolecules": self.biomolecules,
+            "dbref": self.dbref,
+            "seqres": self.seqres,
+            "modres": self.modres,
+            "chains": self.chains,
+        }
+
+    @classmethod
+    def from_dict(cls, facts):
+        return cls(
+            biomolecules=facts["biomolecules"],
+            dbref=facts["dbref"],
+            seqres=facts["seqres"],
+            modres=facts["modres"],
         )
-    return pdb_parsed
 
+    def dbref_of(self, chain):
+        """DBREF records (split in fields) of ``chain``."""
+        return [fields for fields in self.dbref if fields[2] == chain]
+
+    def sequence(self, chain):
+        """One letter sequence of the SEQRES residues of ``chain``.
+
+        Modified residues are translated through MODRES; unknown residues are
+        left out.
+        """
+        modified = dict(MODIFIED_RESIDUES, **self.modres)
+        sequence = ""
+        for res in self.seqres.get(chain, []):
+            try:
+                r = THREE_TO_ONE[res]
+            except KeyError:
+                r = THREE_TO_ONE.get(modified.get(res), "")
+            sequence += r
+        return sequence
+
+    def chain_ranges(self):
+        """Start/stop (in the referenced sequence) of the DBREF segments by chain.
 
-def get_sequence(pdb_code, pdb_file, chains_to_do, domains):
-    three_to_one = {
-        "CYS": "C",
-        "ASP": "D",
-        "SER": "S",
-        "GLN": "Q",
-        "LYS": "K",
-        "ILE": "I",
-        "PRO": "P",
-        "THR": "T",
-        "PHE": "F",
-        "ASN": "N",
-        "GLY": "G",
-        "HIS": "H",
-        "LEU": "L",
-        "ARG": "R",
-        "TRP": "W",
-        "ALA": "A",
-        "VAL": "V",
-        "GLU": "E",
-        "TYR": "Y",
-        "MET": "M",
-        "SEC": "U",
-    }
-    modified_residue = {"MSE": "MET"}
-
-    with open(pdb_file, "r") as pdb:
-        sequence = {}
-        list_of_chain = []
+        Returns chain -> {"start", "stop", "start_stop": [(start, stop), ...]}
+        (references to other PDB entries are ignored).
+        """
         chain_stat = {}
-        for line in pdb:
-            if "ATOM" in line:
-                if line.startswith("ATOM"):
-                    break
-            elif "DBREF" in line:
-                if line.startswith("DBREF"):
-                    current_line = list(
-                        filter(None, line.strip("\n").replace(" ", "_").split("_"))
-                    )
-                    if current_line[5] == "PDB":
-                        continue
-                    if current_line[2] not in chain_stat.keys():
-                        chain_stat[current_line[2]] = {
-                            "start": 0,
-                            "stop": 0,
-                            "start_stop": [],
-                        }
-                    if current_line[0] == "DBREF1":
-                        continue
-                    elif current_line[0] == "DBREF2":
-                        chain_stat[current_line[2]]["start_stop"].append(
-                            (
-                                int(re.sub("\D", "", current_line[-2])),
-                                int(re.sub("\D", "", current_line[-1])),
-                            )
-                        )
-                    else:
-                        chain_stat[current_line[2]]["start_stop"].append(
-                            (
-                                int(re.sub("\D", "", current_line[-2])),
-                                int(re.sub("\D", "", current_line[-1])),
-                            )
-                        )
-            elif "SEQRES" in line:
-                if line.startswith("SEQRES"):
-                    current_line = list(
-                        filter(
-                            None,
-                            line.strip("\n")
-                            .replace("   ", " ")
-                            .replace("  ", " ")
-                            .replace(" ", "_")
-                            .split("_"),
-                        )
-                    )
-                    chain = current_line[2]
-                    if chain not in list_of_chain:
-                        list_of_chain.append(chain)
-                        sequence[chain] = ""
-                    seq = current_line[4:]
-                    for res in seq:
-                        try:
-                            r = three_to_one[res]
-                        except KeyError:
-                            try:
-                                r = three_to_one[modified_residue[res]]
-                            except KeyError:
-                                try:
-                                    with open(pdb_file, "r") as pdb_2:
-                                        for modres in pdb_2:
-                                            if "MODRES" in modres:
-                                                if modres.startswith("MODRES"):
-                                                    mod_line = list(
-                                                        filter(
-                                                            None,
-                                                            modres.strip("\n").split(
-                                                                " "
-                                                            ),
-                                                        )
-                                                    )
-                                                    modified_residue[mod_line[2]] = (
-                                                        mod_line[5]
-                                                    )
-                                            elif "ATOM" in modres:
-                                                if modres.startswith("ATOM"):
-                                                    break
-                                    r = three_to_one[modified_residue[res]]
-                                except KeyError:
-                                    r = ""
-                        sequence[chain] += r
+        for current_line in self.dbref:
+            if current_line[5] == "PDB":
+                continue
+            if current_line[2] not in chain_stat.keys():
+                chain_stat[current_line[2]] = {
+                    "start": 0,
+                    "stop": 0,
+                    "start_stop": [],
+                }
+            if current_line[0] == "DBREF1":
+                continue
+            chain_stat[current_line[2]]["start_stop"].append(
+                (
+                    int(re.sub(r"\D", "", current_line[-2])),
+                    int(re.sub(r"\D", "", current_line[-1])),
+                )
+            )
         for k, v in chain_stat.items():
             v["start"] = v["start_stop"][0][0]
             v["stop"] = v["start_stop"][-1][1]
-        list_seq_df = pd.DataFrame(
-            columns=[
-                "PDB_code",
-                "chain_name",
-                "sequence",
-                "equal",
-                "start",
-                "stop",
-                "length",
-                "start_stop_pairs",
-                "domain",
-                "domain_id",
-                "seq_list",
-            ]
+        return chain_stat
+
+
+def open_pdb(pdb_file):
+    """Text handle of a PDB file, gzip compressed (*.gz) or not."""
+    if str(pdb_file).endswith(".gz"):
+        return gzip.open(str(pdb_file), "rt")
+    return open(pdb_file, "r")
+
+
+def scan_header(pdb):
+    """Header records of a PDB file (a PDBHeader), read in a single pass.
+
+    Reading stops at the first coordinate record, the header records
+    (REMARK 350, DBREF, SEQRES, MODRES) all come before.
+    """
+    header = PDBHeader()
+    biomolecule = header.biomolecules
+    biomol_id = None
+    for line in pdb:
+        if line.startswith(("ATOM", "HETATM", "MODEL")):
+            break
+        if line.startswith("REMARK 350"):
+            current_line = line.replace("REMARK 350 ", "").strip("\n").strip(" ")
+            if current_line.startswith("BIOMOLECULE:"):
+                biomol_id = current_line.split(":")[1].strip(" ")
+            if current_line.startswith("APPLY THE FOLLOWING TO CHAINS:"):
+                biomol_chains = (
+                    current_line.split(":")[1].replace(" ", "").rstrip(",").split(",")
+                )
+                biomolecule[biomol_id] = biomol_chains
+            if current_line.startswith("AND CHAINS: "):
+                biomol_chains = (
+                    current_line.split(":")[1].replace(" ", "").rstrip(",").split(",")
+                )
+                biomolecule[biomol_id].extend(biomol_chains)
+        elif line.startswith("DBREF"):
+            header.dbref.append(
+                list(filter(None, line.strip("\n").replace(" ", "_").split("_")))
+            )
+        elif line.startswith("SEQRES"):
+            current_line = list(
+                filter(
+                    None,
+                    line.strip("\n")
+                    .replace("   ", " ")
+                    .replace("  ", " ")
+                    .replace(" ", "_")
+                    .split("_"),
+                )
+            )
+            header.seqres.setdefault(current_line[2], []).extend(current_line[4:])
+        elif line.startswith("MODRES"):
+            mod_line = list(filter(None, line.strip("\n").split(" ")))
+            if len(mod_line) > 5:
+                header.modres[mod_line[2]] = mod_line[5]
+    return header
+
+
+def read_header(pdb_file):
+    """Header records (PDBHeader) of a PDB file."""
+    with open_pdb(pdb_file) as pdb:
+        return scan_header(pdb)
+
+
+def parse_header(pdb_code, pdb_file, header=None):
+    """Biomolecules of a PDB file (``header``: its PDBHeader if already read)."""
+    pdb_parsed = parsed_pdb(pdb_code)
+    if header is None:
+        header = read_header(pdb_file)
+    pdb_parsed.biomolecules = OrderedDict(
+        sorted(
+            ((key, list(chains)) for key, chains in header.biomolecules.items()),
+            key=lambda t: t[0],
         )
-        for key, values in sequence.items():
-            if key in chains_to_do:
-                if key in chain_stat.keys():
-                    list_seq_df.loc[pdb_code + "_" + key] = {
-                        "PDB_code": pdb_code,
-                        "chain_name": key,
-                        "sequence": values,
-                        "equal": [],
-                        "start": chain_stat[key]["start"],
-                        "stop": chain_stat[key]["stop"],
-                        "length": len(values),
-                        "start_stop_pairs": chain_stat[key]["start_stop"],
-                        "domain": [None],
-                        "domain_id": [None],
-                        "seq_list": [None],
-                    }
-                else:
-                    list_seq_df.loc[pdb_code + "_" + key] = {
-                        "PDB_code": pdb_code,
-                        "chain_name": key,
-                        "sequence": values,
-                        "equal": [],
-                        "start": 1,
-                        "stop": len(values),
-                        "length": len(values),
-                        "start_stop_pairs": [],
-                        "domain": [None],
-                        "domain_id": [None],
-                        "seq_list": [None],
-                    }
-
-        for keyA in list_seq_df.index:
-            for keyB in list_seq_df.index:
-                if keyA == keyB:
-                    continue
-                elif list_seq_df.loc[keyA].sequence == list_seq_df.loc[keyB].sequence:
-                    list_seq_df.loc[keyA]["equal"].append(
-                        list_seq_df.loc[keyB].chain_name
-                    )
-                    list_seq_df.loc[keyB]["equal"].append(
-                        list_seq_df.loc[keyA].chain_name
-                    )
-        for key in list_seq_df.index:
-            domain_name = []
-            domain_id = []
-            for domain in domains.index:
-                for pair in list_seq_df.loc[key]["start_stop_pairs"]:
-                    try:
-                        if pair[0] >= domains.loc[domain]["Stop"]:
-                            continue
+    )
+    return pdb_parsed
+
+
+def get_sequence(pdb_code, pdb_file, chains_to_do, domains, header=None):
+    """Sequence, DBREF segments and domains of the chains of a PDB file.
+
+    ``header`` is the PDBHeader of the file if already read.
+    """
+    if header is None:
+        header = read_header(pdb_file)
+    sequence = {chain: header.sequence(chain) for chain in header.chains}
+    chain_stat = header.chain_ranges()
+    list_seq_df = pd.DataFrame(
+        columns=[
+            "PDB_code",
+            "chain_name",
+            "sequence",
+            "equal",
+            "start",
+            "stop",
+            "length",
+            "start_stop_pairs",
+            "domain",
+            "domain_id",
+            "seq_list",
+        ]
+    )
+    for key, values in sequence.items():
+        if key in chains_to_do:
+            if key in chain_stat.keys():
+                list_seq_df.loc[pdb_code + "_" + key] = {
+                    "PDB_code": pdb_code,
+                    "chain_name": key,
+                    "sequence": values,
+                    "equal": [],
+                    "start": chain_stat[key]["start"],
+                    "stop": chain_stat[key]["stop"],
+                    "length": len(values),
+                    "start_stop_pairs": chain_stat[key]["start_stop"],
+                    "domain": [None],
+                    "domain_id": [None],
+                    "seq_list": [None],
+                }
+            else:
+                list_seq_df.loc[pdb_code + "_" + key] = {
+                    "PDB_code": pdb_code,
+                    "chain_name": key,
+                    "sequence": values,
+                    "equal": [],
+                    "start": 1,
+                    "stop": len(values),
+                    "length": len(values),
+                    "start_stop_pairs": [],
+                    "domain": [None],
+                    "domain_id": [None],
+                    "seq_list": [None],
+                }
+
+    for keyA in list_seq_df.index:
+        for keyB in list_seq_df.index:
+            if keyA == keyB:
+                continue
+            elif list_seq_df.loc[keyA].sequence == list_seq_df.loc[keyB].sequence:
+                list_seq_df.loc[keyA]["equal"].append(list_seq_df.loc[keyB].chain_name)
+                list_seq_df.loc[keyB]["equal"].append(list_seq_df.loc[keyA].chain_name)
+    for key in list_seq_df.index:
+        domain_name = []
+        domain_id = []
+        for domain in domains.index:
+            for pair in list_seq_df.loc[key]["start_stop_pairs"]:
+                try:
+                    if pair[0] >= domains.loc[domain]["Stop"]:
+                        continue
 
-                        elif pair[0] <= domains.loc[domain]["Start"]:
-                            if pair[1] >= domains.loc[domain]["Stop"]:
+                    elif pair[0] <= domains.loc[domain]["Start"]:
+                        if pair[1] >= domains.loc[domain]["Stop"]:
+                            domain_name.append(domains.loc[domain]["name"])
+                            try:
+                                domain_id.append(domains.loc[domain]["domain_id"])
+                            except KeyError:
+                                pass
+                            continue
+                        elif pair[1] <= domains.loc[domain]["Start"]:
+                            continue
+                        else:
+                            ratio = (
+                                float(pair[1]) - float(domains.loc[domain]["Start"])
+                            ) / (
+                                float(domains.loc[domain]["Stop"])
+                                - float(domains.loc[domain]["Start"])
+                            )
+                            if ratio > 0.3:
                                 domain_name.append(domains.loc[domain]["name"])
                                 try:
                                     domain_id.append(domains.loc[domain]["domain_id"])
                                 except KeyError:
                                     pass
                                 continue
-                            elif pair[1] <= domains.loc[domain]["Start"]:
+                    else:
+                        if pair[1] < domains.loc[domain]["Stop"]:
+                            ratio = (float(pair[1]) - float(pair[0])) / (
+                                float(domains.loc[domain]["Stop"])
+                                - float(domains.loc[domain]["Start"])
+                            )
+                            if ratio > 0.3:
+                                domain_name.append(domains.loc[domain]["name"])
+                                try:
+                                    domain_id.append(domains.loc[domain]["domain_id"])
+                                except KeyError:
+                                    pass
                                 continue
-                            else:
-                                ratio = (
-                                    float(pair[1]) - float(domains.loc[domain]["Start"])
-                                ) / (
-                                    float(domains.loc[domain]["Stop"])
-                                    - float(domains.loc[domain]["Start"])
-                                )
-                                if ratio > 0.3:
-                                    domain_name.append(domains.loc[domain]["name"])
-                                    try:
-                                        domain_id.append(
-                                            domains.loc[domain]["domain_id"]
-                                        )
-                                    except KeyError:
-                                        pass
-                                    continue
                         else:
-                            if pair[1] < domains.loc[domain]["Stop"]:
-                                ratio = (float(pair[1]) - float(pair[0])) / (
-                                    float(domains.loc[domain]["Stop"])
-                                    - float(domains.loc[domain]["Start"])
-                                )
-                                if ratio > 0.3:
-                                    domain_name.append(domains.loc[domain]["name"])
-                                    try:
-                                        domain_id.append(
-                                            domains.loc[domain]["domain_id"]
-                                        )
-                                    except KeyError:
-                                        pass
-                                    continue
-                            else:
-                                ratio = (
-                                    float(domains.loc[domain]["Stop"]) - float(pair[0])
-                                ) / (
-                                    float(domains.loc[domain]["Stop"])
-                                    - float(domains.loc[domain]["Start"])
-                                )
-                                if ratio > 0.3:
-                                    domain_name.append(domains.loc[domain]["name"])
-                                    try:
-                                        domain_id.append(
-                                            domains.loc[domain]["domain_id"]
-                                        )
-                                    except KeyError:
-                                        pass
-                                    continue
-                    except TypeError:
-                        pass
-
-            if len(domain_name) == 0:
-                domain_name = [""]
-            seq_list = list(list_seq_df.sequence.loc[key])
-            list_seq_df.at[key, "domain"] = domain_name
-            list_seq_df.at[key, "domain_id"] = domain_id
-            list_seq_df.at[key, "seq_list"] = seq_list
+                            ratio = (
+                                float(domains.loc[domain]["Stop"]) - float(pair[0])
+                            ) / (
+                                float(domains.loc[domain]["Stop"])
+                                - float(domains.loc[domain]["Start"])
+                            )
+                            if ratio > 0.3:
+                                domain_name.append(domains.loc[domain]["name"])
+                                try:
+                                    domain_id.append(domains.loc[domain]["domain_id"])
+                                except KeyError:
+                                    pass
+                                continue
+                except TypeError:
+                    pass
+
+        if len(domain_name) == 0:
+            domain_name = [""]
+        seq_list = list(list_seq_df.sequence.loc[key])
+        list_seq_df.at[key, "domain"] = domain_name
+        list_seq_df.at[key, "domain_id"] = domain_id
+        list_seq_df.at[key, "seq_list"] = seq_list
     return list_seq_df
 
 
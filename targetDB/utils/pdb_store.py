@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+"""Compressed store of the PDB files shared by all the targets.
+
+Structures are kept gzip compressed as ``DB_files/PDB/<code>.pdb.gz`` next to
+a small JSON sidecar ``<code>.json`` holding the header facts extracted in a
+single pass when the file is added (see ``pdb_parser.scan_header``: REMARK 350
+biomolecules, DBREF records, SEQRES residues and MODRES map by chain, chain
+list) and the SHA-256 of the uncompressed content. Code needing those facts
+reads the sidecar instead of scanning the structure again; the coordinates are
+read through ``pdb_parser.open_pdb``.
+
+Plain ``<code>.pdb`` files left by older builds are compressed into the store
+the first time they are looked up.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+
+from utils import pdb_parser
+
+SIDECAR_VERSION = 1
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def code_of(pdb_file):
+    """PDB code of a stored (or plain) PDB file."""
+    return Path(pdb_file).name.split(".")[0]
+
+
+def sidecar_of(pdb_file):
+    pdb_file = Path(pdb_file)
+    return pdb_file.with_name(code_of(pdb_file) + ".json")
+
+
+def _read_sidecar(path):
+    try:
+        with open(path, "r") as sidecar:
+            header = json.load(sidecar)
+    except (OSError, ValueError):
+        return None
+    if header.get("version") != SIDECAR_VERSION:
+        return None
+    return header
+
+
+def header(pdb_file):
+    """Header records (pdb_parser.PDBHeader) of a PDB file, from its sidecar if any."""
+    facts = _read_sidecar(sidecar_of(pdb_file))
+    if facts is None:
+        return pdb_parser.read_header(pdb_file)
+    return pdb_parser.PDBHeader.from_dict(facts)
+
+
+def _is_gzip(path):
+    with open(path, "rb") as handle:
+        return handle.read(2) == GZIP_MAGIC
+
+
+def _temp_path(path):
+    return path.with_name(
+        "%s.%d.%d.tmp" % (path.name, os.getpid(), threading.get_ident())
+    )
+
+
+class PDBStore:
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def path(self, code):
+        return self.directory / (code + ".pdb.gz")
+
+    def sidecar_path(self, code):
+        return self.directory / (code + ".json")
+
+    def __contains__(self, code):
+        # The sidecar is written last: its presence means the entry is complete
+        return self.path(code).is_file() and self.sidecar_path(code).is_file()
+
+    def temp_path(self, code):
+        """Unique temporary file in the store directory (for downloads)."""
+        return _temp_path(self.directory / (code + ".part"))
+
+    def find(self, code):
+        """Path of the stored file of ``code`` or None.
+
+        A plain ``<code>.pdb`` file of an older build is added to the store
+        (and removed) on the way.
+        """
+        if code in self:
+            return self.path(code)
+        plain = self.directory / (code + ".pdb")
+        if plain.is_file():
+            return self.add(code, plain)
+        return None
+
+    def add(self, code, source):
+        """Move the PDB file ``source`` (gzip compressed or not) into the store.
+
+        The content is read in full (a truncated gzip file raises EOFError /
+        OSError and leaves the store unchanged), hashed and its header facts
+        written to the sidecar. Returns the path of the stored file.
+        """
+        source = Path(source)
+        compressed = _is_gzip(source)
+        opener = gzip.open if compressed else open
+        digest = hashlib.sha256()
+        size = 0
+        with opener(str(source), "rb") as content:
+            for chunk in iter(lambda: content.read(1024 * 1024), b""):
+                digest.update(chunk)
+                size += len(chunk)
+        with opener(str(source), "rt") as content:
+            facts = pdb_parser.scan_header(content).to_dict()
+        facts.update(
+            version=SIDECAR_VERSION, code=code, sha256=digest.hexdigest(), size=size
+        )
+
+        target = self.path(code)
+        if compressed:
+            os.replace(str(source), str(target))
+        else:
+            tmp_path = _temp_path(target)
+            try:
+                with source.open("rb") as plain, gzip.open(str(tmp_path), "wb") as gz:
+                    shutil.copyfileobj(plain, gz, 1024 * 1024)
+                os.replace(str(tmp_path), str(target))
+            finally:
+                if tmp_path.exists():
+                    tmp_path.unlink()
+            source.unlink()
+
+        sidecar = self.sidecar_path(code)
+        tmp_path = _temp_path(sidecar)
+        with tmp_path.open("w") as handle:
+            json.dump(facts, handle)
+        os.replace(str(tmp_path), str(sidecar))
+        return target
+
+    def header(self, code):
+        """Header records (pdb_parser.PDBHeader) of a stored structure."""
+        return header(self.path(code))
+
+    def sidecar(self, code):
+        """Content of the sidecar of a stored structure (None if missing)."""
+        return _read_sidecar(self.sidecar_path(code))
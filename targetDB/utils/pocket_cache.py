@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""Cache of the fpocket results keyed by content.
+
+The key of a pocket search is a hash of the coordinates of the structure given
+to fpocket (the stripped biomolecule), of the fpocket executable (its content
+stands for its version) and of the search parameters. The same structure
+found through different targets, or under another name (direct PDB entry or
+BLAST hit), hits the same entry, and a changed structure or fpocket build
+misses it. An entry holds the parameters and residue contacts of every pocket
+(zlib compressed JSON), so a hit skips both the fpocket run and the parsing of
+the ``pocketN_atm.pdb`` files. Entries are kept in
+~/.targetdb/cache/pockets.sqlite.
+"""
+
+import hashlib
+import json
+import shutil
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+
+CACHE_PATH = Path("~/.targetdb/cache/pockets.sqlite").expanduser()
+# Records holding the coordinates of a structure
+COORDINATE_RECORDS = (b"ATOM", b"HETATM", b"MODEL", b"ENDMDL", b"TER")
+
+cache_sql = """CREATE TABLE IF NOT EXISTS pocket_results
+(
+key        text  not null,
+pockets    blob  not null,
+created_at float not null,
+primary key (key)
+);"""
+
+_exe_digests = {}
+_exe_lock = threading.Lock()
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fpocket_version(fpocket_exe):
+    """Hash of the fpocket executable (computed once per file version)."""
+    exe = shutil.which(str(fpocket_exe)) or str(fpocket_exe)
+    path = Path(exe).resolve()
+    stat = path.stat()
+    stamp = (str(path), stat.st_size, stat.st_mtime)
+    with _exe_lock:
+        if stamp not in _exe_digests:
+            _exe_digests[stamp] = _file_digest(path)
+        return _exe_digests[stamp]
+
+
+def coordinates_digest(pdb_file):
+    digest = hashlib.sha256()
+    with open(pdb_file, "rb") as pdb:
+        for line in pdb:
+            if line.startswith(COORDINATE_RECORDS):
+                digest.update(line.rstrip())
+                digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def result_key(pdb_file, fpocket_exe, params):
+    """Key of the fpocket search of ``pdb_file`` (None if it cannot be computed)."""
+    try:
+        parts = [
+            coordinates_digest(pdb_file),
+            fpocket_version(fpocket_exe),
+            sorted(params.items()),
+        ]
+    except OSError:
+        return None
+    return hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+
+
+def _connect():
+    CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    connector = sqlite3.connect(str(CACHE_PATH), timeout=30)
+    connector.execute(cache_sql)
+    return connector
+
+
+def get(key):
+    """Pockets of a search: {pocket_number: {"param": {...}, "contacts": {...}}} or None."""
+    if key is None or not CACHE_PATH.is_file():
+        return None
+    connector = _connect()
+    try:
+        row = connector.execute(
+            "SELECT pockets FROM pocket_results WHERE key=?", (key,)
+        ).fetchone()
+    finally:
+        connector.close()
+    if row is None:
+        return None
+    return json.loads(zlib.decompress(row[0]))
+
+
+def put(key, pockets):
+    if key is None:
+        return
+    blob = zlib.compress(json.dumps(pockets, separators=(",", ":")).encode())
+    connector = _connect()
+    try:
+        with connector:
+            connector.execute(
+                "INSERT OR REPLACE INTO pocket_results (key, pockets, created_at) "
+                "VALUES (?,?,?)",
+                (key, sqlite3.Binary(blob), time.time()),
+            )
+    finally:
+        connector.close()
@@ -1,24 +1,48 @@
 #!/usr/bin/env python
+import contextlib
+import multiprocessing
 import os
+import shutil
 import subprocess
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 import pandas as pd
 from operator import itemgetter
 
 from utils import pdb_parser as parser
+from utils import pdb_store as pstore
+from utils import pocket_cache as pcache
 
 from Bio.PDB import *
 from pathlib import Path
 
-Bioparser = PDBParser(PERMISSIVE=1, QUIET=True)
-io = PDBIO()
+FPOCKET_ARGS = ["-f"]
+# Written in an fpocket output: key (see pocket_cache) of the search it holds
+KEY_FILE = ".targetdb_key"
 
 
-def fpocket_launcher(pdb, pdb_file, sphere_size_min=3.0, verbose=False):
+def fpocket_launcher(
+    pdb,
+    pdb_file,
+    sphere_size_min=3.0,
+    verbose=False,
+    fpocket_exe=None,
+    context=None,
+    timeout=None,
+):
     if verbose:
         print("[POCKET SEARCH]: " + str(pdb_file))
+    # fpocket runs on a single core, taken from the build context when there is one
+    cores = context.cores(1) if context is not None else contextlib.nullcontext()
     try:
-        subprocess.check_output([fpocket_path, "-f", str(pdb)])
+        with cores:
+            subprocess.check_output(
+                [fpocket_exe] + FPOCKET_ARGS + [str(pdb)], timeout=timeout
+            )
+    except subprocess.TimeoutExpired:
+        print("[POCKET TIMEOUT]: fpocket stopped after %ss on %s" % (timeout, pdb_file))
+        # A partial output must not be taken for a finished search
+        shutil.rmtree(str(Path(pdb).with_name(Path(pdb).stem + "_out")), True)
     except Exception:
         return
 
@@ -53,15 +77,82 @@ def parse_pockets(out_file):
     return pockets_dict
 
 
-def get_object(p_dict, pdb_name, out_pockets_dir_path, pdb_info, domain):
+def pocket_contacts(pocket_file):
+    """Residue numbers of a pocket by chain, read from its pocketN_atm.pdb file."""
+    # A parser per call, pockets can be read from several threads
+    pocket = PDBParser(PERMISSIVE=1, QUIET=True).get_structure(
+        Path(pocket_file).stem, str(pocket_file)
+    )
+    data = {}
+    # First model (none when fpocket wrote an empty file)
+    for chain in next(iter(pocket), []):
+        data[str(chain.id).strip(" ")] = []
+        for residue in chain:
+            data[str(chain.id).strip(" ")].append(str(residue.id[1]).strip(" "))
+    return data
+
+
+def get_object(p_dict, pdb_name, out_pockets_dir_path, pdb_info, domain, contacts=None):
     pockets_objects = {}
     for key, values in p_dict.items():
         pockets_objects[key] = Pockets(
-            values, pdb_name, key, out_pockets_dir_path, pdb_info, domain
+            values,
+            pdb_name,
+            key,
+            out_pockets_dir_path,
+            pdb_info,
+            domain,
+            contacts=contacts.get(key) if contacts else None,
         )
     return pockets_objects
 
 
+def read_output(out_file_path, out_pockets_dir_path):
+    """Parameters and residue contacts of the pockets of an fpocket output."""
+    result = {}
+    for pnumber, values in parse_pockets(str(out_file_path)).items():
+        number = str(int(str(pnumber).lstrip("p")))
+        result[pnumber] = {
+            "param": values,
+            "contacts": pocket_contacts(
+                Path(out_pockets_dir_path).joinpath("pocket" + number + "_atm.pdb")
+            ),
+        }
+    return result
+
+
+def _result_objects(result, pdb_name, out_pockets_dir_path, pdb_info, domain):
+    return get_object(
+        {k: v["param"] for k, v in result.items()},
+        pdb_name,
+        str(out_pockets_dir_path),
+        pdb_info,
+        domain,
+        contacts={k: v["contacts"] for k, v in result.items()},
+    )
+
+
+def _search_key(pdb_strip_path, fpocket_exe):
+    if fpocket_exe is None or not pdb_strip_path.is_file():
+        return None
+    return pcache.result_key(pdb_strip_path, fpocket_exe, {"args": FPOCKET_ARGS})
+
+
+def _drop_stale_output(out_path, key):
+    """Remove an fpocket output of another version of the structure or of fpocket."""
+    marker = out_path.joinpath(KEY_FILE)
+    if key is not None and marker.is_file() and marker.read_text() != key:
+        shutil.rmtree(str(out_path), True)
+
+
+def _keep_result(out_path, out_file_path, out_pockets_dir_path, key):
+    result = read_output(out_file_path, out_pockets_dir_path)
+    if key is not None:
+        pcache.put(key, result)
+        out_path.joinpath(KEY_FILE).write_text(key)
+    return result
+
+
 class ChainSelect(Select):
     def __init__(self, list_of_chains):
         self.list = list_of_chains
@@ -73,68 +164,38 @@ class ChainSelect(Select):
             return False
 
 
-def get_pockets(
+def _pdb_lock(context, pdb_code):
+    if context is None:
+        return contextlib.nullcontext()
+    return context.lock(("POCKETS", pdb_code))
+
+
+def get_pdb_pockets(
+    f,
     path,
     sphere_size=3.0,
     pdb_info=pd.DataFrame(),
     domain=pd.DataFrame(),
     alternate=False,
     alternate_pdb=pd.DataFrame(),
-    uniprot_id=None,
     fpocket_exe=None,
     verbose=False,
+    context=None,
+    fpocket_timeout=None,
 ):
-    global fpocket_path
-    fpocket_path = fpocket_exe
+    """Pockets of a single PDB file, running fpocket unless its output is already there.
 
-    pock = pd.DataFrame(
-        columns=[
-            "PDB_code",
-            "Target_id",
-            "Pocket_number",
-            "Pocket_id",
-            "Score",
-            "DrugScore",
-            "apolar_sasa",
-            "polar_sasa",
-            "total_sasa",
-            "volume",
-            "blast",
-            "druggable",
-        ]
-    )
-    pock_chain = pd.DataFrame(columns=["Pocket_id", "Chain_id", "List_of_contacts"])
-    pock_domain = pd.DataFrame(columns=["Pocket_id", "Domain_id", "Coverage"])
-
-    if os.name == "nt":
-        return {
-            "pockets": pock,
-            "pockets_chain": pock_chain,
-            "pockets_domain": pock_domain,
-        }
-
-    files = []
-    if not pdb_info.empty:
-        for pdb_code in pdb_info.index:
-            if Path(pdb_info.path.loc[pdb_code]).is_file():
-                files.append(pdb_info.loc[pdb_code]["path"])
-    if not alternate_pdb.empty:
-        group = alternate_pdb.groupby("PDB_code")
-        c_list = group.chain_letter.apply(list)
-        p_list = group.path.apply(set).apply(list).apply(lambda x: "".join(x))
-        alternate_pdb = pd.DataFrame({"chain_letter": c_list, "path": p_list})
-        for pdb_code in alternate_pdb.index:
-            if Path(alternate_pdb.path.loc[pdb_code]).is_file():
-                files.append(alternate_pdb.loc[pdb_code]["path"])
-    results = {}
-    for f in files:
-        pdb_file = Path(f).name
-        pdb_code = str(pdb_file).rstrip(".pdb")
+    Returns ``(pdb_code, pockets)``, pockets being None when fpocket failed.
+    """
+    pdb_file = Path(f).name
+    pdb_code = pstore.code_of(f)
+    # Targets built concurrently can share PDB files (and fpocket outputs)
+    with _pdb_lock(context, pdb_code):
         pocket_path = path.joinpath("POCKETS")
         if not pocket_path.is_dir():
             pocket_path.mkdir(parents=True, exist_ok=True)
 
-        pdb_parsed = parser.parse_header(pdb_code, f)
+        pdb_parsed = parser.parse_header(pdb_code, f, header=pstore.header(f))
 
         pdb_strip_path = pocket_path.joinpath(pdb_code + "_ALL.pdb")
         out_path = pocket_path.joinpath(pdb_code + "_ALL_out")
@@ -180,13 +241,18 @@ def get_pockets(
             else:
                 chain_to_keep = []
 
-            structure = Bioparser.get_structure(pdb_code, f)
-            io.set_structure(structure[0])
+            # Parser/writer instances are not shared between threads
+            with parser.open_pdb(f) as pdb:
+                structure = PDBParser(PERMISSIVE=1, QUIET=True).get_structure(
+                    pdb_code, pdb
+                )
+            pdb_io = PDBIO()
+            pdb_io.set_structure(structure[0])
             if chain_to_keep:
                 chain_select = ChainSelect(chain_to_keep)
-                io.save(str(pdb_strip_path), chain_select)
+                pdb_io.save(str(pdb_strip_path), chain_select)
             else:
-                io.save(str(pdb_strip_path))
+                pdb_io.save(str(pdb_strip_path))
         if alternate:
             info = pd.DataFrame()
         elif not pdb_info.empty:
@@ -194,6 +260,17 @@ def get_pockets(
         else:
             info = pd.DataFrame()
 
+        # The same structure seen before (under any code, for any target)
+        key = _search_key(pdb_strip_path, fpocket_exe)
+        cached = pcache.get(key)
+        if cached is not None:
+            if verbose:
+                print("[POCKET CACHED]: " + pdb_code)
+            return pdb_code, _result_objects(
+                cached, pdb_code, out_pockets_dir_path, info, domain
+            )
+        _drop_stale_output(out_path, key)
+
         if out_path.is_dir():
             if out_file_path.is_file():
                 if out_pockets_dir_path.is_dir():
@@ -201,17 +278,21 @@ def get_pockets(
                     if p_out != 0:
                         if verbose:
                             print("[POCKET ALREADY EXISTS]: " + pdb_code)
-                        pockets = parse_pockets(str(out_file_path))
-                        results[pdb_code] = get_object(
-                            pockets, pdb_code, str(out_pockets_dir_path), info, domain
+                        result = _keep_result(
+                            out_path, out_file_path, out_pockets_dir_path, key
+                        )
+                        return pdb_code, _result_objects(
+                            result, pdb_code, out_pockets_dir_path, info, domain
                         )
-                        continue
                     else:
                         fpocket_launcher(
                             pdb_strip_path,
                             pdb_file,
                             sphere_size_min=sphere_size,
                             verbose=verbose,
+                            fpocket_exe=fpocket_exe,
+                            context=context,
+                            timeout=fpocket_timeout,
                         )
                 else:
                     fpocket_launcher(
@@ -219,6 +300,9 @@ def get_pockets(
                         pdb_file,
                         sphere_size_min=sphere_size,
                         verbose=verbose,
+                        fpocket_exe=fpocket_exe,
+                        context=context,
+                        timeout=fpocket_timeout,
                     )
             else:
                 fpocket_launcher(
@@ -226,10 +310,19 @@ def get_pockets(
                     pdb_file,
                     sphere_size_min=sphere_size,
                     verbose=verbose,
+                    fpocket_exe=fpocket_exe,
+                    context=context,
+                    timeout=fpocket_timeout,
                 )
         else:
             fpocket_launcher(
-                pdb_strip_path, pdb_file, sphere_size_min=sphere_size, verbose=verbose
+                pdb_strip_path,
+                pdb_file,
+                sphere_size_min=sphere_size,
+                verbose=verbose,
+                fpocket_exe=fpocket_exe,
+                context=context,
+                timeout=fpocket_timeout,
             )
         if out_path.is_dir():
             if out_file_path.is_file():
@@ -238,9 +331,11 @@ def get_pockets(
                     if p_out != 0:
                         if verbose:
                             print("[POCKET SEARCH DONE]: " + pdb_code)
-                        pockets = parse_pockets(str(out_file_path))
-                        results[pdb_code] = get_object(
-                            pockets, pdb_code, str(out_pockets_dir_path), info, domain
+                        result = _keep_result(
+                            out_path, out_file_path, out_pockets_dir_path, key
+                        )
+                        return pdb_code, _result_objects(
+                            result, pdb_code, out_pockets_dir_path, info, domain
                         )
                     else:
                         print(
@@ -267,6 +362,135 @@ def get_pockets(
             )
             print("[ERROR]: Script will now continue ...")
 
+    return pdb_code, None
+
+
+def _pocket_job(f, path, job):
+    return get_pdb_pockets(f, path, **job)
+
+
+def process_pool(max_workers):
+    """Pool of worker processes for the pocket searches.
+
+    Workers are spawned (not forked): the builds run several threads whose
+    locks must not be copied into the children.
+    """
+    return ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+    )
+
+
+def _run_pocket_jobs(files, path, job, context, max_workers):
+    """get_pdb_pockets of every file run in worker processes, in file order.
+
+    The per-PDB lock and the core of a job are taken here, by the thread
+    waiting for it, as the workers do not share the build context.
+    """
+    if context is not None:
+        pool = context.process_pool()
+        own_pool = None
+    else:
+        pool = own_pool = process_pool(max_workers)
+
+    def run(f):
+        cores = context.cores(1) if context is not None else contextlib.nullcontext()
+        with _pdb_lock(context, pstore.code_of(f)), cores:
+            return pool.submit(_pocket_job, f, path, job).result()
+
+    try:
+        with ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="pocket-job"
+        ) as threads:
+            return list(threads.map(run, files))
+    finally:
+        if own_pool is not None:
+            own_pool.shutdown()
+
+
+def get_pockets(
+    path,
+    sphere_size=3.0,
+    pdb_info=pd.DataFrame(),
+    domain=pd.DataFrame(),
+    alternate=False,
+    alternate_pdb=pd.DataFrame(),
+    uniprot_id=None,
+    fpocket_exe=None,
+    verbose=False,
+    context=None,
+    max_workers=None,
+    fpocket_timeout=None,
+):
+    """Pockets of the PDB files of ``pdb_info`` (or ``alternate_pdb``).
+
+    The structures are processed (strip, fpocket, parse) by up to
+    ``max_workers`` worker processes (default: ``pocket_workers`` of the build
+    context, else 1); fpocket is stopped after ``fpocket_timeout`` seconds.
+    The results are merged in the order of the files whatever the order in
+    which the jobs end.
+    """
+    pock = pd.DataFrame(
+        columns=[
+            "PDB_code",
+            "Target_id",
+            "Pocket_number",
+            "Pocket_id",
+            "Score",
+            "DrugScore",
+            "apolar_sasa",
+            "polar_sasa",
+            "total_sasa",
+            "volume",
+            "blast",
+            "druggable",
+        ]
+    )
+    pock_chain = pd.DataFrame(columns=["Pocket_id", "Chain_id", "List_of_contacts"])
+    pock_domain = pd.DataFrame(columns=["Pocket_id", "Domain_id", "Coverage"])
+
+    if os.name == "nt":
+        return {
+            "pockets": pock,
+            "pockets_chain": pock_chain,
+            "pockets_domain": pock_domain,
+        }
+
+    files = []
+    if not pdb_info.empty:
+        for pdb_code in pdb_info.index:
+            if Path(pdb_info.path.loc[pdb_code]).is_file():
+                files.append(pdb_info.loc[pdb_code]["path"])
+    if not alternate_pdb.empty:
+        group = alternate_pdb.groupby("PDB_code")
+        c_list = group.chain_letter.apply(list)
+        p_list = group.path.apply(set).apply(list).apply(lambda x: "".join(x))
+        alternate_pdb = pd.DataFrame({"chain_letter": c_list, "path": p_list})
+        for pdb_code in alternate_pdb.index:
+            if Path(alternate_pdb.path.loc[pdb_code]).is_file():
+                files.append(alternate_pdb.loc[pdb_code]["path"])
+    if max_workers is None:
+        max_workers = context.pocket_workers if context is not None else 1
+    if fpocket_timeout is None and context is not None:
+        fpocket_timeout = context.fpocket_timeout
+    job = dict(
+        sphere_size=sphere_size,
+        pdb_info=pdb_info,
+        domain=domain,
+        alternate=alternate,
+        alternate_pdb=alternate_pdb,
+        fpocket_exe=fpocket_exe,
+        verbose=verbose,
+        fpocket_timeout=fpocket_timeout,
+    )
+    if max_workers > 1 and len(files) > 1:
+        found = _run_pocket_jobs(files, path, job, context, max_workers)
+    else:
+        found = [get_pdb_pockets(f, path, context=context, **job) for f in files]
+    results = {}
+    for pdb_code, pockets in found:
+        if pockets is not None:
+            results[pdb_code] = pockets
+
     if results:
         pock = pd.DataFrame(
             columns=[
@@ -421,7 +645,14 @@ class Pockets:
     """
 
     def __init__(
-        self, values, pdb_name, pnumber, out_pockets_dir_path, pdb_info, domain
+        self,
+        values,
+        pdb_name,
+        pnumber,
+        out_pockets_dir_path,
+        pdb_info,
+        domain,
+        contacts=None,
     ):
         self.druggable = "FALSE"
         self.param = {}
@@ -434,7 +665,7 @@ class Pockets:
         self.pocket_number = pnumber
         self.pocket_path = out_pockets_dir_path
         if not pdb_info.empty and not domain.empty:
-            self.get_residues(domain, pdb_info)
+            self.get_residues(domain, pdb_info, contacts=contacts)
         else:
             self.chain_coverage = {}
             self.part_of_domain = []
@@ -455,17 +686,14 @@ class Pockets:
         print("Area: " + str(self.total_sasa))
         print("==================================================")
 
-    def get_residues(self, domain, pdb_info):
-        pocket_number = str(self.pocket_number).lstrip("p")
-        file = Path(self.pocket_path).joinpath("pocket" + pocket_number + "_atm.pdb")
-
-        pocket = Bioparser.get_structure(self.pocket_number, str(file))
-        data = {}
-        for chain in pocket[0]:
-            data[str(chain.id).strip(" ")] = []
-            for residue in chain:
-                data[str(chain.id).strip(" ")].append(str(residue.id[1]).strip(" "))
-        self.chain_coverage = data
+    def get_residues(self, domain, pdb_info, contacts=None):
+        """Residue contacts (read from the pocket file unless given) and domains."""
+        if contacts is None:
+            pocket_number = str(self.pocket_number).lstrip("p")
+            contacts = pocket_contacts(
+                Path(self.pocket_path).joinpath("pocket" + pocket_number + "_atm.pdb")
+            )
+        self.chain_coverage = {c: list(res) for c, res in contacts.items()}
         self.part_of_domain = []
         domain_coverage = {}
         for d in domain.index:
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+"""Batched PubMed publication counts for the list reports.
+
+One ``esearch`` (count only) request is made per gene and search term. The
+requests share one HTTP session, run concurrently and are paced at the rate
+NCBI allows (3 requests/s, 10 with an API key). Counts are cached on disk
+(~/.targetdb/cache/pubmed_counts.sqlite) and reused until they are older
+than ``CACHE_TTL``.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+ESEARCH_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
+CACHE_PATH = Path("~/.targetdb/cache/pubmed_counts.sqlite").expanduser()
+CACHE_TTL = 7 * 24 * 3600  # seconds
+MAX_RETRIES = 5
+
+cache_sql = """CREATE TABLE IF NOT EXISTS pubmed_counts
+(
+term       text    not null,
+count      integer not null,
+fetched_at float   not null,
+primary key (term)
+);"""
+
+
+def search_term(gene_name, mesh_term=None):
+    """PubMed query of ``gene_name``, restricted to a MeSH term when given."""
+    if mesh_term:
+        return '"' + mesh_term + '"[Mesh] AND ' + gene_name
+    return gene_name
+
+
+class RateLimiter:
+    """Space out calls from any number of threads to ``rate`` per second."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self.lock = threading.Lock()
+        self.next_call = 0.0
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_call - now
+            self.next_call = max(now, self.next_call) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+def _read_cache(terms, ttl):
+    if not CACHE_PATH.is_file():
+        return {}
+    connector = sqlite3.connect(str(CACHE_PATH), timeout=30)
+    try:
+        connector.execute(cache_sql)
+        rows = connector.execute(
+            "SELECT term, count FROM pubmed_counts WHERE fetched_at >= ? "
+            "AND term IN (SELECT value FROM json_each(?))",
+            (time.time() - ttl, json.dumps(list(terms))),
+        ).fetchall()
+    finally:
+        connector.close()
+    return dict(rows)
+
+
+def _write_cache(counts):
+    CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    connector = sqlite3.connect(str(CACHE_PATH), timeout=30)
+    try:
+        connector.execute(cache_sql)
+        with connector:
+            connector.executemany(
+                "INSERT OR REPLACE INTO pubmed_counts (term, count, fetched_at) "
+                "VALUES (?,?,?)",
+                ((term, count, time.time()) for term, count in counts.items()),
+            )
+    finally:
+        connector.close()
+
+
+def _fetch_count(session, limiter, term, email, api_key):
+    params = {
+        "db": "pubmed",
+        "term": term,
+        "rettype": "count",
+        "retmode": "json",
+        "tool": "targetDB",
+        "email": email,
+    }
+    if api_key:
+        params["api_key"] = api_key
+    for attempt in range(MAX_RETRIES):
+        limiter.wait()
+        try:
+            response = session.get(ESEARCH_URL, params=params, timeout=30)
+            response.raise_for_status()
+            return int(response.json()["esearchresult"]["count"])
+        except (requests.exceptions.RequestException, KeyError, ValueError):
+            # 429 (rate exceeded) and server errors: back off and retry
+            time.sleep(2**attempt)
+    return None
+
+
+def get_counts(gene_names, email, mesh_terms=(None,), api_key=None, ttl=CACHE_TTL):
+    """Number of PubMed publications for every gene and search term.
+
+    Returns a dict ``{(gene_name, mesh_term): count}``; ``mesh_term`` None is the
+    total count of the gene. Counts that could not be retrieved are None (and
+    not cached).
+    """
+    terms = {
+        (gene_name, mesh_term): search_term(gene_name, mesh_term)
+        for gene_name in gene_names
+        for mesh_term in mesh_terms
+    }
+    try:
+        cached = _read_cache(set(terms.values()), ttl)
+    except sqlite3.Error:
+        cached = {}
+    to_fetch = sorted(set(terms.values()) - set(cached))
+
+    fetched = {}
+    if to_fetch:
+        rate = 10 if api_key else 3
+        limiter = RateLimiter(rate)
+        with requests.Session() as session, ThreadPoolExecutor(rate) as pool:
+            results = pool.map(
+                lambda term: _fetch_count(session, limiter, term, email, api_key),
+                to_fetch,
+            )
+            fetched = {
+                term: count
+                for term, count in zip(to_fetch, results)
+                if count is not None
+            }
+        try:
+            _write_cache(fetched)
+        except (OSError, sqlite3.Error):
+            pass
+
+    counts = {**cached, **fetched}
+    return {key: counts.get(term) for key, term in terms.items()}
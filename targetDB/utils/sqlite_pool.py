@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+"""Cached read-only SQLite connections to the TargetDB database.
+
+Every reader (reports, descriptors, predictions, gene name conversion) gets
+its connection from ``connect``. Connections are opened once per thread and
+per process, with the page cache / memory-map PRAGMAs set, and are then
+reused by every later call.
+
+Standard deviations are computed natively in the queries with
+``stddev_sql`` rather than through a python aggregate called for every row.
+"""
+
+import json
+import math
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+# Read tuning applied to every pooled connection
+PRAGMAS = {
+    "mmap_size": 268435456,  # 256 MB
+    "cache_size": -65536,  # 64 MB (negative values are in KiB)
+    "temp_store": "MEMORY",
+    "query_only": "ON",
+}
+
+_local = threading.local()
+
+
+class StdevFunc:
+    def __init__(self):
+        self.M = 0.0
+        self.S = 0.0
+        self.k = 1
+
+    def step(self, value):
+        if value is None:
+            return
+        tM = self.M
+        self.M += (value - tM) / self.k
+        self.S += (value - tM) * (value - self.M)
+        self.k += 1
+
+    def finalize(self):
+        if self.k == 2:
+            return 0
+        elif self.k < 3:
+            return None
+        return math.sqrt(self.S / (self.k - 2))
+
+
+def stddev_sql(column):
+    """SQL expression of the sample standard deviation of ``column``.
+
+    Computed from count, sum and sum of squares with the built-in aggregates,
+    it gives the same values as ``StdevFunc`` (0 for a single value, NULL when
+    there is none) without calling back into python for each row. Sums of
+    squared deviations within rounding error of the sum of squares are set
+    to 0, as Welford's algorithm gives exactly 0 for identical values.
+    """
+    squares = "(TOTAL({0}*{0}) - TOTAL({0})*TOTAL({0})/COUNT({0}))".format(column)
+    return (
+        "(CASE WHEN COUNT({0}) > 1 THEN "
+        "CASE WHEN {1} > 1e-12*TOTAL({0}*{0}) "
+        "THEN sqrt({1} / (COUNT({0}) - 1)) ELSE 0.0 END "
+        "WHEN COUNT({0}) = 1 THEN 0.0 END)"
+    ).format(column, squares)
+
+
+def register_functions(connector):
+    """Add the functions used by the TargetDB queries to ``connector``.
+
+    ``sqrt`` is only built in when SQLite was compiled with the math functions;
+    it is otherwise provided in python (called once per group, not per row).
+    ``stddev`` is kept for ad-hoc queries.
+    """
+    try:
+        connector.execute("SELECT sqrt(1)")
+    except sqlite3.OperationalError:
+        connector.create_function("sqrt", 1, math.sqrt, deterministic=True)
+    connector.create_aggregate("stddev", 1, StdevFunc)
+
+
+def as_id_list(ids):
+    """Normalise ids given as one id, an iterable or a "','"-joined string."""
+    if isinstance(ids, str):
+        return [i for i in ids.split("','") if i]
+    # numpy scalars are converted to the matching python type for json
+    return [i.item() if hasattr(i, "item") else i for i in ids]
+
+
+def ids_param(ids):
+    """Bind value to filter a query on a list of ids of any length.
+
+    The ids are encoded as a single JSON array, used in the query as
+    ``column IN (SELECT value FROM json_each(:ids))``. The statement text is
+    the same whatever the number of ids and is not limited by the maximum
+    number of SQL variables.
+    """
+    return json.dumps(as_id_list(ids))
+
+
+def is_snapshot(db_path):
+    """A database file we cannot write to is treated as a released snapshot."""
+    return not os.access(str(db_path), os.W_OK)
+
+
+def open_connection(db_path, immutable=None):
+    """Open a new read-only connection to ``db_path``.
+
+    ``immutable=1`` is only set for released snapshots (read-only files), as
+    SQLite then skips all locking and change detection on the file.
+    """
+    path = Path(db_path).resolve()
+    if not path.is_file():
+        raise FileNotFoundError("TargetDB database not found: %s" % path)
+    if immutable is None:
+        immutable = is_snapshot(path)
+    uri = path.as_uri() + "?mode=ro"
+    if immutable:
+        uri += "&immutable=1"
+    connector = sqlite3.connect(uri, uri=True)
+    register_functions(connector)
+    for pragma, value in PRAGMAS.items():
+        connector.execute("PRAGMA %s=%s" % (pragma, value))
+    return connector
+
+
+def _connections():
+    # Connections must not cross a fork: drop the ones inherited from the parent
+    if getattr(_local, "pid", None) != os.getpid():
+        _local.pid = os.getpid()
+        _local.connections = {}
+    return _local.connections
+
+
+def connect(db_path, immutable=None):
+    """Return the cached read-only connection to ``db_path`` for this thread.
+
+    The connection is shared by all callers in the thread and must not be
+    closed by them; use ``close_all`` to release the connections.
+    """
+    key = str(Path(db_path).resolve())
+    connections = _connections()
+    if key not in connections:
+        connections[key] = open_connection(db_path, immutable=immutable)
+    return connections[key]
+
+
+def close_all():
+    """Close every connection cached by the current thread."""
+    connections = _connections()
+    for connector in connections.values():
+        connector.close()
+    connections.clear()
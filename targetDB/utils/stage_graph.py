@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+"""Small dependency graph of build stages run on a thread pool.
+
+Each stage is a function called with the results of the stages it depends on
+(in the order given). A stage starts as soon as all its dependencies are done,
+so independent stages (e.g. the fetches from different web services) overlap.
+A stage with a dependency that returned None is skipped and its own result is
+None. The wall time of every stage is recorded in ``timings``; the sequential
+steps following the graph can be timed with ``mark()``.
+"""
+
+import contextlib
+import contextvars
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class StageGraph:
+    def __init__(self):
+        self.stages = {}
+        self.timings = {}
+        self._last_mark = time.perf_counter()
+
+    def add(self, name, func, deps=()):
+        for dep in deps:
+            if dep not in self.stages:
+                raise ValueError("Unknown stage %r (needed by %r)" % (dep, name))
+        self.stages[name] = (func, tuple(deps))
+
+    def _call(self, name, func, args):
+        with self.timed(name):
+            return func(*args)
+
+    @contextlib.contextmanager
+    def timed(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = time.perf_counter() - start
+
+    def mark(self, name):
+        """Record the time since the previous mark (or the end of run) as stage ``name``."""
+        now = time.perf_counter()
+        self.timings[name] = now - self._last_mark
+        self._last_mark = now
+
+    def summary(self):
+        return ", ".join(
+            "%s %.1fs" % (name, seconds) for name, seconds in self.timings.items()
+        )
+
+    def run(self, max_workers=None):
+        """Run all the stages and return their results by name.
+
+        The first exception raised by a stage is re-raised once the stages
+        already running are finished (stages not started yet are not run).
+        """
+        results = {}
+        waiting = dict(self.stages)
+        running = {}
+        error = None
+        with ThreadPoolExecutor(
+            max_workers=max_workers or len(self.stages) or 1
+        ) as pool:
+            while waiting or running:
+                if error is None:
+                    for name, (func, deps) in list(waiting.items()):
+                        if not all(dep in results for dep in deps):
+                            continue
+                        del waiting[name]
+                        args = [results[dep] for dep in deps]
+                        if any(arg is None for arg in args):
+                            results[name] = None
+                            continue
+                        # Stages run with the context variables of the caller
+                        running[
+                            pool.submit(
+                                contextvars.copy_context().run,
+                                self._call,
+                                name,
+                                func,
+                                args,
+                            )
+                        ] = name
+                    if waiting and not running:
+                        # Skipped stages may have made others ready
+                        continue
+                else:
+                    waiting.clear()
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except Exception as exc:
+                        if error is None:
+                            error = exc
+        self._last_mark = time.perf_counter()
+        if error is not None:
+            raise error
+        return results
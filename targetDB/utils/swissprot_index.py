@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+"""UniProt records served from a local SwissProt flat file.
+
+``uniprot_sprot.dat`` (or ``uniprot_sprot.dat.gz``, decompressed once into the
+cache directory) is scanned once to build an index of the byte offset and
+length of every entry by accession (primary and secondary accessions, the
+primary one winning when an accession is both). The index is a compact file of
+fixed-size entries sorted by accession (~22 bytes per accession), kept in
+~/.targetdb/cache/swissprot/ and rebuilt when the flat file changes. Both the
+index and the flat file are memory-mapped: a lookup is a binary search in the
+index and a slice of the flat file, so neither is loaded into memory. Records
+are returned as ``uniprot_parse.LazyRecord`` and only the sections used are
+parsed.
+"""
+
+import bisect
+import gzip
+import json
+import mmap
+import os
+import shutil
+import struct
+import threading
+from pathlib import Path
+
+from utils import uniprot_parse
+
+CACHE_DIR = Path("~/.targetdb/cache/swissprot").expanduser()
+INDEX_VERSION = 2
+MAGIC = b"SPIDX\x00\x00\x02"
+# accession (UniProt accessions have at most 10 characters), offset, length
+ENTRY = struct.Struct("<10sQI")
+HEADER = struct.Struct("<8sI")
+
+
+def _source_stamp(path):
+    stat = path.stat()
+    return {
+        "version": str(INDEX_VERSION),
+        "source": str(path),
+        "size": str(stat.st_size),
+        "mtime": str(int(stat.st_mtime)),
+    }
+
+
+def _iter_entries(handle):
+    """Yield (accessions, offset, length) of the entries of a binary flat file."""
+    offset = 0
+    start = None
+    accessions = []
+    for line in handle:
+        if start is None:
+            start = offset
+        if line.startswith(b"AC   "):
+            accessions.extend(
+                acc.strip() for acc in line[5:].split(b";") if acc.strip()
+            )
+        offset += len(line)
+        if line.startswith(b"//"):
+            yield accessions, start, offset - start
+            start = None
+            accessions = []
+
+
+def _key(accession):
+    if isinstance(accession, str):
+        accession = accession.encode()
+    return accession[: ENTRY.size - 12].ljust(ENTRY.size - 12, b"\x00")
+
+
+def build_index(dat_path, index_path):
+    """Scan the flat file and write its sorted accession index to ``index_path``."""
+    dat_path = Path(dat_path)
+    index_path = Path(index_path)
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    locations = {}
+    n_entries = 0
+    with dat_path.open("rb") as handle:
+        for accessions, offset, length in _iter_entries(handle):
+            if not accessions:
+                continue
+            n_entries += 1
+            # A primary accession replaces the same secondary accession of
+            # another entry, never the other way round
+            locations[_key(accessions[0])] = (offset, length)
+            for accession in accessions[1:]:
+                locations.setdefault(_key(accession), (offset, length))
+    meta = _source_stamp(dat_path)
+    meta["entries"] = str(n_entries)
+    meta = json.dumps(meta).encode()
+    tmp_path = index_path.with_name(index_path.name + ".%d.tmp" % os.getpid())
+    with tmp_path.open("wb") as handle:
+        handle.write(HEADER.pack(MAGIC, len(meta)))
+        handle.write(meta)
+        for key in sorted(locations):
+            offset, length = locations[key]
+            handle.write(ENTRY.pack(key, offset, length))
+    os.replace(str(tmp_path), str(index_path))
+    return n_entries
+
+
+def _read_meta(index_path):
+    if not index_path.is_file():
+        return {}
+    with index_path.open("rb") as handle:
+        header = handle.read(HEADER.size)
+        if len(header) < HEADER.size:
+            return {}
+        magic, meta_size = HEADER.unpack(header)
+        if magic != MAGIC:
+            return {}
+        try:
+            return json.loads(handle.read(meta_size))
+        except ValueError:
+            return {}
+
+
+class _Keys:
+    """Sequence view of the accessions of a mapped index (for bisect)."""
+
+    def __init__(self, index_map, start, size):
+        self.index_map = index_map
+        self.start = start
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, i):
+        position = self.start + i * ENTRY.size
+        return self.index_map[position : position + ENTRY.size - 12]
+
+
+class SwissProtIndex:
+    """Accession lookups into a local SwissProt flat file.
+
+    The index is built (or the .gz file decompressed) on first use. Lookups are
+    thread safe: they only read the shared memory maps.
+    """
+
+    def __init__(self, path, cache_dir=CACHE_DIR):
+        self.path = Path(path).expanduser().resolve()
+        if not self.path.is_file():
+            raise FileNotFoundError("SwissProt file not found: %s" % self.path)
+        self.cache_dir = Path(cache_dir)
+        if self.path.suffix == ".gz":
+            self.dat_path = self.cache_dir / self.path.stem
+        else:
+            self.dat_path = self.path
+        self.index_path = self.cache_dir / (self.dat_path.name + ".idx")
+        self._lock = threading.Lock()
+        self._files = []
+        self._map = None
+        self._keys = None
+
+    def _decompress(self):
+        stamp_path = self.dat_path.with_name(self.dat_path.name + ".source")
+        stamp = repr(sorted(_source_stamp(self.path).items()))
+        if (
+            self.dat_path.is_file()
+            and stamp_path.is_file()
+            and stamp_path.read_text() == stamp
+        ):
+            return
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.dat_path.with_name(self.dat_path.name + ".%d.tmp" % os.getpid())
+        with gzip.open(str(self.path), "rb") as source, tmp_path.open("wb") as target:
+            shutil.copyfileobj(source, target, 1024 * 1024)
+        os.replace(str(tmp_path), str(self.dat_path))
+        stamp_path.write_text(stamp)
+
+    def _mmap(self, path):
+        handle = path.open("rb")
+        self._files.append(handle)
+        return mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def open(self):
+        """Build the index if needed and map the index and flat file (done once)."""
+        with self._lock:
+            if self._map is not None:
+                return self
+            if self.path != self.dat_path:
+                self._decompress()
+            stamp = _source_stamp(self.dat_path)
+            meta = _read_meta(self.index_path)
+            if any(meta.get(key) != value for key, value in stamp.items()):
+                print("[SWISSPROT]: Indexing", self.path.name)
+                n_entries = build_index(self.dat_path, self.index_path)
+                print("[SWISSPROT]: %d entries indexed" % n_entries)
+            index_map = self._mmap(self.index_path)
+            _, meta_size = HEADER.unpack(index_map[: HEADER.size])
+            start = HEADER.size + meta_size
+            self._keys = _Keys(index_map, start, (len(index_map) - start) // ENTRY.size)
+            self._map = self._mmap(self.dat_path)
+        return self
+
+    def __len__(self):
+        """Number of accessions indexed."""
+        self.open()
+        return len(self._keys)
+
+    def locate(self, accession):
+        """(offset, length) of the entry of ``accession`` or None."""
+        self.open()
+        key = _key(accession)
+        keys = self._keys
+        i = bisect.bisect_left(keys, key)
+        if i == len(keys) or keys[i] != key:
+            return None
+        _, offset, length = ENTRY.unpack_from(
+            keys.index_map, keys.start + i * ENTRY.size
+        )
+        return offset, length
+
+    def __contains__(self, accession):
+        return self.locate(accession) is not None
+
+    def raw(self, accession):
+        """Text of the flat file entry of ``accession`` or None."""
+        location = self.locate(accession)
+        if location is None:
+            return None
+        offset, length = location
+        return self._map[offset : offset + length].decode()
+
+    def get(self, accession):
+        """Record (``uniprot_parse.LazyRecord``) of ``accession`` or None."""
+        text = self.raw(accession)
+        if text is None:
+            return None
+        return uniprot_parse.LazyRecord(text)
+
+    def close(self):
+        with self._lock:
+            if self._map is not None:
+                self._keys.index_map.close()
+                self._map.close()
+                for handle in self._files:
+                    handle.close()
+                self._files = []
+                self._map = None
+                self._keys = None
@@ -8,6 +8,8 @@ from pathlib import Path
 import pandas as pd
 import pkg_resources
 
+from utils import ligand_selectivity as lsel
+
 creation_sql = """DROP TABLE IF EXISTS BindingDB;
 CREATE TABLE IF NOT EXISTS BindingDB
 (
@@ -789,6 +791,174 @@ CREATE INDEX tcrd_novelty_protein_id_index ON tcrd_novelty (protein_id);
 
 """
 
+# ==============================================================================================#
+# ===================================== SCHEMA MIGRATIONS ======================================#
+# ==============================================================================================#
+
+# Each migration brings the schema from the previous version to its own version number. They
+# are applied in order, so an existing database can be upgraded in place with migrate_db().
+# A migration is either an SQL script or a function taking the connection (for data that
+# has to be computed in python). The current version is stored in the targetDB_metadata
+# table (no table = version 0).
+
+
+def _create_ligand_selectivity(connector):
+    connector.execute(
+        """CREATE TABLE IF NOT EXISTS ligand_selectivity
+(
+lig_id           varchar(50) not null,
+Selectivity      float       default NULL,
+n_targets        integer     default NULL,
+best_target_id   varchar(40) default NULL,
+best_target_name text,
+targets_name     text,
+primary key (lig_id)
+)"""
+    )
+    lsel.build(connector)
+
+
+schema_migrations = [
+    (
+        1,
+        "covering indexes for the per-target descriptor and report queries",
+        """
+create index if not exists idx_bioactivities_Target_id_lig_id_pchembl
+on bioactivities (Target_id, lig_id, pchembl_value);
+
+create index if not exists idx_bioactivities_lig_id_Target_id_binding
+on bioactivities (lig_id, Target_id, standard_type, operator, value_num, assay_id,
+                  data_validity_comment, target_name);
+
+create index if not exists idx_assays_assay_id_confidence_type
+on assays (assay_id, confidence_score, bioactivity_type);
+
+create index if not exists idx_Crossref_target_id_Chembl_id
+on Crossref (target_id, Chembl_id);
+
+create index if not exists idx_fPockets_Target_id_druggable_blast
+on fPockets (Target_id, druggable, blast);
+
+create index if not exists idx_3D_Blast_Query_target_id_Hit_PDB_code
+on "3D_Blast" (Query_target_id, Hit_PDB_code, similarity);
+
+create index if not exists idx_PDB_Chains_Target_id_PDB_code
+on PDB_Chains (Target_id, PDB_code);
+
+create index if not exists idx_protein_expression_levels_Target_id_organ_tissue
+on protein_expression_levels (Target_id, organ, tissue, value);
+
+create index if not exists idx_phenotype_Target_id_Allele_id
+on phenotype (Target_id, Allele_id, zygosity, genotype);
+
+create index if not exists idx_modifications_Target_id_mod_type
+on modifications (Target_id, mod_type);
+
+create index if not exists idx_opentarget_association_target_id_disease_area
+on opentarget_association (target_id, disease_area);
+
+create index if not exists idx_drugEbility_sites_pdb_code_tractable_druggable
+on drugEbility_sites (pdb_code, tractable, druggable);
+""",
+    ),
+    (
+        2,
+        "ligand_selectivity table with the precomputed selectivity of every ligand",
+        _create_ligand_selectivity,
+    ),
+    (
+        3,
+        "covering index for the pocket queries of the descriptors",
+        """
+drop index if exists idx_fPockets_Target_id_druggable_blast;
+
+create index if not exists idx_fPockets_Target_id_druggable_blast_pockets
+on fPockets (Target_id, druggable, blast, PDB_code, Pocket_number, Pocket_id, DrugScore,
+             Score, total_sasa, apolar_sasa, volume);
+""",
+    ),
+]
+
+SCHEMA_VERSION = schema_migrations[-1][0]
+
+metadata_sql = """CREATE TABLE IF NOT EXISTS targetDB_metadata
+(
+key   varchar(50) not null,
+value text,
+primary key (key)
+);"""
+
+
+def get_schema_version(connector):
+    has_metadata = connector.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name='targetDB_metadata'"
+    ).fetchone()
+    if not has_metadata:
+        return 0
+    version = connector.execute(
+        "SELECT value FROM targetDB_metadata WHERE key='schema_version'"
+    ).fetchone()
+    return int(version[0]) if version else 0
+
+
+def apply_migrations(connector, verbose=True):
+    """Upgrade the schema behind ``connector`` to SCHEMA_VERSION.
+
+    Each migration runs in its own transaction together with the version update,
+    so an interrupted upgrade can simply be restarted. Returns the schema version.
+    """
+    connector.execute(metadata_sql)
+    connector.commit()
+    current_version = get_schema_version(connector)
+    applied = False
+    for version, description, migration in schema_migrations:
+        if version <= current_version:
+            continue
+        if verbose:
+            print(
+                "[DATABASE]: Upgrading schema to version %d (%s)"
+                % (version, description)
+            )
+        version_sql = (
+            "INSERT OR REPLACE INTO targetDB_metadata (key, value) "
+            "VALUES ('schema_version', '%d');" % version
+        )
+        if callable(migration):
+            connector.execute("BEGIN")
+            try:
+                migration(connector)
+                connector.execute(version_sql)
+            except Exception:
+                connector.rollback()
+                raise
+            connector.commit()
+        else:
+            connector.executescript(
+                "BEGIN;\n" + migration + "\n" + version_sql + "\nCOMMIT;"
+            )
+        current_version = version
+        applied = True
+    if applied:
+        if verbose:
+            print("[DATABASE]: Updating the query planner statistics (ANALYZE)")
+        connector.execute("ANALYZE")
+        connector.commit()
+    elif verbose:
+        print("[DATABASE]: Schema already at version %d" % current_version)
+    return current_version
+
+
+def migrate_db(db_file_path, verbose=True):
+    """Upgrade an existing targetDB database file in place."""
+    if not Path(db_file_path).is_file():
+        raise FileNotFoundError("targetDB database not found: %s" % db_file_path)
+    connector = sqlite3.connect(str(db_file_path))
+    try:
+        version = apply_migrations(connector, verbose=verbose)
+    finally:
+        connector.close()
+    return version
+
 
 def create_db():
     path_exist = False
@@ -818,6 +988,7 @@ def create_db():
     data_pck_path = pck_path.joinpath("data")
     fill_db(data_pck_path, connector)
     print("[DATABASE]: targetDB table pre-filling completed")
+    apply_migrations(connector)
 
     connector.close()
     return db_file_path
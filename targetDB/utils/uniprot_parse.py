@@ -8,6 +8,7 @@ https://web.expasy.org/docs/userman.html
 
 Classes:
  - Record             Holds SwissProt data.
+ - LazyRecord         SwissProt record parsing its sections on first access.
  - Reference          Holds reference data from a SwissProt record.
 
 Functions:
@@ -131,6 +132,73 @@ class Reference(object):
         self.location = []
 
 
+# Line keys parsed for each attribute of a LazyRecord (the ID line is always read)
+_LAZY_SECTIONS = {
+    "accessions": ("AC",),
+    "description": ("DE",),
+    "gene_name": ("GN",),
+    "organism": ("OS",),
+    "taxonomy_id": ("OX",),
+    "comments": ("CC",),
+    "cross_references": ("DR",),
+    "keywords": ("KW",),
+    "features": ("FT",),
+    "seqinfo": ("SQ", "  "),
+    "sequence": ("SQ", "  "),
+}
+
+
+class LazyRecord(object):
+    """SwissProt record parsed section by section on first access.
+
+    Built from the text of a single entry, it has the attributes of Record.
+    Accessing one of the attributes of ``_LAZY_SECTIONS`` (sequence,
+    features, cross_references, comments, ...) parses only the lines of that
+    section; any other attribute parses the whole entry.
+    """
+
+    def __init__(self, text):
+        self._text = text
+        self._lines = None
+
+    def _section(self, keys):
+        if self._lines is None:
+            self._lines = self._text.splitlines(True)
+            if not self._lines or self._lines[0][:2] != "ID":
+                raise ValueError("No SwissProt record found")
+        lines = [self._lines[0]]
+        lines.extend(line for line in self._lines[1:] if line[:2] in keys)
+        lines.append("//\n")
+        return _read(iter(lines))
+
+    def __getattr__(self, name):
+        if name.startswith("_") or not hasattr(_RECORD_ATTRIBUTES, name):
+            raise AttributeError(name)
+        keys = _LAZY_SECTIONS.get(name)
+        if keys is None:
+            record = _read(iter(self._text.splitlines(True)))
+            attributes = vars(record)
+        else:
+            record = self._section(keys)
+            attributes = {
+                attribute: getattr(record, attribute)
+                for attribute, section in _LAZY_SECTIONS.items()
+                if section == keys
+            }
+            attributes.update(
+                entry_name=record.entry_name,
+                data_class=record.data_class,
+                molecule_type=record.molecule_type,
+                sequence_length=record.sequence_length,
+            )
+        for attribute, value in attributes.items():
+            self.__dict__.setdefault(attribute, value)
+        return self.__dict__[name]
+
+
+_RECORD_ATTRIBUTES = Record()
+
+
 def parse(handle):
     """Read multiple SwissProt records from file handle.
 
@@ -1,9 +1,27 @@
+import sqlite3
 import sys
 import types
 import pathlib
 import pytest
 
 
+@pytest.fixture(scope="session", autouse=True)
+def model_cache_dir(tmp_path_factory):
+    """Keep the models fitted by the tests out of ~/.targetdb/models.
+
+    The test modules import druggability_ml under several names (utils.* and
+    targetDB.utils.*) at collection, before any fixture runs: every loaded
+    copy is redirected.
+    """
+    path = tmp_path_factory.mktemp("models")
+    patch = pytest.MonkeyPatch()
+    for name, module in list(sys.modules.items()):
+        if name.endswith("druggability_ml") and hasattr(module, "MODEL_CACHE_DIR"):
+            patch.setattr(module, "MODEL_CACHE_DIR", path)
+    yield path
+    patch.undo()
+
+
 @pytest.fixture(scope="module")
 def dr_module():
     root = pathlib.Path(__file__).resolve().parents[1]
@@ -19,3 +37,196 @@ def dr_module():
     import targetDB.druggability_report as dr
 
     return dr
+
+
+def _populate_targetdb(conn):
+    cur = conn.cursor()
+    cur.executemany(
+        "INSERT INTO Targets (Target_id, Gene_name, Sequence, Date_modified) "
+        "VALUES (?, ?, ?, '2020-01-01 00:00:00')",
+        [("T1", "GENE1", "M" * 200), ("T2", "GENE2", "M" * 100)],
+    )
+    cur.executemany(
+        "INSERT INTO Crossref (target_id, Chembl_id) VALUES (?, ?)",
+        [("T1", "CHEMBL1"), ("T2", "CHEMBL2")],
+    )
+    cur.executemany(
+        "INSERT INTO ligands (lig_id, mol_name, max_phase, canonical_smiles, "
+        "acd_most_bpka, acd_logp, acd_logd, molecularWeight, HBD, TPSA) "
+        "VALUES (?, ?, ?, 'C', 1, 2, 1, 300, 1, 60)",
+        [("L1", "lig1", 3), ("L2", "lig2", 0), ("L3", "lig3", 0), ("L4", "lig4", 1)],
+    )
+    cur.executemany(
+        "INSERT INTO assays (assay_id, assay_description, species, "
+        "bioactivity_type, confidence_score) VALUES (?, 'desc', 'Human', ?, ?)",
+        [("A1", "Binding", 9), ("A2", "Binding", 8), ("A3", "Functionnal", 9)],
+    )
+    cur.executemany(
+        "INSERT INTO bioactivities (lig_id, Target_id, assay_id, units, operator, "
+        "value_num, standard_type, pchembl_value, target_name) "
+        "VALUES (?, ?, ?, 'nM', '=', ?, ?, ?, ?)",
+        [
+            ("L1", "CHEMBL1", "A1", 3, "Ki", 8.5, "Target one"),
+            ("L1", "CHEMBL1", "A2", 5, "Ki", 8.3, "Target one"),
+            ("L1", "CHEMBL2", "A1", 300, "Ki", 6.5, "Target two"),
+            ("L1", "CHEMBL3", "A1", 900, "Kd", 6.0, "Target three"),
+            ("L2", "CHEMBL1", "A1", 8, "Kd", 8.1, "Target one"),
+            ("L2", "CHEMBL2", "A2", 9, "Ki", 8.05, "Target two"),
+            ("L3", "CHEMBL2", "A1", 2, "Kd", 8.7, "Target two"),
+            ("L3", "CHEMBL2", "A2", 4, "Kd", 8.4, "Target two"),
+            ("L4", "CHEMBL1", "A3", 50, "IC50", 7.3, "Target one"),
+            ("L4", "CHEMBL2", "A1", 20, "Ki", 7.7, "Target two"),
+            ("L4", "CHEMBL1", "A1", 40, "Ki", 7.4, "Target one"),
+        ],
+    )
+    cur.executemany(
+        "INSERT INTO protein_expression_levels (Target_id, organ, tissue, cell, "
+        "value, Entry_id) VALUES (?, ?, ?, 'cells', ?, ?)",
+        [
+            ("T1", "Brain", "cortex", 2, 1),
+            ("T1", "Kidney", "kidney", 3, 2),
+            ("T1", "Liver_gallbladder", "liver", 1, 3),
+            ("T2", "Brain", "cortex", 1, 4),
+            ("T2", "Muscle_tissue", "heart muscle", 3, 5),
+        ],
+    )
+    cur.executemany(
+        "INSERT INTO protein_expression_selectivity (Target_id, Selectivity_entropy) "
+        "VALUES (?, ?)",
+        [("T1", 0.5), ("T2", 0.9)],
+    )
+    cur.executemany(
+        "INSERT INTO PDB_Chains (Chain_id, PDB_code, Chain, Target_id, n_residues, "
+        "start_stop) VALUES (?, ?, 'A', ?, ?, ?)",
+        [
+            ("1ABC_A", "1ABC", "T1", 100, "1-100"),
+            ("2ABC_A", "2ABC", "T1", 50, "90-140"),
+            ("3ABC_A", "3ABC", "T2", 60, "1-60"),
+        ],
+    )
+    cur.executemany(
+        "INSERT INTO PDB (PDB_code, Technique, Resolution) VALUES (?, 'X-ray', 2.0)",
+        [("1ABC",), ("2ABC",), ("3ABC",)],
+    )
+    cur.executemany(
+        "INSERT INTO Domain_targets (Target_id, Domain_start, Domain_stop, "
+        "Domain_name, domain_id, source_name, length) "
+        "VALUES (?, ?, ?, ?, ?, 'Pfam', ?)",
+        [("T1", 10, 80, "Dom1", "D1", 71), ("T2", 5, 50, "Dom2", "D2", 46)],
+    )
+    cur.executemany(
+        "INSERT INTO fPockets (PDB_code, Target_id, Pocket_number, Pocket_id, "
+        "Score, DrugScore, apolar_sasa, total_sasa, volume, blast, druggable) "
+        "VALUES (?, ?, ?, ?, ?, ?, 40, 100, 500, ?, 'TRUE')",
+        [
+            ("1ABC", "T1", 1, "P1", 0.5, 0.8, "FALSE"),
+            ("2ABC", "T1", 1, "P2", 0.4, 0.6, "FALSE"),
+            ("3ABC", "T2", 2, "P3", 0.3, 0.7, "TRUE"),
+        ],
+    )
+    cur.execute(
+        'INSERT INTO "3D_Blast" (Query_target_id, Hit_PDB_code, similarity, '
+        "Hit_gene_name, Hit_gene_species, Chain_Letter, Hit_gene_id, Hit_Chain_id) "
+        "VALUES ('T2', '3ABC', 80, 'GENEX', 'Mouse', 'A', 'X1', '3ABC_A')"
+    )
+    cur.executemany(
+        "INSERT INTO phenotype (Target_id, Allele_id, Phenotype, genotype, "
+        "zygosity, Allele_symbol) VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            ("T1", 1, "embryonic lethality", "g1", "homozygote", "a1"),
+            ("T1", 2, "no abnormal phenotype detected", "g2", "heterozygote", "a2"),
+            ("T2", 3, "abnormal behaviour", "g3", "homozygote", "a3"),
+        ],
+    )
+    cur.executemany(
+        "INSERT INTO modifications (mod_type, Target_id, start, stop, "
+        "Unique_modID, mod_id) VALUES (?, ?, 1, 2, ?, ?)",
+        [
+            ("VAR", "T1", "M1", "VAR_1"),
+            ("MUTAGEN", "T1", "M2", "MUT_1"),
+            ("VAR", "T2", "M3", "VAR_2"),
+        ],
+    )
+    cur.executemany(
+        "INSERT INTO gwas (Target_id, phenotype, organism, p_value, id) "
+        "VALUES (?, ?, 'Human', ?, ?)",
+        [("T1", "Phen1", 1e-9, 1), ("T1", "Phen2", 0.01, 2), ("T2", "Phen3", 0.02, 3)],
+    )
+    cur.executemany(
+        "INSERT INTO disease (Target_id, disease_name, disease_id, Unique_id) "
+        "VALUES (?, ?, ?, ?)",
+        [("T1", "DiseaseX", "D1", "T1_D1"), ("T2", "DiseaseY", "D2", "T2_D2")],
+    )
+    cur.executemany(
+        "INSERT INTO pathways (Target_id, pathway_dataset, pathway_name) "
+        "VALUES (?, ?, ?)",
+        [
+            ("T1", "KEGG pathways data set", "KEGG1"),
+            ("T1", "Reactome pathways data set", "Reac1"),
+            ("T2", "Reactome pathways data set", "Reac2"),
+        ],
+    )
+    cur.executemany(
+        "INSERT INTO opentarget_association VALUES (?, ?, ?, ?, ?, 0, 0.2, 0, 0, 0, 0)",
+        [
+            ("T1", "", "neuro", 0.6, 0.4),
+            ("T1", "neuro", "Alzheimer", 0.6, 0.5),
+            ("T1", "neuro", "Dementia", 0.3, 0.1),
+            ("T2", "", "cancer", 0.2, 0.1),
+            ("T2", "cancer", "Glioma", 0.2, 0.1),
+        ],
+    )
+    cur.executemany(
+        "INSERT INTO BindingDB (target_id, ligand_name, `Ki(nM)`, inchi_key) "
+        "VALUES (?, ?, ?, 'KEY')",
+        [("T1", "bdb1", 10), ("T1", "bdb2", 500), ("T2", "bdb3", 50)],
+    )
+    cur.executemany(
+        "INSERT INTO purchasable_compounds (target_id, smiles, affinity_value) "
+        "VALUES (?, 'C', ?)",
+        [("T1", 50), ("T2", 500)],
+    )
+    cur.executemany(
+        "INSERT INTO tcrd_id (tcrd_id, Target_id) VALUES (?, ?)", [(1, "T1"), (2, "T2")]
+    )
+    cur.executemany(
+        "INSERT INTO tcrd_target VALUES (?, 'Tchem', 'Enzyme', 'detail')",
+        [(1,), (2,)],
+    )
+    cur.executemany(
+        "INSERT INTO tcrd_info VALUES (?, ?, 3, ?, 1, 20, 5)",
+        [(1, 60, 120.5), (2, 10, 3.2)],
+    )
+    cur.executemany(
+        "INSERT INTO tcrd_patent VALUES (?, ?, ?)",
+        [(1, 2010, 4), (1, 2012, 9), (2, 2015, 1)],
+    )
+    cur.executemany(
+        "INSERT INTO tcrd_disease VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            (1, 1, "DOID:1", 2.5, "disease a", None),
+            (2, 2, "DOID:2", 1.5, "disease b", None),
+        ],
+    )
+    cur.executemany("INSERT INTO tcrd_novelty VALUES (?, ?)", [(0.01, 1), (0.2, 2)])
+    conn.commit()
+
+
+@pytest.fixture
+def targetdb_path(tmp_path, monkeypatch):
+    """Small TargetDB database (full schema) holding two targets, T1 and T2."""
+    root = pathlib.Path(__file__).resolve().parents[1]
+    sys.path.extend([str(root), str(root / "targetDB")])
+    from utils import descriptor_cache as dcache
+    from utils import sqlite_pool as sqlp
+    from utils import targetDB_init as tinit
+
+    monkeypatch.setattr(dcache, "CACHE_DIR", tmp_path / "cache")
+
+    db_path = tmp_path / "targetdb.db"
+    conn = sqlite3.connect(db_path)
+    conn.executescript(tinit.creation_sql)
+    _populate_targetdb(conn)
+    conn.close()
+    yield db_path
+    sqlp.close_all()
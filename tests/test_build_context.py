@@ -0,0 +1,117 @@
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "targetDB"))
+from utils import build_context as bctx
+from utils import pocket_finder as pocket
+
+
+def test_core_scheduler_bounds_cores():
+    scheduler = bctx.CoreScheduler(4)
+    lock = threading.Lock()
+    in_use = [0]
+    peak = [0]
+
+    def task(n):
+        with scheduler.cores(n) as held:
+            with lock:
+                in_use[0] += held
+                peak[0] = max(peak[0], in_use[0])
+            time.sleep(0.01)
+            with lock:
+                in_use[0] -= held
+        return held
+
+    with ThreadPoolExecutor(8) as pool:
+        held = list(pool.map(task, [1, 3, 2, 8, 1, 1, 2, 4]))
+    assert held == [1, 3, 2, 4, 1, 1, 2, 4]
+    assert peak[0] <= 4
+    assert scheduler.free == 4
+
+
+def test_blast_threads_share_cores():
+    assert bctx.BuildContext("t.db", "c.db", num_core=8, jobs=3).blast_threads == 2
+    assert bctx.BuildContext("t.db", "c.db", num_core=2, jobs=4).blast_threads == 1
+    assert bctx.BuildContext("t.db", "c.db", num_core=8).blast_threads == 8
+
+
+def test_current_context():
+    with pytest.raises(RuntimeError):
+        bctx.current()
+    context = bctx.BuildContext("t.db", "c.db")
+    with context.activate():
+        assert bctx.current() is context
+    with pytest.raises(RuntimeError):
+        bctx.current()
+
+
+def test_writes_are_serialized_on_one_thread():
+    context = bctx.BuildContext("t.db", "c.db", jobs=4)
+    writers = set()
+    running = [0]
+    overlap = []
+
+    def write(i):
+        running[0] += 1
+        overlap.append(running[0])
+        writers.add(threading.current_thread().name)
+        assert bctx.current() is context
+        time.sleep(0.005)
+        running[0] -= 1
+        return i * 2
+
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(lambda i: context.write(write, i), range(8)))
+    context.close()
+    assert results == [i * 2 for i in range(8)]
+    assert max(overlap) == 1
+    assert len(writers) == 1 and writers.pop().startswith("targetdb-writer")
+
+
+def test_single_job_writes_inline():
+    context = bctx.BuildContext("t.db", "c.db")
+    assert context.write(threading.current_thread) is threading.current_thread()
+
+
+def test_lock_per_key():
+    context = bctx.BuildContext("t.db", "c.db", jobs=4)
+    order = []
+
+    def hold(key, i):
+        with context.lock(key):
+            order.append((key, "in", i))
+            time.sleep(0.01)
+            order.append((key, "out", i))
+
+    with ThreadPoolExecutor(4) as pool:
+        list(pool.map(hold, ["1ABC", "1ABC", "2XYZ", "1ABC"], range(4)))
+    same_key = [event for event in order if event[0] == "1ABC"]
+    assert [event[1] for event in same_key] == ["in", "out"] * 3
+
+
+def test_fpocket_uses_context_cores(monkeypatch, tmp_path):
+    context = bctx.BuildContext("t.db", "c.db", num_core=2)
+    calls = []
+
+    def fake_check_output(cmd, timeout=None):
+        calls.append((cmd, context.scheduler.free))
+        return b""
+
+    monkeypatch.setattr(pocket.subprocess, "check_output", fake_check_output)
+    pocket.fpocket_launcher(
+        tmp_path / "1ABC.pdb", "1ABC.pdb", fpocket_exe="fpocket", context=context
+    )
+    assert calls == [(["fpocket", "-f", str(tmp_path / "1ABC.pdb")], 1)]
+    assert context.scheduler.free == 2
+
+
+def test_humanmine_prefetch_store_is_per_context():
+    first = bctx.BuildContext("t.db", "c.db")
+    second = bctx.BuildContext("t.db", "c.db")
+    first.humanmine["MAPT"] = ("frames",)
+    assert second.humanmine == {}
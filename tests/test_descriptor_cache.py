@@ -0,0 +1,107 @@
+import os
+import sqlite3
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "targetDB"))
+import target_descriptors as td
+from utils import descriptor_cache as dcache
+
+
+def _count_computed(monkeypatch):
+    computed = []
+    compute = td.compute_descriptors_list
+
+    def counting(target_id, targetdb=None):
+        computed.append(sorted(target_id))
+        return compute(target_id, targetdb=targetdb)
+
+    monkeypatch.setattr(td, "compute_descriptors_list", counting)
+    return computed
+
+
+def test_cached_descriptors_match_computed(targetdb_path, monkeypatch):
+    expected = td.get_descriptors_list(
+        ["T1", "T2"], targetdb=targetdb_path, use_cache=False
+    )
+    computed = _count_computed(monkeypatch)
+
+    first = td.get_descriptors_list(["T1", "T2"], targetdb=targetdb_path)
+    second = td.get_descriptors_list(["T2", "T1"], targetdb=targetdb_path)
+    assert computed == [["T1", "T2"]]
+    assert dcache.cache_path(targetdb_path).is_file()
+    pd.testing.assert_frame_equal(first, expected)
+    pd.testing.assert_frame_equal(second, expected)
+
+    single = td.get_descriptors_list("T2", targetdb=targetdb_path)
+    assert list(single.Target_id) == ["T2"]
+    assert len(computed) == 1
+
+
+def test_stale_targets_are_recomputed(targetdb_path, monkeypatch):
+    td.get_descriptors_list(["T1", "T2"], targetdb=targetdb_path)
+    computed = _count_computed(monkeypatch)
+
+    stat = targetdb_path.stat()
+    conn = sqlite3.connect(targetdb_path)
+    conn.execute(
+        "UPDATE Targets SET Date_modified='2021-01-01 00:00:00' WHERE Target_id='T1'"
+    )
+    conn.commit()
+    conn.close()
+    # Same file stamp: only the Date_modified check tells T1 apart
+    os.utime(targetdb_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert dcache.db_stamp(targetdb_path) == "%d:%d" % (
+        stat.st_size,
+        stat.st_mtime_ns,
+    )
+    td.get_descriptors_list(["T1", "T2"], targetdb=targetdb_path)
+    assert computed == [["T1"]]
+
+    dcache.invalidate(targetdb_path, ["T2"])
+    data = td.get_descriptors_list(["T1", "T2"], targetdb=targetdb_path)
+    assert computed == [["T1"], ["T2"]]
+    assert list(data.Target_id) == ["T1", "T2"]
+
+
+def test_cached_rows_round_trip_exactly(targetdb_path):
+    modified = pd.DataFrame(
+        {"Target_id": ["T1", "T2"], "Date_modified": ["2020-01-01", "2020-01-01"]}
+    )
+    descriptors = pd.DataFrame(
+        {
+            "Target_id": ["T1", "T2"],
+            # not written back exactly with 15 significant digits
+            "score": [0.44999999999999996, 2**0.5],
+            "missing": [np.nan, np.nan],
+            "count": np.array([3, 4], dtype="int64"),
+            "flag": [True, False],
+            "name": ["GENE1", None],
+            "mixed": [1.5, None],
+        }
+    )
+    descriptors["mixed"] = descriptors["mixed"].astype(object)
+    descriptors.loc[1, "mixed"] = None
+    dcache.put(targetdb_path, descriptors, modified)
+    cached, stale = dcache.get(targetdb_path, modified)
+    assert stale == []
+    assert cached.score.tolist() == [0.44999999999999996, 1.4142135623730951]
+    pd.testing.assert_frame_equal(cached, descriptors)
+
+
+def test_changed_database_file_drops_cache(targetdb_path, monkeypatch):
+    td.get_descriptors_list(["T1", "T2"], targetdb=targetdb_path)
+    computed = _count_computed(monkeypatch)
+
+    # New data without any change of the Targets rows (e.g. another release)
+    conn = sqlite3.connect(targetdb_path)
+    conn.execute("UPDATE bioactivities SET pchembl_value=9.9 WHERE lig_id='L1'")
+    conn.commit()
+    conn.close()
+    td.get_descriptors_list(["T1", "T2"], targetdb=targetdb_path)
+    assert computed == [["T1", "T2"]]
+    td.get_descriptors_list(["T1", "T2"], targetdb=targetdb_path)
+    assert len(computed) == 1
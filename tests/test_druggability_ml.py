@@ -2,12 +2,20 @@ from pathlib import Path
 import sys
 
 import pandas as pd
+import pytest
 
 # Ensure the package is importable when tests are executed from different CWDs
 sys.path.append(str(Path(__file__).resolve().parents[1]))
 from targetDB.utils import druggability_ml
 
 
+@pytest.fixture(autouse=True)
+def reset_training_cache(monkeypatch):
+    """Make sure each test reads its own (mocked) training data."""
+    monkeypatch.setattr(druggability_ml, "_TRAINING_DATA", None)
+    monkeypatch.setattr(druggability_ml, "_TRAINING_IDS", None)
+
+
 def _mock_training_df():
     """Small training set for tests."""
     return pd.DataFrame(
@@ -46,12 +54,13 @@ def _mock_score_df():
     )
 
 
-def test_predict_and_prob_prune_features(monkeypatch):
+def test_predict_and_prob_prune_features(monkeypatch, tmp_path):
     training_df = _mock_training_df()
     score_df = _mock_score_df()
 
     # Mock reading of the training dataset
     monkeypatch.setattr(druggability_ml.pd, "read_json", lambda *a, **k: training_df)
+    monkeypatch.setattr(druggability_ml, "MODEL_CACHE_DIR", tmp_path)
 
     model = druggability_ml.generate_model()
 
@@ -80,9 +89,65 @@ def test_predict_and_prob_prune_features(monkeypatch):
     assert captured["proba_cols"] == ["feature1", "feature2"]
 
 
+def test_generate_model_is_cached(monkeypatch, tmp_path):
+    training_df = _mock_training_df()
+    monkeypatch.setattr(druggability_ml.pd, "read_json", lambda *a, **k: training_df)
+    monkeypatch.setattr(druggability_ml, "MODEL_CACHE_DIR", tmp_path)
+    monkeypatch.setitem(druggability_ml.MODEL_PARAMS, "n_estimators", 5)
+
+    model = druggability_ml.generate_model()
+    assert druggability_ml.model_path().is_file()
+
+    def fail_fit():
+        raise AssertionError("model should be loaded from the cache")
+
+    monkeypatch.setattr(druggability_ml, "fit_model", fail_fit)
+    cached = druggability_ml.generate_model()
+
+    x = training_df.drop("DRUGGABLE", axis=1)
+    assert (cached.predict_proba(x) == model.predict_proba(x)).all()
+
+    # A change of hyperparameters must not reuse the stored model
+    monkeypatch.setitem(druggability_ml.MODEL_PARAMS, "n_estimators", 6)
+    assert not druggability_ml.model_path().is_file()
+
+
+def test_unreadable_model_is_refitted(monkeypatch, tmp_path, capsys):
+    training_df = _mock_training_df()
+    monkeypatch.setattr(druggability_ml.pd, "read_json", lambda *a, **k: training_df)
+    monkeypatch.setattr(druggability_ml, "MODEL_CACHE_DIR", tmp_path)
+    monkeypatch.setitem(druggability_ml.MODEL_PARAMS, "n_estimators", 5)
+    druggability_ml.model_path().write_bytes(b"truncated")
+
+    model = druggability_ml.generate_model()
+    assert "Cannot load" in capsys.readouterr().out
+    x = training_df.drop("DRUGGABLE", axis=1)
+    assert (
+        druggability_ml.generate_model().predict(x).tolist()
+        == model.predict(x).tolist()
+    )
+
+
 def test_in_training_set(monkeypatch):
     training_df = _mock_training_df()
     monkeypatch.setattr(druggability_ml.pd, "read_json", lambda *a, **k: training_df)
     df = pd.DataFrame({"Target_id": ["t1", "t3"]})
     result = druggability_ml.in_training_set(df)
     assert list(result) == ["Yes", "No"]
+
+
+def test_training_data_read_once(monkeypatch):
+    training_df = _mock_training_df()
+    calls = []
+
+    def fake_read_json(*a, **k):
+        calls.append(a)
+        return training_df
+
+    monkeypatch.setattr(druggability_ml.pd, "read_json", fake_read_json)
+    monkeypatch.setitem(druggability_ml.MODEL_PARAMS, "n_estimators", 5)
+    df = pd.DataFrame({"Target_id": ["t2", "t3", "t1"]})
+    assert list(druggability_ml.in_training_set(df)) == ["Yes", "No", "Yes"]
+    assert list(druggability_ml.in_training_set(df)) == ["Yes", "No", "Yes"]
+    druggability_ml.fit_model()
+    assert len(calls) == 1
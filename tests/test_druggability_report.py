@@ -149,3 +149,50 @@ def test_get_single_excel(tmp_path, monkeypatch, dr_module):
     ]
     for sheet in expected:
         assert sheet in wb.sheetnames
+
+
+def test_list_report_pubmed_counts(monkeypatch, dr_module):
+    dr = dr_module
+    monkeypatch.setattr(dr, "pubmed_email", "email@example.com", raising=False)
+    monkeypatch.setattr(dr, "pubmed_mesh_term", "Alzheimer Disease")
+    monkeypatch.setattr(dr, "pubmed_api_key", "KEY")
+    calls = []
+
+    def fake_get_counts(gene_names, email, mesh_terms=(None,), api_key=None):
+        calls.append((list(gene_names), email, mesh_terms, api_key))
+        return {
+            (gene, mesh): "%s-%s" % (gene, mesh or "all")
+            for gene in gene_names
+            for mesh in mesh_terms
+        }
+
+    monkeypatch.setattr(dr.pmc, "get_counts", fake_get_counts)
+    list_targets = pd.DataFrame(
+        {"symbol": ["GENE1", "GENE2"], "uniprot_ids": [["P1", "P2"], ["P3"]]},
+        index=["GENE1", "GENE2"],
+    )
+    pubmed = dr._pubmed_counts(list_targets)
+
+    assert calls == [
+        (["GENE1", "GENE2"], "email@example.com", (None, "Alzheimer Disease"), "KEY")
+    ]
+    assert list(pubmed["Target_id"]) == ["P1", "P2", "P3"]
+    assert list(pubmed["number of Alzheimer Disease publications"]) == [
+        "GENE1-Alzheimer Disease",
+        "GENE1-Alzheimer Disease",
+        "GENE2-Alzheimer Disease",
+    ]
+    assert list(pubmed["total # publications"]) == ["GENE1-all"] * 2 + ["GENE2-all"]
+
+
+def test_list_report_descriptors_in_chunks(monkeypatch, dr_module, targetdb_path):
+    dr = dr_module
+    dr.targetDB = str(targetdb_path)
+    monkeypatch.setattr(dr, "LIST_CHUNK_SIZE", 1)
+    data = dr._list_descriptors(["T1", "T2"])
+    expected = dr.td.get_descriptors_list(
+        ["T1", "T2"], targetdb=targetdb_path, use_cache=False
+    )
+    pd.testing.assert_frame_equal(
+        data.sort_index(axis=1), expected.sort_index(axis=1), check_dtype=False
+    )
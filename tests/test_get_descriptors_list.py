@@ -0,0 +1,38 @@
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "targetDB"))
+import target_descriptors as td
+
+
+def test_descriptors_list_matches_single_targets(targetdb_path):
+    both = td.get_descriptors_list(["T1", "T2"], targetdb=targetdb_path)
+    assert list(both.Target_id) == ["T1", "T2"]
+
+    single = pd.concat(
+        [td.get_descriptors_list(t, targetdb=targetdb_path) for t in ["T1", "T2"]],
+        ignore_index=True,
+    )
+    pd.testing.assert_frame_equal(
+        both.sort_index(axis=1), single.sort_index(axis=1), check_dtype=False
+    )
+
+
+def test_descriptors_legacy_joined_ids(targetdb_path):
+    joined = td.get_descriptors_list("T1','T2", targetdb=targetdb_path)
+    listed = td.get_descriptors_list(["T1", "T2"], targetdb=targetdb_path)
+    pd.testing.assert_frame_equal(joined, listed)
+
+
+def test_descriptors_selectivity_counts(targetdb_path):
+    data = td.get_descriptors_list(["T1", "T2"], targetdb=targetdb_path)
+    data = data.set_index("Target_id")
+    assert data.loc["T1", "ChEMBL_bioactives_potent_count"] == 2
+    assert data.loc["T2", "ChEMBL_bioactives_potent_count"] == 2
+    assert data.loc["T1", "ChEMBL_bioactives_great_selectivity_count"] == 2
+    assert pd.isna(data.loc["T2", "ChEMBL_bioactives_great_selectivity_count"])
+    assert data.loc["T2", "Pharos_class"] == "Tchem"
+    assert data.loc["T1", "PDB_total_count"] == 2
+    assert data.loc["T1", "Ab Count"] == 60
@@ -142,7 +142,8 @@ def build_test_db():
 
 def test_get_single_features(monkeypatch):
     conn = build_test_db()
-    monkeypatch.setattr(target_features.sqlite3, "connect", lambda _: conn)
+    conn.create_aggregate("stddev", 1, target_features.sqlp.StdevFunc)
+    monkeypatch.setattr(target_features.sqlp, "connect", lambda _: conn)
 
     results = target_features.get_single_features("T1", dbase=":memory:")
 
@@ -0,0 +1,156 @@
+import sys
+from pathlib import Path
+
+import pytest
+import requests
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "targetDB"))
+from utils import http_cache as hcache
+
+
+class FakeResponse:
+    def __init__(self, url, status_code=200, content=b"", headers=None):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = requests.structures.CaseInsensitiveDict(headers or {})
+
+
+class FakeServer:
+    """Stands in for requests.request, answering from a dict url -> response."""
+
+    def __init__(self):
+        self.pages = {}
+        self.calls = []
+        self.down = False
+
+    def request(self, method, url, params=None, data=None, json=None, **kwargs):
+        self.calls.append((method, url, kwargs.get("headers", {})))
+        if self.down:
+            raise requests.exceptions.ConnectionError(url)
+        status, content, headers = self.pages.get(url, (404, b"not found", {}))
+        etag = headers.get("ETag")
+        if etag and kwargs.get("headers", {}).get("If-None-Match") == etag:
+            return FakeResponse(url, 304, b"", headers)
+        return FakeResponse(url, status, content, headers)
+
+
+@pytest.fixture(params=["sqlite", "directory"])
+def server(request, tmp_path, monkeypatch):
+    if request.param == "sqlite":
+        store = hcache.SQLiteStore(tmp_path / "http_cache.sqlite")
+    else:
+        store = hcache.DirectoryStore(tmp_path / "http_cache")
+    monkeypatch.setattr(hcache, "_store", store)
+    monkeypatch.setattr(hcache, "_offline", False)
+    monkeypatch.setattr(hcache, "SOURCE_TTL", dict(hcache.SOURCE_TTL))
+    fake = FakeServer()
+    monkeypatch.setattr(hcache.requests, "request", fake.request)
+    return fake
+
+
+def test_fresh_response_served_from_cache(server):
+    server.pages["http://a/P1.txt"] = (200, b"ID P1", {})
+    first = hcache.get("http://a/P1.txt", "uniprot")
+    second = hcache.get("http://a/P1.txt", "uniprot")
+    assert (first.text, second.text) == ("ID P1", "ID P1")
+    assert not first.from_cache and second.from_cache
+    assert len(server.calls) == 1
+
+
+def test_not_found_is_cached_but_server_errors_are_not(server):
+    assert hcache.get("http://a/missing", "uniprot").status_code == 404
+    assert hcache.get("http://a/missing", "uniprot").from_cache
+    server.pages["http://a/error"] = (500, b"oops", {})
+    hcache.get("http://a/error", "uniprot")
+    hcache.get("http://a/error", "uniprot")
+    assert len(server.calls) == 3
+
+
+def test_stale_response_is_revalidated(server):
+    server.pages["http://a/P1.txt"] = (200, b"ID P1", {"ETag": '"v1"'})
+    hcache.get("http://a/P1.txt", "uniprot")
+    hcache.configure(ttl={"uniprot": 0})
+
+    response = hcache.get("http://a/P1.txt", "uniprot")
+    assert response.text == "ID P1" and response.from_cache
+    assert server.calls[-1][2]["If-None-Match"] == '"v1"'
+
+    server.pages["http://a/P1.txt"] = (200, b"ID P1 v2", {"ETag": '"v2"'})
+    assert hcache.get("http://a/P1.txt", "uniprot").text == "ID P1 v2"
+    assert hcache.get("http://a/P1.txt", "uniprot", ttl=3600).text == "ID P1 v2"
+
+
+def test_stale_response_served_when_unreachable(server):
+    server.pages["http://a/P1.txt"] = (200, b"ID P1", {})
+    hcache.get("http://a/P1.txt", "uniprot")
+    server.down = True
+    assert hcache.get("http://a/P1.txt", "uniprot", ttl=0).text == "ID P1"
+    with pytest.raises(requests.exceptions.ConnectionError):
+        hcache.get("http://a/P2.txt", "uniprot")
+
+
+def test_offline_mode(server):
+    server.pages["http://a/P1.txt"] = (200, b"ID P1", {})
+    hcache.get("http://a/P1.txt", "uniprot")
+    hcache.configure(offline=True)
+    assert hcache.get("http://a/P1.txt", "uniprot", ttl=0).text == "ID P1"
+    with pytest.raises(hcache.OfflineError):
+        hcache.get("http://a/P2.txt", "uniprot")
+    assert len(server.calls) == 1
+
+
+def test_post_requests_keyed_on_body(server):
+    server.pages["http://graphql"] = (200, b'{"data": 1}', {})
+    hcache.post("http://graphql", "opentargets", json={"query": "A"})
+    hcache.post("http://graphql", "opentargets", json={"query": "A"})
+    hcache.post("http://graphql", "opentargets", json={"query": "B"})
+    assert len(server.calls) == 2
+    assert hcache.post("http://graphql", "opentargets", json={"query": "B"}).json() == {
+        "data": 1
+    }
+
+
+def test_bodies_stored_once(tmp_path, monkeypatch):
+    store = hcache.SQLiteStore(tmp_path / "http_cache.sqlite")
+    monkeypatch.setattr(hcache, "_store", store)
+    server = FakeServer()
+    monkeypatch.setattr(hcache.requests, "request", server.request)
+    server.pages["http://a/1"] = (200, b"same", {})
+    server.pages["http://a/2"] = (200, b"same", {})
+    hcache.get("http://a/1", "uniprot")
+    hcache.get("http://a/2", "uniprot")
+    conn = store._connect()
+    assert conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] == 2
+    assert conn.execute("SELECT COUNT(*) FROM bodies").fetchone()[0] == 1
+    conn.close()
+
+    store.clear("uniprot")
+    conn = store._connect()
+    assert conn.execute("SELECT COUNT(*) FROM bodies").fetchone()[0] == 0
+    conn.close()
+
+
+class FakeInterMineOpener:
+    def headers(self):
+        return {"UserAgent": "test"}
+
+    def prepare_url(self, url):
+        return url
+
+    def http_error_default(self, url, fp, errcode, errmsg, headers):
+        raise RuntimeError("webservice error %d" % errcode)
+
+
+def test_cached_opener(server):
+    server.pages["http://mine/service/version"] = (200, b"32", {})
+    server.pages["http://mine/service/query/results"] = (200, b"row1\nrow2\n", {})
+    opener = hcache.CachedOpener(FakeInterMineOpener(), "humanmine")
+    assert int(opener.open("http://mine/service/version").read()) == 32
+    rows = list(opener.open("http://mine/service/query/results", "query=<q/>"))
+    assert rows == [b"row1\n", b"row2\n"]
+    assert server.calls[-1][0] == "POST"
+    opener.open("http://mine/service/query/results", "query=<q/>")
+    assert len(server.calls) == 2
+    with pytest.raises(RuntimeError, match="404"):
+        opener.open("http://mine/service/missing")
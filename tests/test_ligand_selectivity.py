@@ -0,0 +1,156 @@
+import sqlite3
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+import scipy.stats as sc
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "targetDB"))
+import target_descriptors as td
+import target_features as tf
+from utils import ligand_selectivity as lsel
+from utils import sqlite_pool as sqlp
+from utils import targetDB_init as tinit
+
+
+def _loop_selectivity(binding_data):
+    # Per-ligand loop formerly used by the descriptors/features
+    entropies = []
+    for name, group in binding_data.groupby("lig_id"):
+        group = group[(group["sttdev"] < group["avg_value"])].copy()
+        if group.empty:
+            continue
+        group["association"] = 1 / group.avg_value
+        group["association_prob"] = group.association / group.association.sum()
+        best = group.loc[group["association_prob"].idxmax()]
+        entropies.append(
+            {
+                "lig_id": name,
+                "Selectivity": round(sc.entropy(group.association_prob), 2),
+                "n_targets": len(group),
+                "best_target_id": best["Target_id"],
+                "best_target_name": best["target_name"],
+                "targets_name": " / ".join(np.unique(group["target_name"].values)),
+            }
+        )
+    return pd.DataFrame(entropies, columns=lsel.COLUMNS)
+
+
+def test_compute_matches_loop():
+    rng = np.random.default_rng(0)
+    n = 500
+    binding_data = pd.DataFrame(
+        {
+            "lig_id": rng.choice(["L%d" % i for i in range(60)], n),
+            "Target_id": rng.choice(["CHEMBL%d" % i for i in range(15)], n),
+            "avg_value": rng.uniform(0.5, 1000, n).round(2),
+            "sttdev": rng.uniform(0, 600, n).round(2),
+        }
+    )
+    binding_data = binding_data.drop_duplicates(["lig_id", "Target_id"])
+    binding_data["target_name"] = "name " + binding_data.Target_id
+    binding_data = binding_data.sort_values(["lig_id", "Target_id"])
+
+    expected = _loop_selectivity(binding_data)
+    result = lsel.compute(binding_data)
+    pd.testing.assert_frame_equal(
+        result.reset_index(drop=True), expected, check_dtype=False
+    )
+
+
+def test_migration_builds_table(targetdb_path):
+    before = td.get_descriptors_list(
+        ["T1", "T2"], targetdb=targetdb_path, use_cache=False
+    )
+    tinit.migrate_db(targetdb_path, verbose=False)
+
+    conn = sqlite3.connect(targetdb_path)
+    table = pd.read_sql(
+        "SELECT * FROM ligand_selectivity ORDER BY lig_id", con=conn
+    ).set_index("lig_id")
+    conn.close()
+    assert list(table.index) == ["L1", "L2", "L3", "L4"]
+    assert table.loc["L1", "n_targets"] == 3
+    assert table.loc["L1", "best_target_id"] == "CHEMBL1"
+    assert table.loc["L3", "Selectivity"] == 0
+
+    td.sqlp.close_all()
+    after = td.get_descriptors_list(
+        ["T1", "T2"], targetdb=targetdb_path, use_cache=False
+    )
+    pd.testing.assert_frame_equal(before, after, check_dtype=False)
+
+
+def test_refresh_updates_new_bioactivities(targetdb_path):
+    tinit.migrate_db(targetdb_path, verbose=False)
+    conn = sqlite3.connect(targetdb_path)
+    conn.execute(
+        "INSERT INTO bioactivities (lig_id, Target_id, assay_id, units, operator, "
+        "value_num, standard_type, target_name) "
+        "VALUES ('L3', 'CHEMBL1', 'A1', 'nM', '=', 1, 'Ki', 'Target one')"
+    )
+    conn.commit()
+    assert lsel.refresh(conn, ["L3"]) == 1
+
+    row = conn.execute(
+        "SELECT n_targets, best_target_id, targets_name FROM ligand_selectivity "
+        "WHERE lig_id='L3'"
+    ).fetchone()
+    conn.close()
+    assert row == (2, "CHEMBL1", "Target one / Target two")
+
+
+def _loop_binding_columns(conn, binding, best_target_id):
+    # Selectivity columns as computed by the former transform_bioactivities loop
+    binding_data = pd.read_sql(
+        lsel.binding_query.format(
+            stddev="STDDEV(B.value_num)",
+            where="AND B.lig_id IN (SELECT value FROM json_each(:ids))",
+        ),
+        con=conn,
+        params={"ids": sqlp.ids_param(binding.lig_id.unique())},
+    )
+    rows = []
+    for name, group in binding_data.groupby("lig_id"):
+        group = group[(group["sttdev"] < group["avg_value"])].copy()
+        if group.empty:
+            continue
+        group["association"] = 1 / group.avg_value
+        group["association_prob"] = group.association / group.association.sum()
+        best = group.loc[group["association_prob"].idxmax()]
+        rows.append(
+            {
+                "lig_id": name,
+                "Selectivity": round(sc.entropy(group.association_prob), 2),
+                "best_target": len(group) == 1 or best["Target_id"] == best_target_id,
+                "best_target_name": best["target_name"],
+            }
+        )
+    return pd.DataFrame(rows)
+
+
+@pytest.mark.parametrize("migrated", [False, True])
+def test_binding_selectivity_matches_loop(targetdb_path, migrated):
+    if migrated:
+        tinit.migrate_db(targetdb_path, verbose=False)
+    conn = sqlp.connect(targetdb_path)
+    for chembl_id in ["CHEMBL1", "CHEMBL2"]:
+        binding = pd.read_sql(
+            "SELECT lig_id, Target_id AS target_id FROM bioactivities "
+            "WHERE Target_id=? AND standard_type IN ('Ki','Kd') ORDER BY value_num",
+            con=conn,
+            params=(chembl_id,),
+        )
+        expected = _loop_binding_columns(conn, binding, chembl_id)
+        result = (
+            tf.binding_selectivity(binding, conn)[expected.columns]
+            .sort_values("lig_id")
+            .reset_index(drop=True)
+        )
+        pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+    features = tf.get_single_features("T1", dbase=targetdb_path)["binding"]
+    assert set(features.lig_id) == {"L1", "L2", "L4"}
+    assert features.best_target_name.notnull().all()
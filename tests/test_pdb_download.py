@@ -0,0 +1,90 @@
+import gzip
+import sys
+from pathlib import Path
+
+import requests
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "targetDB"))
+from utils import build_context as bctx
+from utils import pdb_download as pdl
+from utils import pdb_store as pstore
+
+PDB_TEXT = b"HEADER    TEST\nATOM      1  N   MET A   1\nEND\n"
+
+
+def mirror(tmp_path, codes):
+    """Local snapshot laid out like the wwPDB divided archive."""
+    for code in codes:
+        lcode = code.lower()
+        path = tmp_path / "mirror" / lcode[1:3] / ("pdb%s.ent.gz" % lcode)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(gzip.compress(PDB_TEXT + code.encode()))
+    return str(tmp_path / "mirror" / "{mid}" / "pdb{lcode}.ent.gz")
+
+
+def test_download_from_local_mirror(tmp_path):
+    downloader = pdl.PDBDownloader(source=mirror(tmp_path, ["1ABC", "2XYZ"]))
+    assert downloader.is_local
+    store = pstore.PDBStore(tmp_path / "PDB")
+    saved, failed = downloader.download(["1ABC", "2XYZ", "3BAD", "1ABC"], store)
+    assert sorted(saved) == ["1ABC", "2XYZ"]
+    assert gzip.decompress(saved["1ABC"].read_bytes()) == PDB_TEXT + b"1ABC"
+    assert failed == {"3BAD": "not found"}
+    assert sorted(p.name for p in (tmp_path / "PDB").iterdir()) == [
+        "1ABC.json",
+        "1ABC.pdb.gz",
+        "2XYZ.json",
+        "2XYZ.pdb.gz",
+    ]
+
+
+def test_failures_retried_per_file(tmp_path, monkeypatch):
+    downloader = pdl.PDBDownloader(
+        source=mirror(tmp_path, ["1ABC", "2XYZ"]), max_retries=3, backoff=0
+    )
+    fetch = downloader.fetch
+    attempts = {}
+
+    def flaky_fetch(code, target):
+        attempts[code] = attempts.get(code, 0) + 1
+        if code == "2XYZ":
+            raise requests.exceptions.ConnectionError("down")
+        if attempts[code] == 1:
+            raise requests.exceptions.Timeout("slow")
+        return fetch(code, target)
+
+    monkeypatch.setattr(downloader, "fetch", flaky_fetch)
+    store = pstore.PDBStore(tmp_path / "PDB")
+    saved, failed = downloader.download(["1ABC", "2XYZ"], store)
+    assert list(saved) == ["1ABC"] and attempts == {"1ABC": 2, "2XYZ": 3}
+    assert failed["2XYZ"].startswith("ConnectionError")
+    assert "2XYZ" not in store
+
+
+def test_truncated_file_leaves_nothing(tmp_path):
+    source = tmp_path / "{code}.pdb.gz"
+    (tmp_path / "1ABC.pdb.gz").write_bytes(gzip.compress(PDB_TEXT)[:-10])
+    downloader = pdl.PDBDownloader(source=str(source), max_retries=1)
+    saved, failed = downloader.download(["1ABC"], pstore.PDBStore(tmp_path / "PDB"))
+    assert saved == {} and "1ABC" in failed
+    assert list((tmp_path / "PDB").iterdir()) == []
+
+
+def test_context_downloader_uses_shared_locks(tmp_path):
+    context = bctx.BuildContext(
+        "t.db",
+        "c.db",
+        jobs=2,
+        pdb_downloader=pdl.PDBDownloader(source=mirror(tmp_path, ["1ABC"])),
+    )
+    locked = []
+
+    def lock(key):
+        locked.append(key)
+        return context.lock(key)
+
+    saved, _ = context.pdb_downloader.download(
+        ["1ABC"], pstore.PDBStore(tmp_path / "PDB"), lock=lock
+    )
+    assert locked == ["1ABC.pdb"] and saved["1ABC"].is_file()
+    context.close()
@@ -0,0 +1,115 @@
+import gzip
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "targetDB"))
+from utils import pdb_parser
+from utils import pdb_store as pstore
+
+PDB_TEXT = """HEADER    TRANSFERASE                             01-JAN-00   1ABC
+DBREF  1ABC A    1    10  UNP    P10636   TAU_HUMAN      101    110
+DBREF1 1ABC B    1    10  UNP                  A0A024R0Y4_HUMAN
+DBREF2 1ABC B     A0A024R0Y4                        201         210
+SEQRES   1 A   10  MET ALA GLU PRO ARG GLN GLU PHE GLU VAL
+SEQRES   1 B   10  MET ALA GLU PRO ARG GLN GLU PHE GLU MSE
+MODRES 1ABC MSE B   10  MET  SELENOMETHIONINE
+REMARK 350 BIOMOLECULE: 1
+REMARK 350 APPLY THE FOLLOWING TO CHAINS: A
+REMARK 350 BIOMOLECULE: 2
+REMARK 350 APPLY THE FOLLOWING TO CHAINS: B,
+REMARK 350                    AND CHAINS: C
+ATOM      1  N   MET A   1      11.104   6.134  -6.504  1.00  0.00           N
+REMARK 350 BIOMOLECULE: 3
+END
+"""
+
+
+def test_scan_header_single_pass():
+    lines = iter(PDB_TEXT.splitlines(True))
+    header = pdb_parser.scan_header(lines)
+    # Reading stopped at the first ATOM record
+    assert next(lines).startswith("REMARK 350 BIOMOLECULE: 3")
+    assert header.biomolecules == {"1": ["A"], "2": ["B", "C"]}
+    assert header.chains == ["A", "B"]
+    assert header.seqres["B"][-1] == "MSE"
+    assert header.modres == {"MSE": "MET"}
+    assert [fields[:3] for fields in header.dbref] == [
+        ["DBREF", "1ABC", "A"],
+        ["DBREF1", "1ABC", "B"],
+        ["DBREF2", "1ABC", "B"],
+    ]
+    assert header.sequence("A") == "MAEPRQEFEV" and header.sequence("B")[-1] == "M"
+    assert [fields[0] for fields in header.dbref_of("B")] == ["DBREF1", "DBREF2"]
+    assert header.chain_ranges() == {
+        "A": {"start": 101, "stop": 110, "start_stop": [(101, 110)]},
+        "B": {"start": 201, "stop": 210, "start_stop": [(201, 210)]},
+    }
+
+
+def test_plain_file_moved_into_store(tmp_path):
+    plain = tmp_path / "1ABC.pdb"
+    plain.write_text(PDB_TEXT)
+    store = pstore.PDBStore(tmp_path)
+    path = store.find("1ABC")
+    assert path == tmp_path / "1ABC.pdb.gz" and not plain.exists()
+    assert gzip.decompress(path.read_bytes()).decode() == PDB_TEXT
+    assert "1ABC" in store and store.find("2XYZ") is None
+
+    sidecar = store.sidecar("1ABC")
+    assert sidecar["code"] == "1ABC" and sidecar["size"] == len(PDB_TEXT)
+    header = store.header("1ABC")
+    assert header.biomolecules == {"1": ["A"], "2": ["B", "C"]}
+    assert pstore.header(path).to_dict() == header.to_dict()
+    assert pstore.code_of(path) == "1ABC"
+    assert pdb_parser.parse_header("1ABC", path).biomolecules == {
+        "1": ["A"],
+        "2": ["B", "C"],
+    }
+
+
+def test_header_read_from_sidecar(tmp_path, monkeypatch):
+    source = tmp_path / "download.part"
+    source.write_bytes(gzip.compress(PDB_TEXT.encode()))
+    store = pstore.PDBStore(tmp_path / "PDB")
+    path = store.add("1ABC", source)
+    assert not source.exists()
+
+    def no_scan(pdb):
+        raise AssertionError("the structure should not be scanned again")
+
+    monkeypatch.setattr(pdb_parser, "scan_header", no_scan)
+    monkeypatch.setattr(pdb_parser, "open_pdb", no_scan)
+    assert pstore.header(path).chains == ["A", "B"]
+
+
+def test_get_sequence_reads_compressed_files(tmp_path):
+    import pandas as pd
+
+    (tmp_path / "1ABC.pdb").write_text(PDB_TEXT)
+    path = pstore.PDBStore(tmp_path).find("1ABC")
+    seq = pdb_parser.get_sequence(
+        "1ABC", path, ["A", "B"], pd.DataFrame(columns=["Start", "Stop", "name"])
+    )
+    assert list(seq.sequence) == ["MAEPRQEFEV", "MAEPRQEFEM"]
+    assert seq.loc["1ABC_A"].start == 101 and seq.loc["1ABC_B"].stop == 210
+
+
+def test_unknown_residue_without_second_read(tmp_path, monkeypatch):
+    import pandas as pd
+
+    text = PDB_TEXT.replace("GLU VAL\n", "GLU UNK\n", 1)
+    path = tmp_path / "1ABC.pdb"
+    path.write_text(text)
+    opened = []
+    open_pdb = pdb_parser.open_pdb
+
+    def counting_open(pdb_file):
+        opened.append(pdb_file)
+        return open_pdb(pdb_file)
+
+    monkeypatch.setattr(pdb_parser, "open_pdb", counting_open)
+    seq = pdb_parser.get_sequence(
+        "1ABC", path, ["A"], pd.DataFrame(columns=["Start", "Stop", "name"])
+    )
+    assert seq.loc["1ABC_A"].sequence == "MAEPRQEFE"
+    assert len(opened) == 1
@@ -0,0 +1,183 @@
+import os
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "targetDB"))
+from utils import build_context as bctx
+from utils import pocket_cache as pcache
+from utils import pocket_finder as pocket
+
+FAKE_FPOCKET = """#!{python}
+import pathlib
+import sys
+import time
+
+pdb = pathlib.Path(sys.argv[2])
+with open(pathlib.Path(sys.argv[0]).with_name("calls.txt"), "a") as calls:
+    calls.write(pdb.name + "\\n")
+if "9SLO" in pdb.name:
+    (pdb.parent / (pdb.stem + "_out") / "pockets").mkdir(parents=True)
+    time.sleep(30)
+out = pdb.parent / (pdb.stem + "_out")
+ATOM = "ATOM      1  CA  MET A %3d      11.639   6.071  -5.147  1.00  0.00           C\\nEND\\n"
+(out / "pockets").mkdir(parents=True, exist_ok=True)
+info = ""
+for n in (1, 2):
+    info += "Pocket %d :\\n" % n
+    info += "\\tScore : \\t0.%d\\n" % n
+    info += "\\tDruggability Score : \\t0.%d%d\\n" % (n + 4, len(pdb.name))
+    info += "\\tVolume : \\t%d\\n" % (200 * n)
+    info += "\\tTotal SASA : \\t100\\n\\tPolar SASA : \\t40\\n\\tApolar SASA : \\t60\\n\\n"
+    (out / "pockets" / ("pocket%d_atm.pdb" % n)).write_text(ATOM % n)
+(out / (pdb.stem + "_info.txt")).write_text(info)
+"""
+
+PDB_TEXT = """REMARK 350 BIOMOLECULE: 1
+REMARK 350 APPLY THE FOLLOWING TO CHAINS: A
+ATOM      1  N   MET A   1      11.104   6.134  -6.504  1.00  0.00           N
+ATOM      2  CA  MET A   1      11.639   6.071  -5.147  1.00  0.00           C
+END
+"""
+
+
+def pdb_text(x):
+    """PDB_TEXT with the x coordinate of the first atom set to ``x``."""
+    return PDB_TEXT.replace("11.104", "%6.3f" % x)
+
+
+def fpocket_calls(tmp_path):
+    calls = tmp_path / "calls.txt"
+    return calls.read_text().split() if calls.is_file() else []
+
+
+@pytest.fixture
+def structures(tmp_path, monkeypatch):
+    # The worker processes find the pocket cache from HOME
+    monkeypatch.setenv("HOME", str(tmp_path / "home"))
+    monkeypatch.setattr(
+        pcache, "CACHE_PATH", tmp_path / "home" / ".targetdb/cache/pockets.sqlite"
+    )
+    fpocket = tmp_path / "fpocket"
+    fpocket.write_text(FAKE_FPOCKET.format(python=sys.executable))
+    fpocket.chmod(0o755)
+    pdb_dir = tmp_path / "DB_files" / "PDB"
+    pdb_dir.mkdir(parents=True)
+    rows = []
+    for i, code in enumerate(("1AAA", "2BBB", "3CCC", "4DDD")):
+        (pdb_dir / (code + ".pdb")).write_text(pdb_text(11 + i))
+        rows.append(
+            {
+                "PDB_code": code,
+                "chain_letter": "A",
+                "path": str(pdb_dir / (code + ".pdb")),
+            }
+        )
+    return tmp_path / "DB_files", pd.DataFrame(rows), str(fpocket)
+
+
+def pockets_of(path, alternate_pdb, fpocket, **kwargs):
+    return pocket.get_pockets(
+        path,
+        alternate=True,
+        alternate_pdb=alternate_pdb,
+        uniprot_id="P10636",
+        fpocket_exe=fpocket,
+        **kwargs,
+    )
+
+
+@pytest.mark.skipif(os.name == "nt", reason="no pocket search on Windows")
+def test_parallel_pockets_match_sequential(structures, tmp_path):
+    path, alternate_pdb, fpocket = structures
+    parallel = pockets_of(path, alternate_pdb, fpocket, max_workers=3)
+    assert list(parallel["pockets"].PDB_code) == [
+        code for code in ("1AAA", "2BBB", "3CCC", "4DDD") for _ in (1, 2)
+    ]
+    assert list(parallel["pockets"].druggable) == ["FALSE", "TRUE"] * 4
+
+    # Second run reads the fpocket outputs already there, in a single process
+    sequential = pockets_of(path, alternate_pdb, fpocket, max_workers=1)
+    pd.testing.assert_frame_equal(parallel["pockets"], sequential["pockets"])
+
+
+@pytest.mark.skipif(os.name == "nt", reason="no pocket search on Windows")
+def test_fpocket_timeout(structures):
+    path, alternate_pdb, fpocket = structures
+    slow = path / "PDB" / "9SLO.pdb"
+    slow.write_text(pdb_text(19))
+    alternate_pdb = pd.concat(
+        [
+            alternate_pdb,
+            pd.DataFrame(
+                [{"PDB_code": "9SLO", "chain_letter": "A", "path": str(slow)}]
+            ),
+        ],
+        ignore_index=True,
+    )
+    context = bctx.BuildContext("t.db", "c.db", num_core=2, fpocket_timeout=2)
+    start = time.monotonic()
+    try:
+        result = pockets_of(path, alternate_pdb, fpocket, context=context)
+    finally:
+        context.close()
+    assert time.monotonic() - start < 25
+    assert sorted(set(result["pockets"].PDB_code)) == ["1AAA", "2BBB", "3CCC", "4DDD"]
+    # The partial output of the stopped run is removed
+    assert not (path / "POCKETS" / "9SLO_BIO1_out").exists()
+    assert context.scheduler.free == 2
+
+
+@pytest.mark.skipif(os.name == "nt", reason="no pocket search on Windows")
+def test_pockets_cached_by_content(structures, tmp_path):
+    path, alternate_pdb, fpocket = structures
+    first = pockets_of(path, alternate_pdb, fpocket)
+    assert len(fpocket_calls(tmp_path)) == 4
+
+    # Same structure under another code and in another build directory
+    copy = path / "PDB" / "5EEE.pdb"
+    copy.write_text(pdb_text(11))
+    other = tmp_path / "other"
+    result = pockets_of(
+        other,
+        pd.DataFrame([{"PDB_code": "5EEE", "chain_letter": "A", "path": str(copy)}]),
+        fpocket,
+    )
+    assert len(fpocket_calls(tmp_path)) == 4
+    assert not (other / "POCKETS" / "5EEE_BIO1_out").exists()
+    assert list(result["pockets"].Pocket_id) == ["P10636_5EEE_p1", "P10636_5EEE_p2"]
+    cached = result["pockets"].drop(columns=["PDB_code", "Pocket_id"])
+    original = first["pockets"].iloc[:2].drop(columns=["PDB_code", "Pocket_id"])
+    assert cached.values.tolist() == original.values.tolist()
+
+
+@pytest.mark.skipif(os.name == "nt", reason="no pocket search on Windows")
+def test_changed_structure_reruns_fpocket(structures, tmp_path):
+    path, alternate_pdb, fpocket = structures
+    pockets_of(path, alternate_pdb, fpocket)
+    (path / "PDB" / "1AAA.pdb").write_text(pdb_text(21))
+    pockets_of(path, alternate_pdb, fpocket)
+    # The output of the former 1AAA structure is stale, the others are cached
+    assert fpocket_calls(tmp_path)[4:] == ["1AAA_BIO1.pdb"]
+
+
+def test_contacts_given_skip_pocket_file(tmp_path):
+    domain = pd.DataFrame(
+        [{"name": "Dom", "Start": 1, "Stop": 10, "length": 10, "domain_id": "D1"}]
+    )
+    pdb_info = pd.Series({"Chain": ["A"], "length": 100})
+    p = pocket.Pockets(
+        {"druggability_score": "0.7", "volume": "300"},
+        "1AAA",
+        "p1",
+        str(tmp_path / "missing"),
+        pdb_info,
+        domain,
+        contacts={"A": ["2", "3"], "B": ["4"]},
+    )
+    assert p.chain_coverage == {"A": ["2", "3"], "B": ["4"]}
+    assert p.part_of_domain == [{"domain": "Dom", "coverage": 20.0, "domain_id": "D1"}]
+    assert p.druggable == "TRUE"
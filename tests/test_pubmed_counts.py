@@ -0,0 +1,96 @@
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "targetDB"))
+from utils import pubmed_counts as pmc
+
+
+@pytest.fixture
+def fetched(tmp_path, monkeypatch):
+    monkeypatch.setattr(pmc, "CACHE_PATH", tmp_path / "pubmed_counts.sqlite")
+    calls = []
+
+    def fake_fetch_count(session, limiter, term, email, api_key):
+        calls.append((term, api_key))
+        return 0 if term == "missing" else len(term)
+
+    monkeypatch.setattr(pmc, "_fetch_count", fake_fetch_count)
+    return calls
+
+
+def test_get_counts_terms(fetched):
+    counts = pmc.get_counts(
+        ["APP", "MAPT"], "email@example.com", mesh_terms=(None, "Dementia")
+    )
+    assert counts == {
+        ("APP", None): 3,
+        ("APP", "Dementia"): len('"Dementia"[Mesh] AND APP'),
+        ("MAPT", None): 4,
+        ("MAPT", "Dementia"): len('"Dementia"[Mesh] AND MAPT'),
+    }
+    assert len(fetched) == 4
+
+
+def test_get_counts_uses_cache(fetched):
+    pmc.get_counts(["APP", "missing"], "email@example.com")
+    assert len(fetched) == 2
+    counts = pmc.get_counts(["APP", "missing", "MAPT"], "email@example.com")
+    assert counts == {("APP", None): 3, ("missing", None): 0, ("MAPT", None): 4}
+    assert [term for term, _ in fetched[2:]] == ["MAPT"]
+
+
+def test_get_counts_refetches_expired(fetched):
+    pmc.get_counts(["APP"], "email@example.com")
+    time.sleep(0.01)
+    pmc.get_counts(["APP"], "email@example.com", ttl=0)
+    assert len(fetched) == 2
+
+
+def test_failed_counts_are_not_cached(fetched, monkeypatch):
+    monkeypatch.setattr(pmc, "_fetch_count", lambda *args: None)
+    assert pmc.get_counts(["APP"], "email@example.com") == {("APP", None): None}
+    assert pmc._read_cache(["APP"], pmc.CACHE_TTL) == {}
+
+
+class FakeResponse:
+    def __init__(self, status, count=None):
+        self.status = status
+        self.count = count
+
+    def raise_for_status(self):
+        if self.status != 200:
+            raise pmc.requests.exceptions.HTTPError(str(self.status))
+
+    def json(self):
+        return {"esearchresult": {"count": str(self.count)}}
+
+
+class FakeSession:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.params = []
+
+    def get(self, url, params=None, timeout=None):
+        self.params.append(params)
+        return self.responses.pop(0)
+
+
+def test_fetch_count_retries(monkeypatch):
+    monkeypatch.setattr(pmc.time, "sleep", lambda seconds: None)
+    session = FakeSession([FakeResponse(429), FakeResponse(200, 42)])
+    count = pmc._fetch_count(session, pmc.RateLimiter(1000), "APP", "e@x.org", "KEY")
+    assert count == 42
+    assert len(session.params) == 2
+    assert session.params[0]["api_key"] == "KEY"
+    assert session.params[0]["rettype"] == "count"
+
+
+def test_rate_limiter_spacing():
+    limiter = pmc.RateLimiter(50)
+    start = time.monotonic()
+    for _ in range(6):
+        limiter.wait()
+    assert time.monotonic() - start >= 5 / 50
@@ -1,5 +1,7 @@
 import sqlite3
+from concurrent.futures import Future
 import pandas as pd
+import pytest
 
 import sys
 from pathlib import Path
@@ -49,7 +51,9 @@ def test_run_predictions_minimal_db(monkeypatch, tmp_path):
     # Capture mode passed to target_scores to ensure programmatic operation
     mode_used = {}
 
-    def dummy_get_descriptors_list(target_id, targetdb=None):
+    def dummy_get_descriptors_list(target_id, targetdb=None, use_cache=True):
+        # Bulk scoring must not fill the descriptor cache
+        assert use_cache is False
         return pd.DataFrame({"Target_id": [target_id]})
 
     class DummyScore:
@@ -76,3 +80,277 @@ def test_run_predictions_minimal_db(monkeypatch, tmp_path):
     assert result.loc[0, "Tractable"] == "Tractable"
     assert result.loc[0, "Tractability_probability"] == 80.0
     assert mode_used["mode"] == "programmatic"
+
+
+def test_run_predictions_chunks_targets(monkeypatch, tmp_path):
+    db_path = tmp_path / "temp.db"
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE Targets (Target_id TEXT, Gene_name TEXT)")
+    conn.executemany(
+        "INSERT INTO Targets (Target_id, Gene_name) VALUES (?, ?)",
+        [("T1", "GeneA"), ("T2", "GeneB"), ("T3", "GeneC")],
+    )
+    conn.commit()
+    conn.close()
+
+    class DummyExecutor:
+        def __init__(self, max_workers=None, initializer=None, initargs=()):
+            if initializer:
+                initializer(*initargs)
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, exc_type, exc, tb):
+            return False
+
+        def map(self, func, iterable):
+            for item in iterable:
+                yield func(item)
+
+    class DummyModel:
+        classes_ = [0, 1]
+
+    monkeypatch.setattr(pat, "ProcessPoolExecutor", DummyExecutor)
+    monkeypatch.setattr(pat.dml, "generate_model", lambda: DummyModel())
+    monkeypatch.setattr(
+        pat.dml,
+        "predict_prob",
+        lambda model, comps: [[0.0, v] for v in comps["feat"]],
+    )
+    monkeypatch.setattr(pat.dml, "in_training_set", lambda comps: ["No"] * len(comps))
+
+    calls = []
+
+    def dummy_get_descriptors_list(target_id, targetdb=None, use_cache=True):
+        ids = target_id.split("','")
+        calls.append(ids)
+        return pd.DataFrame({"Target_id": ids})
+
+    class DummyScore:
+        def __init__(self, data):
+            self.scores = data[["Target_id"]].copy()
+            self.score_components = pd.DataFrame(
+                {"feat": [int(t[1:]) / 10 for t in data["Target_id"]]}
+            )
+
+    monkeypatch.setattr(pat.td, "get_descriptors_list", dummy_get_descriptors_list)
+    monkeypatch.setattr(
+        pat.td, "target_scores", lambda data, mode="list": DummyScore(data)
+    )
+
+    result = pat.run_predictions(str(db_path), workers=1, chunk_size=2)
+
+    assert calls == [["T1", "T2"], ["T3"]]
+    assert list(result["Target_id"]) == ["T1", "T2", "T3"]
+    assert list(result["Gene_name"]) == ["GeneA", "GeneB", "GeneC"]
+    assert list(result["Tractability_probability"]) == [10.0, 20.0, 30.0]
+
+
+def _patch_streamed_scoring(monkeypatch, submitted, fail_on=None):
+    # Sequential executor with futures and dummy model/descriptors; scoring a
+    # chunk holding the target ``fail_on`` raises to simulate a crash
+    class DummyExecutor:
+        def __init__(self, max_workers=None, initializer=None, initargs=()):
+            if initializer:
+                initializer(*initargs)
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, exc_type, exc, tb):
+            return False
+
+        def submit(self, func, item):
+            submitted.append(item)
+            future = Future()
+            if fail_on in item:
+                future.set_exception(RuntimeError("scoring failed"))
+            else:
+                future.set_result(func(item))
+            return future
+
+    class DummyModel:
+        classes_ = [0, 1]
+
+    class DummyScore:
+        def __init__(self, data):
+            self.scores = data[["Target_id"]].copy()
+            self.score_components = pd.DataFrame(
+                {"feat": [int(t[1:]) / 10 for t in data["Target_id"]]}
+            )
+
+    monkeypatch.setattr(pat, "ProcessPoolExecutor", DummyExecutor)
+    monkeypatch.setattr(pat.dml, "generate_model", lambda: DummyModel())
+    monkeypatch.setattr(
+        pat.dml,
+        "predict_prob",
+        lambda model, comps: [[0.0, v] for v in comps["feat"]],
+    )
+    monkeypatch.setattr(pat.dml, "in_training_set", lambda comps: ["No"] * len(comps))
+    monkeypatch.setattr(
+        pat.td,
+        "get_descriptors_list",
+        lambda target_id, targetdb=None, use_cache=True: pd.DataFrame(
+            {"Target_id": target_id.split("','")}
+        ),
+    )
+    monkeypatch.setattr(
+        pat.td, "target_scores", lambda data, mode="list": DummyScore(data)
+    )
+
+
+def test_stream_predictions_writes_chunks(monkeypatch, tmp_path):
+    db_path = tmp_path / "temp.db"
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE Targets (Target_id TEXT, Gene_name TEXT)")
+    conn.executemany(
+        "INSERT INTO Targets (Target_id, Gene_name) VALUES (?, ?)",
+        [("T%d" % i, "Gene%d" % i) for i in range(1, 8)],
+    )
+    conn.commit()
+    conn.close()
+
+    submitted = []
+    _patch_streamed_scoring(monkeypatch, submitted)
+
+    written = []
+    for chunk in pat.iter_predictions(
+        str(db_path), workers=1, chunk_size=3, max_in_flight=1
+    ):
+        # the chunk being consumed plus at most max_in_flight submitted ones
+        assert len(submitted) - len(written) <= 2
+        written.append(chunk)
+    assert [list(c.Target_id) for c in written] == [
+        ["T1", "T2", "T3"],
+        ["T4", "T5", "T6"],
+        ["T7"],
+    ]
+
+    output = tmp_path / "scores.csv"
+    assert (
+        pat.stream_predictions(str(db_path), str(output), workers=1, chunk_size=3) == 7
+    )
+    # rows are written in completion order
+    result = pd.read_csv(output).sort_values("Target_id")
+    assert list(result["Target_id"]) == ["T%d" % i for i in range(1, 8)]
+    assert list(result["Gene_name"]) == ["Gene%d" % i for i in range(1, 8)]
+    assert list(result["Tractability_probability"]) == [
+        float(i * 10) for i in range(1, 8)
+    ]
+
+
+def test_stream_predictions_resume_and_since(monkeypatch, tmp_path):
+    db_path = tmp_path / "temp.db"
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "CREATE TABLE Targets (Target_id TEXT, Gene_name TEXT, Date_modified TEXT)"
+    )
+    conn.executemany(
+        "INSERT INTO Targets VALUES (?, ?, '2020-01-01 00:00:00')",
+        [("T%d" % i, "Gene%d" % i) for i in range(1, 8)],
+    )
+    conn.commit()
+    conn.close()
+    output = tmp_path / "scores.csv"
+
+    submitted = []
+    _patch_streamed_scoring(monkeypatch, submitted, fail_on="T7")
+    with pytest.raises(RuntimeError):
+        pat.stream_predictions(
+            str(db_path), str(output), workers=1, chunk_size=3, max_in_flight=1
+        )
+    assert len(pd.read_csv(output)) == 6
+
+    submitted = []
+    _patch_streamed_scoring(monkeypatch, submitted)
+    n = pat.stream_predictions(str(db_path), str(output), chunk_size=3, resume=True)
+    assert n == 1
+    assert submitted == [["T7"]]
+    result = pd.read_csv(output).sort_values("Target_id")
+    assert list(result["Target_id"]) == ["T%d" % i for i in range(1, 8)]
+
+    # Only the targets modified after the last completed run are rescored
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "UPDATE Targets SET Date_modified='2999-01-01 00:00:00' WHERE Target_id='T2'"
+    )
+    conn.commit()
+    conn.close()
+    submitted = []
+    _patch_streamed_scoring(monkeypatch, submitted)
+    assert pat.stream_predictions(str(db_path), str(output), since="last") == 1
+    assert submitted == [["T2"]]
+    result = pd.read_csv(output).sort_values("Target_id")
+    assert list(result["Target_id"]) == ["T%d" % i for i in range(1, 8)]
+
+
+def test_since_last_without_completed_run(tmp_path):
+    db_path = tmp_path / "temp.db"
+    sqlite3.connect(db_path).close()
+    output = tmp_path / "scores.csv"
+    output.write_text("Target_id,Tractability_probability\nT1,10.0\n")
+    with pytest.raises(ValueError, match="No completed run"):
+        pat.stream_predictions(str(db_path), str(output), since="last")
+    # the existing output is left as it was
+    assert output.read_text() == "Target_id,Tractability_probability\nT1,10.0\n"
+
+
+def test_compact_csv_keeps_last_rows(tmp_path):
+    output = tmp_path / "scores.csv"
+    output.write_text(
+        "Target_id,Gene_name,Tractability_probability\n"
+        "T1,Gene1,10.0\nT2,,20.50\nT3,Gene3,30.0\nT1,Gene1,11.0\nT4,Gene4,\n"
+        "T3,Gene3,33.0\n"
+    )
+    pat._compact_csv(output, chunk_size=2)
+    # rows are copied unchanged (empty values, number formats)
+    assert output.read_text() == (
+        "Target_id,Gene_name,Tractability_probability\n"
+        "T2,,20.50\nT1,Gene1,11.0\nT4,Gene4,\nT3,Gene3,33.0\n"
+    )
+
+
+def test_resume_after_interrupted_write(monkeypatch, tmp_path):
+    db_path = tmp_path / "temp.db"
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "CREATE TABLE Targets (Target_id TEXT, Gene_name TEXT, Date_modified TEXT)"
+    )
+    conn.executemany(
+        "INSERT INTO Targets VALUES (?, ?, '2020-01-01 00:00:00')",
+        [("T%d" % i, "Gene%d" % i) for i in range(1, 5)],
+    )
+    conn.commit()
+    conn.close()
+    output = tmp_path / "scores.csv"
+
+    _patch_streamed_scoring(monkeypatch, [], fail_on="T3")
+    with pytest.raises(RuntimeError):
+        pat.stream_predictions(
+            str(db_path), str(output), workers=1, chunk_size=2, max_in_flight=1
+        )
+    # The process died while writing the next chunk: its last row is cut
+    with open(output, "a") as handle:
+        handle.write("T3,Gene3,3")
+
+    submitted = []
+    _patch_streamed_scoring(monkeypatch, submitted)
+    assert pat.stream_predictions(str(db_path), str(output), resume=True) == 2
+    lines = output.read_text().splitlines()
+    assert "T3,Gene3,3" not in lines
+    result = pd.read_csv(output).sort_values("Target_id")
+    assert list(result["Target_id"]) == ["T1", "T2", "T3", "T4"]
+    assert list(result["Tractability_probability"]) == [10.0, 20.0, 30.0, 40.0]
+
+
+def test_truncate_partial_line(tmp_path):
+    path = tmp_path / "scores.csv"
+    path.write_bytes(b"Target_id,x\nT1,1\nT2,")
+    pat._truncate_partial_line(path, block_size=4)
+    assert path.read_bytes() == b"Target_id,x\nT1,1\n"
+    pat._truncate_partial_line(path, block_size=4)
+    assert path.read_bytes() == b"Target_id,x\nT1,1\n"
+    path.write_bytes(b"Target_i")
+    pat._truncate_partial_line(path)
+    assert path.read_bytes() == b""
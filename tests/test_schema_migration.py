@@ -0,0 +1,111 @@
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "targetDB"))
+import target_descriptors as td
+from utils import ligand_selectivity as lsel
+from utils import sqlite_pool as sqlp
+from utils import targetDB_init as tinit
+
+
+def _indexes(conn):
+    return {
+        row[0]
+        for row in conn.execute("SELECT name FROM sqlite_master WHERE type='index'")
+    }
+
+
+def test_migrate_db_upgrades_to_latest(targetdb_path):
+    conn = sqlite3.connect(targetdb_path)
+    assert tinit.get_schema_version(conn) == 0
+    conn.close()
+
+    assert tinit.migrate_db(targetdb_path, verbose=False) == tinit.SCHEMA_VERSION
+
+    conn = sqlite3.connect(targetdb_path)
+    assert tinit.get_schema_version(conn) == tinit.SCHEMA_VERSION
+    assert "idx_fPockets_Target_id_druggable_blast_pockets" in _indexes(conn)
+    assert "idx_fPockets_Target_id_druggable_blast" not in _indexes(conn)
+    assert "idx_bioactivities_lig_id_Target_id_binding" in _indexes(conn)
+    assert conn.execute(
+        "SELECT name FROM sqlite_master WHERE name='sqlite_stat1'"
+    ).fetchone()
+    conn.close()
+
+
+def test_migrate_db_is_idempotent(targetdb_path, capsys):
+    tinit.migrate_db(targetdb_path, verbose=False)
+    assert tinit.migrate_db(targetdb_path) == tinit.SCHEMA_VERSION
+    assert "already at version" in capsys.readouterr().out
+
+
+def test_migrate_db_missing_file(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        tinit.migrate_db(tmp_path / "missing.db")
+
+
+def _query_plans(conn, queries):
+    """EXPLAIN QUERY PLAN of each (query, params) as a single string."""
+    return [
+        " ".join(row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + query, params))
+        for query, params in queries
+    ]
+
+
+def _captured_queries(monkeypatch, module, run):
+    """(query, params) of the pd.read_sql calls made by ``run``."""
+    queries = []
+    read_sql = module.pd.read_sql
+
+    def capture(sql, con=None, params=None, **kwargs):
+        queries.append((sql, params or {}))
+        return read_sql(sql, con=con, params=params, **kwargs)
+
+    monkeypatch.setattr(module.pd, "read_sql", capture)
+    run()
+    monkeypatch.undo()
+    return queries
+
+
+def test_covering_indexes_are_used(targetdb_path, monkeypatch):
+    # Enough rows of other targets/ligands for the planner statistics of a
+    # real database (a scan is cheaper than any index on a few rows)
+    conn = sqlite3.connect(targetdb_path)
+    conn.executemany(
+        "INSERT INTO fPockets (PDB_code, Target_id, Pocket_number, Pocket_id, "
+        "druggable, blast) VALUES ('9XXX', ?, 1, ?, 'FALSE', 'TRUE')",
+        [("X%d" % i, "PX%d" % i) for i in range(2000)],
+    )
+    conn.executemany(
+        "INSERT INTO bioactivities (lig_id, Target_id, assay_id, operator, "
+        "standard_type) VALUES (?, 'CHEMBLX', 'A1', '=', 'Ki')",
+        [("LX%d" % i,) for i in range(2000)],
+    )
+    conn.commit()
+    conn.close()
+    tinit.migrate_db(targetdb_path, verbose=False)
+    conn = sqlite3.connect(targetdb_path)
+    sqlp.register_functions(conn)
+
+    # Pocket queries of the descriptors, as run by compute_descriptors_list
+    queries = _captured_queries(
+        monkeypatch,
+        td,
+        lambda: td.compute_descriptors_list(["T1", "T2"], targetdb=targetdb_path),
+    )
+    pockets = [q for q in queries if "FROM fPockets F" in q[0]]
+    assert len(pockets) == 2
+    for plan in _query_plans(conn, pockets):
+        assert "COVERING INDEX idx_fPockets_Target_id_druggable_blast_pockets" in plan
+
+    # Binding affinities of the ligand selectivity
+    queries = _captured_queries(
+        monkeypatch, lsel, lambda: lsel.binding_affinities(conn, ["L1", "L2"])
+    )
+    assert len(queries) == 1
+    for plan in _query_plans(conn, queries):
+        assert "COVERING INDEX idx_bioactivities_lig_id_Target_id_binding" in plan
+    conn.close()
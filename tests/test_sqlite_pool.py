@@ -0,0 +1,87 @@
+import sqlite3
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "targetDB"))
+from utils import sqlite_pool as sqlp
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = tmp_path / "targetdb.db"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE Targets (Target_id TEXT, Gene_name TEXT)")
+    conn.executemany(
+        "INSERT INTO Targets VALUES (?, ?)", [("T1", "GENE1"), ("T2", "GENE2")]
+    )
+    conn.commit()
+    conn.close()
+    yield path
+    sqlp.close_all()
+
+
+def test_connect_is_cached_per_thread(db_path):
+    conn = sqlp.connect(db_path)
+    assert sqlp.connect(str(db_path)) is conn
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(sqlp.connect(db_path)))
+    thread.start()
+    thread.join()
+    assert other[0] is not conn
+
+
+def test_connection_is_read_only_with_stddev(db_path):
+    conn = sqlp.connect(db_path)
+    assert conn.execute("SELECT count(*) FROM Targets").fetchone() == (2,)
+    stddev = conn.execute("SELECT stddev(length(Gene_name)) FROM Targets")
+    assert stddev.fetchone()[0] == pytest.approx(0.0)
+    with pytest.raises(sqlite3.OperationalError):
+        conn.execute("INSERT INTO Targets VALUES ('T3','GENE3')")
+
+
+def test_connect_missing_file(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        sqlp.connect(tmp_path / "missing.db")
+
+
+def test_ids_param_matches_long_lists(db_path):
+    conn = sqlp.connect(db_path)
+    # Far more ids than SQLite accepts as bound variables
+    ids = ["T%d" % i for i in range(50000)]
+    rows = conn.execute(
+        "SELECT Target_id FROM Targets "
+        "WHERE Target_id IN (SELECT value FROM json_each(:ids)) ORDER BY Target_id",
+        {"ids": sqlp.ids_param(ids)},
+    ).fetchall()
+    assert rows == [("T1",), ("T2",)]
+
+
+def test_as_id_list():
+    assert sqlp.as_id_list("P1") == ["P1"]
+    assert sqlp.as_id_list("P1','P2") == ["P1", "P2"]
+    assert sqlp.as_id_list(("P1", "P2")) == ["P1", "P2"]
+
+
+def test_stddev_sql_matches_stdevfunc():
+    conn = sqlite3.connect(":memory:")
+    sqlp.register_functions(conn)
+    conn.execute("CREATE TABLE t (g TEXT, x)")
+    rows = [("empty", None), ("one", 4.2), ("ints", 1), ("ints", 2), ("ints", 4)]
+    rows += [("floats", v) for v in [0.31, 12.5, -3.75, 8.0, None, 1e-3, 250.125]]
+    rows += [("same", 7.7)] * 5
+    conn.executemany("INSERT INTO t VALUES (?, ?)", rows)
+
+    native = dict(
+        conn.execute("SELECT g, %s FROM t GROUP BY g" % sqlp.stddev_sql("x")).fetchall()
+    )
+    welford = dict(conn.execute("SELECT g, stddev(x) FROM t GROUP BY g").fetchall())
+    assert native.keys() == welford.keys()
+    assert native["empty"] is None and welford["empty"] is None
+    assert native["one"] == welford["one"] == 0
+    for group in ["ints", "floats", "same"]:
+        assert native[group] == pytest.approx(welford[group], abs=1e-9)
+    conn.close()
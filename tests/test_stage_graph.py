@@ -0,0 +1,98 @@
+import contextvars
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "targetDB"))
+from utils import stage_graph as sg
+
+
+def test_independent_stages_overlap():
+    graph = sg.StageGraph()
+    for name in ["uniprot", "humanmine", "proteinatlas", "opentargets"]:
+        graph.add(name, lambda name=name: time.sleep(0.1) or name)
+    start = time.perf_counter()
+    results = graph.run()
+    elapsed = time.perf_counter() - start
+    assert results == {name: name for name in results}
+    assert elapsed < 0.3
+    assert set(graph.timings) == set(results)
+    assert all(seconds >= 0.09 for seconds in graph.timings.values())
+
+
+def test_dependent_stage_starts_when_inputs_ready():
+    events = []
+    slow_done = threading.Event()
+
+    def slow():
+        time.sleep(0.2)
+        slow_done.set()
+        return "slow"
+
+    def dependent(record):
+        events.append(("dependent", slow_done.is_set()))
+        return record + "-crossref"
+
+    graph = sg.StageGraph()
+    graph.add("record", lambda: "record")
+    graph.add("slow", slow)
+    graph.add("crossref", dependent, deps=["record"])
+    graph.add("both", lambda a, b: (a, b), deps=["crossref", "slow"])
+    results = graph.run()
+    assert events == [("dependent", False)]
+    assert results["both"] == ("record-crossref", "slow")
+
+
+def test_missing_input_skips_dependents():
+    called = []
+    graph = sg.StageGraph()
+    graph.add("uniprot", lambda: None)
+    graph.add("crossref", lambda record: called.append(record), deps=["uniprot"])
+    graph.add("domains", lambda crossref: called.append(crossref), deps=["crossref"])
+    graph.add("humanmine", lambda: "data")
+    results = graph.run()
+    assert results == {
+        "uniprot": None,
+        "crossref": None,
+        "domains": None,
+        "humanmine": "data",
+    }
+    assert called == []
+
+
+def test_error_is_raised_and_dependents_not_run():
+    called = []
+    graph = sg.StageGraph()
+    graph.add("uniprot", lambda: 1 / 0)
+    graph.add("crossref", lambda record: called.append(record), deps=["uniprot"])
+    graph.add("humanmine", lambda: called.append("humanmine"))
+    with pytest.raises(ZeroDivisionError):
+        graph.run()
+    assert "humanmine" in called and len(called) == 1
+
+
+def test_unknown_dependency():
+    graph = sg.StageGraph()
+    with pytest.raises(ValueError):
+        graph.add("crossref", lambda record: record, deps=["uniprot"])
+
+
+def test_stages_see_caller_context():
+    var = contextvars.ContextVar("var")
+    var.set("build")
+    graph = sg.StageGraph()
+    graph.add("a", var.get)
+    assert graph.run() == {"a": "build"}
+
+
+def test_mark_times_sequential_steps():
+    graph = sg.StageGraph()
+    graph.add("a", lambda: 1)
+    graph.run()
+    time.sleep(0.05)
+    graph.mark("pdb")
+    assert graph.timings["pdb"] >= 0.04
+    assert graph.summary().startswith("a ")
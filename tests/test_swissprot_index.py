@@ -0,0 +1,140 @@
+import gzip
+import io
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "targetDB"))
+from utils import swissprot_index as spidx
+from utils import uniprot_parse
+
+ENTRY = """ID   {name}               Reviewed;         10 AA.
+AC   {accessions};
+DE   RecName: Full={name};
+GN   Name={gene};
+OS   Homo sapiens (Human).
+SQ   SEQUENCE   10 AA;  1000 MW;  0000000000000000 CRC64;
+     {sequence}
+//
+"""
+
+
+def flat_file(entries):
+    return "".join(
+        ENTRY.format(
+            name=name, accessions="; ".join(accessions), gene=gene, sequence=sequence
+        )
+        for name, accessions, gene, sequence in entries
+    )
+
+
+ENTRIES = [
+    ("TAU_HUMAN", ["P10636", "P18518", "Q14799"], "MAPT", "MAEPRQEFEV"),
+    ("APP_HUMAN", ["P05067", "P08592"], "APP", "MLPGLALLLL"),
+    # P18518 is also a secondary accession of this entry: the primary one wins
+    ("TEST_HUMAN", ["P18518", "Q99999"], "TEST", "MKKKKKKKKK"),
+]
+
+
+@pytest.fixture(params=["dat", "gz"])
+def sprot_file(request, tmp_path):
+    text = flat_file(ENTRIES)
+    if request.param == "gz":
+        path = tmp_path / "uniprot_sprot.dat.gz"
+        with gzip.open(str(path), "wt") as handle:
+            handle.write(text)
+    else:
+        path = tmp_path / "uniprot_sprot.dat"
+        path.write_text(text)
+    return path
+
+
+def test_lookup_by_accession(sprot_file, tmp_path):
+    index = spidx.SwissProtIndex(sprot_file, cache_dir=tmp_path / "cache").open()
+    assert index.get("P10636").sequence == "MAEPRQEFEV"
+    assert index.get("P08592").accessions == ["P05067", "P08592"]
+    assert index.get("Q14799").entry_name == "TAU_HUMAN"
+    assert index.get("P18518").entry_name == "TEST_HUMAN"
+    assert index.get("Q00000") is None
+    assert "Q99999" in index and "Q00000" not in index
+    assert index.get("P1063") is None and index.get("") is None
+    assert len(index) == 6
+    index.close()
+
+
+def test_index_built_once_and_rebuilt_on_change(tmp_path, monkeypatch):
+    path = tmp_path / "uniprot_sprot.dat"
+    path.write_text(flat_file(ENTRIES[:1]))
+    builds = []
+    build_index = spidx.build_index
+
+    def counting_build(dat_path, index_path):
+        builds.append(dat_path)
+        return build_index(dat_path, index_path)
+
+    monkeypatch.setattr(spidx, "build_index", counting_build)
+    spidx.SwissProtIndex(path, cache_dir=tmp_path).open().close()
+    index = spidx.SwissProtIndex(path, cache_dir=tmp_path).open()
+    assert len(builds) == 1
+    assert index.get("P05067") is None
+    index.close()
+
+    path.write_text(flat_file(ENTRIES))
+    index = spidx.SwissProtIndex(path, cache_dir=tmp_path).open()
+    assert len(builds) == 2
+    assert index.get("P05067").sequence == "MLPGLALLLL"
+    index.close()
+
+
+TAU_ENTRY = """ID   TAU_HUMAN               Reviewed;         10 AA.
+AC   P10636; P18518;
+AC   Q14799;
+DE   RecName: Full=Microtubule-associated protein tau;
+GN   Name=MAPT;
+OS   Homo sapiens (Human).
+OX   NCBI_TaxID=9606;
+RN   [1]
+RP   NUCLEOTIDE SEQUENCE.
+RA   Goedert M.;
+RT   "Cloning of tau.";
+RL   EMBO J. 8:393-399(1989).
+CC   -!- FUNCTION: Promotes microtubule
+CC       assembly.
+DR   PDB; 2MZ7; NMR; -; A=1-10.
+DR   ChEMBL; CHEMBL1930; -.
+FT   DOMAIN          2..5
+FT                   /note="Test domain"
+SQ   SEQUENCE   10 AA;  1000 MW;  0000000000000000 CRC64;
+     MAEPRQEFEV
+//
+"""
+
+
+def test_lazy_record_matches_full_parse():
+    full = uniprot_parse.read(io.StringIO(TAU_ENTRY))
+    lazy = uniprot_parse.LazyRecord(TAU_ENTRY)
+    assert lazy.sequence == full.sequence
+    assert "features" not in vars(lazy)
+    for attribute in (
+        "features",
+        "cross_references",
+        "comments",
+        "accessions",
+        "gene_name",
+        "organism",
+        "taxonomy_id",
+        "entry_name",
+        "references",
+        "keywords",
+    ):
+        full_value = getattr(full, attribute)
+        lazy_value = getattr(lazy, attribute)
+        if attribute == "references":
+            assert [vars(ref) for ref in lazy_value] == [
+                vars(ref) for ref in full_value
+            ]
+        else:
+            assert lazy_value == full_value
+    with pytest.raises(AttributeError):
+        lazy.not_an_attribute